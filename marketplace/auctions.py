@@ -0,0 +1,240 @@
+"""
+Module for closing timed auctions when they end.
+
+Auction end times are kept in a hashed timer wheel: scheduling, extending and
+cancelling an auction are O(1), and every tick only looks at the auctions that
+hash to the current slot, so a large number of open auctions costs little CPU
+while nothing ends.
+"""
+import logging
+import math
+import queue
+import threading
+import time
+
+from decouple import config
+
+AUCTION_TICK_SECONDS = config('AUCTION_TICK_SECONDS', default=1.0, cast=float)
+AUCTION_WHEEL_SLOTS = config('AUCTION_WHEEL_SLOTS', default=4096, cast=int)
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    A hashed timer wheel of deadlines.
+
+    Attributes:
+        tick (float): The resolution of the wheel, in seconds.
+        slots (list): Per slot, the key to deadline tick of its timers.
+    """
+
+    def __init__(self, tick=AUCTION_TICK_SECONDS, slots=AUCTION_WHEEL_SLOTS,
+                 start=None):
+        """
+        Initialize an empty wheel.
+
+        Args:
+            tick (float): The resolution of the wheel, in seconds.
+            slots (int): The number of slots, timers further than a full turn
+                stay in their slot until their turn comes.
+            start (float): The current time, now if not given.
+        """
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self._slot_of = {}
+        self._current = int((time.time() if start is None else start) // tick)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def _remove(self, key):
+        """
+        Remove a timer, if scheduled.
+        """
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def schedule(self, key, deadline):
+        """
+        Schedule a timer, replacing the previous timer of the key.
+
+        Args:
+            key (hashable): Identifies the timer.
+            deadline (float): When the timer fires, as a timestamp. Past
+                deadlines fire on the next tick.
+        """
+        with self._lock:
+            self._remove(key)
+            deadline_tick = max(math.ceil(deadline / self.tick), self._current + 1)
+            slot = deadline_tick % len(self.slots)
+            self.slots[slot][key] = deadline_tick
+            self._slot_of[key] = slot
+
+    def cancel(self, key):
+        """
+        Cancel a timer.
+
+        Args:
+            key (hashable): Identifies the timer.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def advance(self, now):
+        """
+        Move the wheel to the given time and take the timers that are due.
+
+        Args:
+            now (float): The current time, as a timestamp.
+
+        Returns:
+            list: The keys of the due timers, earliest deadline first.
+        """
+        with self._lock:
+            target = int(now // self.tick)
+            steps = min(target - self._current, len(self.slots))
+            due = []
+
+            for step in range(1, steps + 1):
+                timers = self.slots[(self._current + step) % len(self.slots)]
+                expired = [(deadline_tick, key)
+                           for key, deadline_tick in timers.items()
+                           if deadline_tick <= target]
+                for _, key in expired:
+                    del timers[key]
+                    del self._slot_of[key]
+                due += expired
+
+            self._current = max(self._current, target)
+
+        return [key for _, key in sorted(due, key=lambda timer: timer[0])]
+
+
+class AuctionScheduler:
+    """
+    Closes auctions at their end time from a background thread.
+
+    Attributes:
+        wheel (TimerWheel): The end times of the open auctions.
+        on_close (callable): Called with the sale ID of every ended auction.
+    """
+
+    def __init__(self, on_close, wheel=None):
+        """
+        Initialize the scheduler, its thread starts with the first auction.
+
+        Args:
+            on_close (callable): Called with the sale ID of every ended auction.
+            wheel (TimerWheel): The wheel to use, a new one if not given.
+        """
+        self.on_close = on_close
+        self.wheel = wheel or TimerWheel()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def schedule(self, sale_id, end_time):
+        """
+        Schedule, or move, the close of an auction.
+
+        Args:
+            sale_id (int): The listing identifier.
+            end_time (float): The end of the auction, as a timestamp.
+        """
+        self.wheel.schedule(sale_id, end_time)
+        self._start()
+
+    def cancel(self, sale_id):
+        """
+        Cancel the close of an auction.
+
+        Args:
+            sale_id (int): The listing identifier.
+        """
+        self.wheel.cancel(sale_id)
+
+    def run_once(self, now=None):
+        """
+        Close the auctions that ended.
+
+        Args:
+            now (float): The current time, now if not given.
+
+        Returns:
+            list: The closed sale IDs.
+        """
+        closed = self.wheel.advance(time.time() if now is None else now)
+        for sale_id in closed:
+            try:
+                self.on_close(sale_id)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Closing auction %s failed", sale_id)
+        return closed
+
+    def _start(self):
+        """
+        Start the scheduler thread if it is not running.
+        """
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="auction-scheduler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.wheel.tick)
+            self.run_once()
+
+
+class BackgroundQueue:
+    """
+    Runs a handler on queued items, one at a time, in a background thread.
+
+    Attributes:
+        handler (callable): Called with every queued item.
+    """
+
+    def __init__(self, handler):
+        """
+        Initialize the queue, its thread starts with the first item.
+
+        Args:
+            handler (callable): Called with every queued item.
+        """
+        self.handler = handler
+        self._items = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def put(self, item):
+        """
+        Queue an item.
+
+        Args:
+            item: The item to handle.
+        """
+        self._items.put(item)
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="background-queue", daemon=True)
+                self._thread.start()
+
+    def join(self):
+        """
+        Wait until every queued item is handled.
+        """
+        self._items.join()
+
+    def _run(self):
+        while True:
+            item = self._items.get()
+            try:
+                self.handler(item)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Handling %s failed", item)
+            finally:
+                self._items.task_done()
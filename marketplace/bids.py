@@ -0,0 +1,136 @@
+"""
+Module for reading the bids of an auction.
+
+Every sale keeps its bids in a ladder ordered by amount, then arrival, so the
+best bids are read from its tail without sorting, next to the arrival history
+and the bids of each bidder. The serialized top bids are cached until the next
+accepted bid.
+"""
+import bisect
+import itertools
+import threading
+
+from .encoding import dumps
+
+
+def public_bid(bid):
+    """
+    Get the publicly readable fields of a bid.
+
+    Args:
+        bid (dict): The bid, as stored in the book.
+
+    Returns:
+        dict: The bid without its signatures.
+    """
+    return {key: value for key, value in bid.items() if not key.endswith("Sig")}
+
+
+class BidLadder:
+    """
+    The bids of one sale, by amount and by arrival.
+
+    Accepted bids only go up, so inserting one is a binary search that lands on
+    the tail, and the best k bids are a slice of it.
+
+    Attributes:
+        history (list): The bids, oldest first.
+        by_bidder (dict): Lowercase bidder address to its bids, oldest first.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty ladder.
+        """
+        self.history = []
+        self.by_bidder = {}
+        self._keys = []
+        self._ranked = []
+        self._top = {}
+        self._version = 0
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.history)
+
+    def add(self, bid):
+        """
+        Insert a bid and drop the cached top bids.
+
+        Args:
+            bid (dict): The bid, as stored in the book.
+        """
+        with self._lock:
+            # Equal amounts rank the earliest bid higher
+            key = (bid["erc20_amount"], -next(self._arrivals))
+            position = bisect.bisect(self._keys, key)
+            self._keys.insert(position, key)
+            self._ranked.insert(position, bid)
+            self.history.append(bid)
+            self.by_bidder.setdefault(bid["bidderAddress"].lower(), []).append(bid)
+            self._version += 1
+            self._top.clear()
+
+    def top(self, n):
+        """
+        Get the best bids.
+
+        Args:
+            n (int): How many bids.
+
+        Returns:
+            list: Up to n bids, highest amount first, earliest first on ties.
+        """
+        if n <= 0:
+            return []
+        with self._lock:
+            return self._ranked[:-n - 1:-1]
+
+    def top_json(self, n):
+        """
+        Get the serialized best bids, cached until the next accepted bid.
+
+        Args:
+            n (int): How many bids.
+
+        Returns:
+            bytes: The JSON body of the top bids response.
+        """
+        cached = self._top.get(n)
+        if cached is None:
+            version = self._version
+            cached = dumps({"bids": [public_bid(bid) for bid in self.top(n)]})
+            with self._lock:
+                # A bid accepted while serializing makes this body stale
+                if version == self._version:
+                    self._top[n] = cached
+        return cached
+
+    def page(self, offset, limit):
+        """
+        Get a page of the history, newest first.
+
+        Args:
+            offset (int): How many of the newest bids to skip.
+            limit (int): The page size.
+
+        Returns:
+            list: The bids of the page.
+        """
+        with self._lock:
+            end = len(self.history) - offset
+            return self.history[max(0, end - limit):max(0, end)][::-1]
+
+    def bids_of(self, bidder_address):
+        """
+        Get the bids of a bidder.
+
+        Args:
+            bidder_address (str): The bidder address, in any case.
+
+        Returns:
+            list: The bidder's bids, oldest first.
+        """
+        with self._lock:
+            return list(self.by_bidder.get(bidder_address.lower(), ()))
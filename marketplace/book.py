@@ -0,0 +1,442 @@
+"""
+This module keeps the indexes of the in-memory order book.
+
+The views append listings and intents to their lists, and register them here so
+they can be found by sale ID or by token without scanning the whole book.
+"""
+
+import bisect
+import threading
+import time
+from datetime import datetime
+
+from decouple import config
+
+from .bids import BidLadder
+from .candles import BIDS, SALES, PriceHistory
+from .stats import StatsBook
+
+# Number of locks shared by the sales, see `sale_lock`
+SALE_LOCK_STRIPES = 1024
+# Seconds a tombstone is kept, see `remove_listing`
+TOMBSTONE_RETENTION = config('TOMBSTONE_RETENTION', default=86400, cast=float)
+
+# Bumped by every change of the book, see `bump_version`
+version = 0
+_version_lock = threading.Lock()
+_signatures_lock = threading.Lock()
+
+# In-memory indexes
+listings_by_id = {}
+purchase_intents_by_sale = {}
+open_sales_by_token = {}
+open_sales_by_collection = {}
+invalidated_by_transfer = {}
+used_signatures = set()
+bids_by_sale = {}
+tombstones = []
+tombstone_times = []
+# Tombstones removed before this time may have been pruned
+tombstones_pruned_before = 0.0
+collection_stats = StatsBook()
+price_history = PriceHistory()
+sale_locks = [threading.Lock() for _ in range(SALE_LOCK_STRIPES)]
+
+
+def bump_version():
+    """
+    Count a change of the book, once it is applied.
+
+    Returns:
+    - int: The new book version.
+    """
+    global version
+
+    with _version_lock:
+        version += 1
+        return version
+
+
+def token_key(nft_collection_address, token_id):
+    """
+    Build the index key of a token.
+
+    Args:
+    - nft_collection_address (str): The collection address, in any case.
+    - token_id (int): The token identifier.
+
+    Returns:
+    - tuple: The lowercase collection address and the token ID.
+    """
+    return nft_collection_address.lower(), int(token_id)
+
+
+def sale_lock(sale_id):
+    """
+    Get the lock guarding the bids, intents and state of a sale.
+
+    Sales are spread over a fixed set of locks, so a busy auction only blocks the
+    few sales sharing its lock and the number of locks stays bounded.
+
+    Args:
+    - sale_id (int): The listing identifier.
+
+    Returns:
+    - Lock: The lock of the sale, not reentrant.
+    """
+    return sale_locks[hash(sale_id) % SALE_LOCK_STRIPES]
+
+
+def index_listing(listing):
+    """
+    Register a new listing as open for its token.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    """
+    listings_by_id[listing["sale_id"]] = listing
+    open_sale(listing)
+
+
+def open_sale(listing):
+    """
+    Add a listing to the open sales of its token and collection.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    """
+    key = token_key(listing["nft_collection_address"], listing["tokenId"])
+    open_sales = open_sales_by_token.setdefault(key, set())
+    if listing["sale_id"] not in open_sales:
+        open_sales.add(listing["sale_id"])
+        open_sales_by_collection[key[0]] = \
+            open_sales_by_collection.get(key[0], 0) + 1
+
+        ladder = bids_by_sale.get(listing["sale_id"])
+        best = ladder.top(1) if ladder else []
+        collection_stats.open(
+            listing,
+            available=listing["sale_id"] not in purchase_intents_by_sale,
+            best_bid=best[0]["erc20_amount"] if best else None)
+
+
+def close_sale(listing):
+    """
+    Remove a listing from the open sales of its token and collection.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    """
+    key = token_key(listing["nft_collection_address"], listing["tokenId"])
+    open_sales = open_sales_by_token.get(key)
+    if open_sales and listing["sale_id"] in open_sales:
+        open_sales.discard(listing["sale_id"])
+        open_sales_by_collection[key[0]] -= 1
+        if not open_sales_by_collection[key[0]]:
+            del open_sales_by_collection[key[0]]
+        collection_stats.close(listing)
+
+
+def open_collections():
+    """
+    Get the collections that have open listings.
+
+    Returns:
+    - list: The lowercase collection addresses.
+    """
+    return list(open_sales_by_collection)
+
+
+def index_purchase_intent(purchase_intent):
+    """
+    Register a purchase intent under its sale ID.
+
+    Args:
+    - purchase_intent (dict): The purchase intent, as stored in the book.
+    """
+    purchase_intents_by_sale[purchase_intent["sale_id"]] = purchase_intent
+    used_signatures.add(signature_key(purchase_intent["buyerSig"]))
+
+    listing = listings_by_id.get(purchase_intent["sale_id"])
+    if listing:
+        collection_stats.take(listing)
+
+
+def release_purchase_intent(purchase_intent):
+    """
+    Unregister the purchase intent holding a sale, returning an open listing to
+    the floor.
+
+    Args:
+    - purchase_intent (dict): The purchase intent, as stored in the book.
+    """
+    sale_id = purchase_intent["sale_id"]
+    if purchase_intents_by_sale.get(sale_id) is purchase_intent:
+        del purchase_intents_by_sale[sale_id]
+
+    listing = listings_by_id.get(sale_id)
+    if listing and sale_id in open_sales_by_token.get(
+            token_key(listing["nft_collection_address"], listing["tokenId"]), ()):
+        collection_stats.close(listing)
+        collection_stats.open(listing)
+
+
+def index_bid(bid_intent):
+    """
+    Register a bid in the bid ladder of its sale.
+
+    Args:
+    - bid_intent (dict): The bid, as stored in the book.
+    """
+    bids_by_sale.setdefault(bid_intent["sale_id"], BidLadder()).add(bid_intent)
+    used_signatures.add(signature_key(bid_intent["bidderSig"]))
+
+    listing = listings_by_id.get(bid_intent["sale_id"])
+    if listing:
+        collection_stats.bid(listing, bid_intent["erc20_amount"])
+        price_history.record(
+            BIDS, listing["nft_collection_address"], listing["erc20Address"],
+            bid_intent["erc20_amount"], time.time())
+
+
+def record_settlement(intent):
+    """
+    Count a settled purchase intent or bid in its collection's volume and price
+    history.
+
+    Args:
+    - intent (dict): The settled intent.
+    """
+    listing = listings_by_id.get(intent["sale_id"])
+    if listing and collection_stats.settle(listing, intent["erc20_amount"]):
+        price_history.record(
+            SALES, listing["nft_collection_address"], listing["erc20Address"],
+            intent["erc20_amount"], time.time())
+
+
+def signature_key(signature):
+    """
+    Normalize a hex signature, so its variants are recognized as the same.
+
+    Args:
+    - signature (str): The hex signature, with or without 0x.
+
+    Returns:
+    - str: The lowercase signature without 0x.
+    """
+    signature = signature.lower()
+    return signature[2:] if signature.startswith("0x") else signature
+
+
+def is_signature_used(signature):
+    """
+    Check if a signature was already used by a stored intent.
+
+    Args:
+    - signature (str): The hex signature.
+
+    Returns:
+    - bool: True if a purchase intent or bid already holds it.
+    """
+    return signature_key(signature) in used_signatures
+
+
+def use_signature(signature):
+    """
+    Mark a signature as used, unless it already was.
+
+    Args:
+    - signature (str): The hex signature.
+
+    Returns:
+    - bool: True if the signature was unused and is now taken.
+    """
+    key = signature_key(signature)
+    with _signatures_lock:
+        if key in used_signatures:
+            return False
+        used_signatures.add(key)
+        return True
+
+
+def is_sale_invalidated(sale_id):
+    """
+    Check if a sale was invalidated by a transfer of its token.
+
+    Args:
+    - sale_id (int): The listing identifier.
+
+    Returns:
+    - bool: True if the listing is known and was invalidated.
+    """
+    listing = listings_by_id.get(sale_id)
+    return bool(listing and listing.get("invalidatedAt"))
+
+
+def transfer_id(transfer):
+    """
+    Build the identifier of a transfer event.
+
+    Args:
+    - transfer (dict): The decoded transfer, with its transactionHash and logIndex.
+
+    Returns:
+    - str: The transaction hash and log index of the event.
+    """
+    return f"{transfer['transactionHash']}:{transfer['logIndex']}"
+
+
+def invalidate_transfer(transfer):
+    """
+    Invalidate the open listings of a token that left its seller.
+
+    Listings whose owner is the new holder stay open. The listing and its
+    purchase intent are marked invalid, bids are invalid through their listing.
+
+    Args:
+    - transfer (dict): The decoded transfer.
+
+    Returns:
+    - list: The invalidated sale IDs.
+    """
+    key = token_key(transfer["collection"], transfer["tokenId"])
+    open_sales = open_sales_by_token.get(key)
+    if not open_sales:
+        return []
+
+    event_id = transfer_id(transfer)
+    invalidated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    invalidated = []
+
+    for sale_id in list(open_sales):
+        listing = listings_by_id[sale_id]
+        if listing["ownerAddress"].lower() == transfer["to"].lower():
+            continue
+
+        listing["invalidatedAt"] = invalidated_at
+        listing["invalidatedBy"] = event_id
+        purchase_intent = purchase_intents_by_sale.get(sale_id)
+        if purchase_intent:
+            purchase_intent["invalidatedAt"] = invalidated_at
+
+        close_sale(listing)
+        invalidated.append(sale_id)
+
+    if invalidated:
+        invalidated_by_transfer[event_id] = invalidated
+    return invalidated
+
+
+def revert_transfer(transfer):
+    """
+    Reopen the listings invalidated by a transfer orphaned by a reorg.
+
+    Args:
+    - transfer (dict): The decoded transfer.
+
+    Returns:
+    - list: The reopened sale IDs.
+    """
+    reopened = invalidated_by_transfer.pop(transfer_id(transfer), [])
+
+    for sale_id in reopened:
+        listing = listings_by_id[sale_id]
+        listing.pop("invalidatedAt", None)
+        listing.pop("invalidatedBy", None)
+        purchase_intent = purchase_intents_by_sale.get(sale_id)
+        if purchase_intent:
+            purchase_intent.pop("invalidatedAt", None)
+
+        open_sale(listing)
+
+    return reopened
+
+
+def remove_listing(listing, reason):
+    """
+    Remove a listing from every index and record its tombstone.
+
+    Its purchase intent, bids and statistics entry are unregistered with it.
+    Tombstones older than TOMBSTONE_RETENTION are pruned.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    - reason (str): Why it is removed, e.g. "cancelled".
+
+    Returns:
+    - dict: The tombstone.
+    """
+    global tombstones_pruned_before
+
+    sale_id = listing["sale_id"]
+    close_sale(listing)
+    collection_stats.forget(listing)
+    listings_by_id.pop(sale_id, None)
+    purchase_intents_by_sale.pop(sale_id, None)
+    bids_by_sale.pop(sale_id, None)
+
+    removed_at = time.time()
+    tombstone = {
+        "sale_id": sale_id,
+        "nft_collection_address": listing["nft_collection_address"],
+        "tokenId": listing["tokenId"],
+        "reason": reason,
+        "removedAt": removed_at,
+    }
+    # Removal times only go up, except for clock steps
+    position = bisect.bisect(tombstone_times, removed_at)
+    tombstone_times.insert(position, removed_at)
+    tombstones.insert(position, tombstone)
+
+    cutoff = removed_at - TOMBSTONE_RETENTION
+    expired = bisect.bisect_left(tombstone_times, cutoff)
+    if expired:
+        del tombstone_times[:expired]
+        del tombstones[:expired]
+        tombstones_pruned_before = max(tombstones_pruned_before, cutoff)
+    return tombstone
+
+
+def removed_since(since):
+    """
+    Get the tombstones of the listings removed after a time.
+
+    Args:
+    - since (float): The time, as a timestamp.
+
+    Returns:
+    - list: The tombstones, oldest first.
+    """
+    return tombstones[bisect.bisect_right(tombstone_times, since):]
+
+
+def reprice_listing(listing, erc20_amount):
+    """
+    Change the price of a fixed-price listing in the collection statistics.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    - erc20_amount (float): The new price.
+    """
+    key = token_key(listing["nft_collection_address"], listing["tokenId"])
+    is_open = listing["sale_id"] in open_sales_by_token.get(key, ())
+    if is_open:
+        collection_stats.close(listing)
+    listing["erc20_amount"] = erc20_amount
+    if is_open:
+        collection_stats.open(
+            listing,
+            available=listing["sale_id"] not in purchase_intents_by_sale)
+
+
+def bid_ladder(sale_id):
+    """
+    Get the bids of a sale.
+
+    Args:
+    - sale_id (int): The listing identifier.
+
+    Returns:
+    - BidLadder: The bids of the sale, empty if it has none.
+    """
+    return bids_by_sale.get(sale_id) or BidLadder()
@@ -0,0 +1,160 @@
+"""
+Module for caching the serialized responses of the read endpoints.
+
+Every change of the order book bumps the book version. A response is cached per
+path and query together with the version it was built at, and served until the
+version moves on, so a poll of an unchanged book neither rebuilds nor
+re-serializes anything. Its ETag is derived from the version, so a client
+sending it back in If-None-Match gets a 304 without a body.
+
+Responses holding Dutch prices, which decline without any change of the book,
+are only cached for a few seconds and get an ETag of their own. Compressed bodies
+are kept next to the response they encode.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+from decouple import config
+
+RESPONSE_CACHE_SIZE = config('RESPONSE_CACHE_SIZE', default=1024, cast=int)
+
+
+class CachedResponse:
+    """
+    A serialized response.
+
+    Attributes:
+        version (int): The book version it was built at.
+        etag (str): Its quoted entity tag.
+        content (bytes): The body.
+        content_type (str): The content type of the body.
+        expires (float): When it stops being served, None to serve it until the
+            book version changes.
+        encoded (dict): Content coding to the compressed body, filled as
+            clients ask for it.
+    """
+
+    __slots__ = ("version", "etag", "content", "content_type", "expires",
+                 "encoded")
+
+    def __init__(self, version, etag, content, content_type, expires):
+        self.version = version
+        self.etag = etag
+        self.content = content
+        self.content_type = content_type
+        self.expires = expires
+        self.encoded = {}
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check if an If-None-Match header holds an entity tag.
+
+    Args:
+        if_none_match (str): The header, may be None.
+        etag (str): The quoted entity tag.
+
+    Returns:
+        bool: True if the header lists the tag, weak or strong, or is "*".
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class ResponseCache:
+    """
+    A bounded cache of serialized responses, the least recently used evicted
+    first.
+
+    Each (path, query) keeps the response of one version, the newest one built.
+
+    Attributes:
+        entries (OrderedDict): (path, query) to its `CachedResponse`, least
+            recently used first.
+        max_entries (int): The most responses kept.
+        hits (int): Requests answered from the cache.
+        misses (int): Requests whose response had to be built.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_entries (int): The most responses kept.
+        """
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._builds = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key, version, now):
+        """
+        Get the cached response of a request, if still current.
+
+        Args:
+            key (tuple): The path and normalized query.
+            version (int): The current book version.
+            now (float): The current time.
+
+        Returns:
+            CachedResponse: The response, or None if it must be built.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.version != version or (
+                    entry.expires is not None and now >= entry.expires):
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, content, content_type, now, seconds=None):
+        """
+        Cache the response built for a request.
+
+        A response built at an older version than the cached one is returned
+        but not kept.
+
+        Args:
+            key (tuple): The path and normalized query.
+            version (int): The book version read before building it.
+            content (bytes): The body.
+            content_type (str): The content type of the body.
+            now (float): The current time.
+            seconds (float): How long it is served, until the version changes
+                if not given.
+
+        Returns:
+            CachedResponse: The cached response.
+        """
+        if seconds is None:
+            entry = CachedResponse(
+                version, f'"{version}"', content, content_type, None)
+        else:
+            entry = CachedResponse(
+                version, f'"{version}-{next(self._builds)}"', content,
+                content_type, now + seconds)
+
+        with self._lock:
+            current = self.entries.get(key)
+            if current is None or current.version <= version:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """
+        Drop every cached response.
+        """
+        with self._lock:
+            self.entries.clear()
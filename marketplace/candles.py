@@ -0,0 +1,192 @@
+"""
+Module for keeping the price history of collections as OHLC candles.
+
+Every settled sale and accepted bid is rolled up on arrival into 1 minute, 1 hour
+and 1 day candles, per collection and ERC20. Each interval is a ring of fixed
+size backed by typed arrays, so memory is bounded by the retention and a chart
+query reads one slot per candle instead of the trades.
+"""
+import threading
+from array import array
+
+from decouple import config
+
+# Interval name to its length in seconds and the candles kept
+INTERVALS = {
+    "1m": (60, config('CANDLES_RETENTION_1M', default=1440, cast=int)),
+    "1h": (3600, config('CANDLES_RETENTION_1H', default=720, cast=int)),
+    "1d": (86400, config('CANDLES_RETENTION_1D', default=730, cast=int)),
+}
+
+# The kinds of trades recorded
+SALES = "sales"
+BIDS = "bids"
+
+
+class CandleSeries:
+    """
+    A ring of fixed-interval OHLC candles.
+
+    Slot i holds the candle starting at bucket b where b % capacity == i, and the
+    bucket it holds is stored with it, so a slot left from an older turn of the
+    ring reads as empty.
+
+    Attributes:
+        interval (int): The candle length, in seconds.
+        capacity (int): The number of candles kept.
+        latest (int): The most recent bucket recorded, -1 if none.
+    """
+
+    def __init__(self, interval, capacity):
+        """
+        Initialize an empty ring.
+
+        Args:
+            interval (int): The candle length, in seconds.
+            capacity (int): The number of candles kept.
+        """
+        self.interval = interval
+        self.capacity = capacity
+        self.latest = -1
+        self.buckets = array('q', [-1]) * capacity
+        self.opens = array('d', [0.0]) * capacity
+        self.highs = array('d', [0.0]) * capacity
+        self.lows = array('d', [0.0]) * capacity
+        self.closes = array('d', [0.0]) * capacity
+        self.volumes = array('d', [0.0]) * capacity
+        self.counts = array('q', [0]) * capacity
+
+    def add(self, timestamp, price, amount=None):
+        """
+        Roll a trade into its candle.
+
+        Args:
+            timestamp (float): When the trade happened.
+            price (float): The price of the trade.
+            amount (float): The traded volume, the price if not given.
+        """
+        bucket = int(timestamp // self.interval)
+        if bucket <= self.latest - self.capacity:
+            # Older than the retention
+            return
+
+        slot = bucket % self.capacity
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            self.opens[slot] = self.highs[slot] = self.lows[slot] = price
+            self.volumes[slot] = 0.0
+            self.counts[slot] = 0
+        else:
+            self.highs[slot] = max(self.highs[slot], price)
+            self.lows[slot] = min(self.lows[slot], price)
+
+        self.closes[slot] = price
+        self.volumes[slot] += price if amount is None else amount
+        self.counts[slot] += 1
+        self.latest = max(self.latest, bucket)
+
+    def query(self, start=None, end=None):
+        """
+        Get the candles of a time range, skipping the intervals without trades.
+
+        Args:
+            start (float): The first time, the oldest kept if not given.
+            end (float): The last time, the latest recorded if not given.
+
+        Returns:
+            dict: Columns of the candles, oldest first: "time" (start of the
+            candle), "open", "high", "low", "close", "volume" and "count".
+        """
+        columns = {name: [] for name in
+                   ("time", "open", "high", "low", "close", "volume", "count")}
+        if self.latest < 0:
+            return columns
+
+        first = self.latest - self.capacity + 1
+        if start is not None:
+            first = max(first, int(start // self.interval))
+        last = self.latest if end is None else min(
+            self.latest, int(end // self.interval))
+
+        for bucket in range(first, last + 1):
+            slot = bucket % self.capacity
+            if self.buckets[slot] != bucket:
+                continue
+            columns["time"].append(bucket * self.interval)
+            columns["open"].append(self.opens[slot])
+            columns["high"].append(self.highs[slot])
+            columns["low"].append(self.lows[slot])
+            columns["close"].append(self.closes[slot])
+            columns["volume"].append(self.volumes[slot])
+            columns["count"].append(self.counts[slot])
+
+        return columns
+
+
+class PriceHistory:
+    """
+    The candles of every collection, ERC20 and kind of trade.
+
+    Attributes:
+        series (dict): (kind, lowercase collection, lowercase ERC20) to interval
+            name to its `CandleSeries`.
+    """
+
+    def __init__(self, intervals=None):
+        """
+        Initialize an empty history.
+
+        Args:
+            intervals (dict): Interval name to its length and retention,
+                INTERVALS if not given.
+        """
+        self.intervals = intervals or INTERVALS
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, nft_collection_address, erc20_address, price,
+               timestamp):
+        """
+        Record a trade in every interval.
+
+        Args:
+            kind (str): SALES or BIDS.
+            nft_collection_address (str): The collection address, in any case.
+            erc20_address (str): The ERC20 address, in any case.
+            price (float): The price of the trade.
+            timestamp (float): When the trade happened.
+        """
+        key = (kind, nft_collection_address.lower(), erc20_address.lower())
+
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    name: CandleSeries(interval, capacity)
+                    for name, (interval, capacity) in self.intervals.items()}
+            for candles in series.values():
+                candles.add(timestamp, price)
+
+    def candles(self, kind, nft_collection_address, erc20_address, interval,
+                start=None, end=None):
+        """
+        Get the candles of a collection.
+
+        Args:
+            kind (str): SALES or BIDS.
+            nft_collection_address (str): The collection address, in any case.
+            erc20_address (str): The ERC20 address, in any case.
+            interval (str): The interval name, e.g. "1h".
+            start (float): The first time, the oldest kept if not given.
+            end (float): The last time, the latest recorded if not given.
+
+        Returns:
+            dict: The candle columns, see `CandleSeries.query`.
+        """
+        key = (kind, nft_collection_address.lower(), erc20_address.lower())
+
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                return CandleSeries(1, 1).query()
+            return series[interval].query(start, end)
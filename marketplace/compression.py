@@ -0,0 +1,93 @@
+"""
+Module for compressing the responses of the read endpoints.
+
+The content coding is negotiated per request from its Accept-Encoding header:
+brotli when the brotli package is installed and the client accepts it, gzip
+otherwise. Bodies under COMPRESSION_MIN_BYTES are sent as they are, their
+compressed size would not pay for the work.
+"""
+import gzip
+
+from decouple import config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSION_MIN_BYTES = config('COMPRESSION_MIN_BYTES', default=1024, cast=int)
+GZIP_LEVEL = config('GZIP_LEVEL', default=6, cast=int)
+BROTLI_QUALITY = config('BROTLI_QUALITY', default=5, cast=int)
+
+BROTLI = "br"
+GZIP = "gzip"
+
+
+def accepted_codings(accept_encoding):
+    """
+    Parse an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The header, may be None.
+
+    Returns:
+        set: The lowercase codings the client accepts, without the ones it
+            refuses with q=0.
+    """
+    codings = set()
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        params = params.strip()
+        quality = 1
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if coding and quality > 0:
+            codings.add(coding)
+    return codings
+
+
+def negotiate(accept_encoding, size, min_bytes=None):
+    """
+    Choose the content coding of a response.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header of the request.
+        size (int): The size of the body, in bytes.
+        min_bytes (int): The smallest body compressed, COMPRESSION_MIN_BYTES if
+            not given.
+
+    Returns:
+        str: "br", "gzip", or None to send the body as it is.
+    """
+    if min_bytes is None:
+        min_bytes = COMPRESSION_MIN_BYTES
+    if size < min_bytes:
+        return None
+
+    codings = accepted_codings(accept_encoding)
+    if brotli is not None and (BROTLI in codings or "*" in codings):
+        return BROTLI
+    if GZIP in codings or "*" in codings:
+        return GZIP
+    return None
+
+
+def compress(content, coding):
+    """
+    Compress a body.
+
+    Args:
+        content (bytes): The body.
+        coding (str): "br" or "gzip".
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if coding == BROTLI:
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the body, and so its ETag, the same for the same content
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
@@ -3,9 +3,12 @@ Module for handling contracts interaction in the marketplace.
 """
 import json
 import os
+import threading
 from decouple import config
 from web3 import Web3
 
+from .events.ownership import get_ownership_index
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -30,12 +33,15 @@ class ERC20Contract:
         data = json.load(f)
         MOCK_ERC20_ABI = json.loads(data['result'])
 
-    def __init__(self):
+    def __init__(self, contract_address=None):
         """
         Initialize an instance of the ERC721Contract class.
         Sets up the web3 instance and the contract.
+
+        Args:
+            contract_address (str): The ERC20 token address, the mock token if not given.
         """
-        self.contract_address = self.MOCK_ERC20_CONTRACT_ADDRESS
+        self.contract_address = contract_address or self.MOCK_ERC20_CONTRACT_ADDRESS
         self.w3 = Web3(Web3.HTTPProvider(self.PROVIDER_URL))
         self.contract = self.w3.eth.contract(
             address=self.contract_address,
@@ -51,6 +57,32 @@ class ERC20Contract:
         """
         return self.contract
 
+    def balance_of(self, address):
+        """
+        Get the token balance of an address.
+
+        Args:
+            address (str): The token holder.
+
+        Returns:
+            int: The balance, in the token's smallest unit.
+        """
+        return self.contract.functions.balanceOf(address).call()
+
+    def allowance(self, owner_address, spender_address):
+        """
+        Get how much a spender may transfer from an owner.
+
+        Args:
+            owner_address (str): The token holder.
+            spender_address (str): The approved spender.
+
+        Returns:
+            int: The allowance, in the token's smallest unit.
+        """
+        return self.contract.functions.allowance(
+            owner_address, spender_address).call()
+
     def mint(self, owner_address, amount):
         """
         Create a minting transaction for the ERC20 contract.
@@ -104,10 +136,18 @@ class ERC721Contract:
         ERC721_ABI_PATH (str): Path to the ABI (Application Binary Interface) of
         the ERC721 contract.
         MOCK_ERC721_ABI (list): Loaded ABI content from the JSON file.
+        OWNERSHIP_INDEX_MAX_LAG (int): The most blocks the ownership index may be
+            behind for `is_token_owner` to answer from it.
+        OWNERSHIP_INDEX_MAX_AGE (int): The most seconds since the indexer last
+            saw the head for `is_token_owner` to answer from it.
     """
 
     PROVIDER_URL = config('PROVIDER_URL')
     MOCK_ERC721_CONTRACT_ADDRESS = config('MOCK_ERC721_CONTRACT_ADDRESS')
+    OWNERSHIP_INDEX_MAX_LAG = config(
+        'OWNERSHIP_INDEX_MAX_LAG', default=2, cast=int)
+    OWNERSHIP_INDEX_MAX_AGE = config(
+        'OWNERSHIP_INDEX_MAX_AGE', default=60, cast=int)
     ERC721_ABI_PATH = os.path.join(
         BASE_DIR, 'contractsABI', 'MOCK_ERC721.json')
 
@@ -115,12 +155,15 @@ class ERC721Contract:
         data = json.load(f)
         MOCK_ERC721_ABI = json.loads(data['result'])
 
-    def __init__(self):
+    def __init__(self, contract_address=None):
         """
         Initialize an instance of the ERC721Contract class.
         Sets up the web3 instance and the contract.
+
+        Args:
+            contract_address (str): The collection address, the mock collection if not given.
         """
-        self.contract_address = self.MOCK_ERC721_CONTRACT_ADDRESS
+        self.contract_address = contract_address or self.MOCK_ERC721_CONTRACT_ADDRESS
         self.w3 = Web3(Web3.HTTPProvider(self.PROVIDER_URL))
         self.contract = self.w3.eth.contract(
             address=self.contract_address,
@@ -143,17 +186,30 @@ class ERC721Contract:
         """
         return self.contract.functions.ownerOf(token_id).call()
 
-    def is_token_owner(self, address, token_id):
+    def is_token_owner(self, address, token_id, max_lag=None):
         """
         Check if the given address is the owner of the specified token ID.
 
+        The local ownership index answers when it indexes the collection and is
+        caught up, otherwise the owner is read with ownerOf.
+
         Args:
             address (str): Ethereum address to check.
             token_id (int): The ID of the token.
+            max_lag (int): The most blocks the index may be behind, the
+                configured OWNERSHIP_INDEX_MAX_LAG if not given.
 
         Returns:
             bool: True if the provided address is the owner, False otherwise.
         """
+        index = get_ownership_index()
+        if max_lag is None:
+            max_lag = self.OWNERSHIP_INDEX_MAX_LAG
+
+        if (index and index.is_indexed(self.contract_address)
+                and index.is_fresh(max_lag, self.OWNERSHIP_INDEX_MAX_AGE)):
+            return index.owner_of(self.contract_address, token_id) == address
+
         return self.get_owner_of_token(token_id) == address
 
     def mint(self, owner_address):
@@ -194,6 +250,32 @@ class ERC721Contract:
         return txn
 
 
+_erc721_contracts = {}
+_erc721_lock = threading.Lock()
+
+
+def get_erc721_contract(contract_address=None):
+    """
+    Get the process-wide ERC721Contract of a collection.
+
+    Building the web3 contract parses its ABI, which costs more than the rest
+    of a listing request, so each collection's contract is built once.
+
+    Args:
+        contract_address (str): The collection address, the mock collection if not given.
+
+    Returns:
+        ERC721Contract: The shared contract.
+    """
+    contract_address = contract_address or ERC721Contract.MOCK_ERC721_CONTRACT_ADDRESS
+    with _erc721_lock:
+        contract = _erc721_contracts.get(contract_address)
+        if contract is None:
+            contract = _erc721_contracts[contract_address] = ERC721Contract(
+                contract_address)
+    return contract
+
+
 class MarketplaceContract:
     """
     A class to interact with the Marketplace smart contract on the Ethereum blockchain.
@@ -226,7 +308,7 @@ class MarketplaceContract:
             abi=self.MARKETPLACE_ABI
         )
 
-    def send_transaction(
+    def build_finish_auction(
             self,
             nft_collection_address,
             token_id,
@@ -234,9 +316,10 @@ class MarketplaceContract:
             erc20_amount,
             bidder_sig,
             owner_approval_sig,
-            owner_address):
+            nonce,
+            gas_price=None):
         """
-        Send a transaction to the Marketplace contract to finish an auction.
+        Build a transaction to the Marketplace contract to finish an auction.
 
         Args:
             nft_collection_address (str): The address of the NFT collection.
@@ -245,7 +328,8 @@ class MarketplaceContract:
             erc20_amount (int): The amount of ERC20 tokens.
             bidder_sig (str): The signature of the bidder.
             owner_approval_sig (str): The signature of the owner's approval.
-            owner_address (str): The address of the owner.
+            nonce (int): The nonce of the sending account.
+            gas_price (int): The gas price in wei, 20 gwei if not given.
 
         Returns:
             dict: The transaction object.
@@ -259,7 +343,9 @@ class MarketplaceContract:
             int(erc20_amount)  # ensure it's an integer (uint256)
         )
 
-        # Send the transaction
+        if gas_price is None:
+            gas_price = self.w3.to_wei('20', 'gwei')
+
         txn = self.contract.functions.finishAuction(
             auction_tuple,
             bidder_sig,
@@ -267,8 +353,182 @@ class MarketplaceContract:
         ).build_transaction({
             'chainId': int(config("CHAIN_ID")),
             'gas': int(config("GAS_LIMIT")),
-            'gasPrice': self.w3.to_wei('20', 'gwei'),
-            'nonce': self.w3.eth.get_transaction_count(owner_address)
+            'gasPrice': gas_price,
+            'nonce': nonce
         })
 
         return txn
+
+    def send_transaction(
+            self,
+            nft_collection_address,
+            token_id,
+            erc20_address,
+            erc20_amount,
+            bidder_sig,
+            owner_approval_sig,
+            owner_address):
+        """
+        Send a transaction to the Marketplace contract to finish an auction.
+
+        Args:
+            nft_collection_address (str): The address of the NFT collection.
+            token_id (int): The ID of the NFT token.
+            erc20_address (str): The address of the ERC20 token.
+            erc20_amount (int): The amount of ERC20 tokens.
+            bidder_sig (str): The signature of the bidder.
+            owner_approval_sig (str): The signature of the owner's approval.
+            owner_address (str): The address of the owner.
+
+        Returns:
+            dict: The transaction object.
+        """
+        return self.build_finish_auction(
+            nft_collection_address,
+            token_id,
+            erc20_address,
+            erc20_amount,
+            bidder_sig,
+            owner_approval_sig,
+            self.w3.eth.get_transaction_count(owner_address))
+
+    def relay_transaction(
+            self,
+            relayer_pool,
+            nft_collection_address,
+            token_id,
+            erc20_address,
+            erc20_amount,
+            bidder_sig,
+            owner_approval_sig,
+            gas_price=None):
+        """
+        Sign and submit a finishAuction transaction from a pooled relayer.
+
+        Args:
+            relayer_pool (RelayerPool): The pool the sending relayer is taken from.
+            nft_collection_address (str): The address of the NFT collection.
+            token_id (int): The ID of the NFT token.
+            erc20_address (str): The address of the ERC20 token.
+            erc20_amount (int): The amount of ERC20 tokens.
+            bidder_sig (str): The signature of the bidder.
+            owner_approval_sig (str): The signature of the owner's approval.
+            gas_price (int): The gas price in wei, 20 gwei if not given.
+
+        Returns:
+            str: The hash of the submitted transaction.
+        """
+        account, nonce = relayer_pool.acquire()
+
+        try:
+            txn = self.build_finish_auction(
+                nft_collection_address,
+                token_id,
+                erc20_address,
+                erc20_amount,
+                bidder_sig,
+                owner_approval_sig,
+                nonce,
+                gas_price)
+            signed_txn = account.sign_transaction(txn)
+            tx_hash = self.w3.eth.send_raw_transaction(
+                signed_txn.rawTransaction)
+        except Exception:
+            relayer_pool.release(account.address, failed=True)
+            raise
+
+        return tx_hash.hex()
+
+    def simulate_finish_auction(
+            self,
+            nft_collection_address,
+            token_id,
+            erc20_address,
+            erc20_amount,
+            bidder_sig,
+            owner_approval_sig,
+            sender):
+        """
+        Dry run finishAuction with eth_call, without spending any gas.
+
+        Args:
+            nft_collection_address (str): The address of the NFT collection.
+            token_id (int): The ID of the NFT token.
+            erc20_address (str): The address of the ERC20 token.
+            erc20_amount (int): The amount of ERC20 tokens.
+            bidder_sig (str): The signature of the bidder.
+            owner_approval_sig (str): The signature of the owner's approval.
+            sender (str): The address the call is made from.
+
+        Raises:
+            ContractLogicError: If the settlement would revert.
+        """
+        auction_tuple = (
+            nft_collection_address,
+            erc20_address,
+            int(token_id),
+            int(erc20_amount)
+        )
+
+        self.contract.functions.finishAuction(
+            auction_tuple,
+            bidder_sig,
+            owner_approval_sig
+        ).call({'from': sender})
+
+
+class MulticallContract:
+    """
+    A class to interact with the Multicall3 contract on the Ethereum blockchain.
+
+    Multicall3 runs many read calls in a single eth_call, so checks over a whole
+    batch cost one round trip.
+
+    Attributes:
+        PROVIDER_URL (str): The Ethereum network provider's URL.
+        MULTICALL_ADDRESS (str): The Ethereum address of the Multicall3 contract.
+        MULTICALL_ABI_PATH (str): Path to the ABI (Application Binary Interface) of
+            the Multicall3 contract.
+        MULTICALL_ABI (list): Loaded ABI content from the JSON file.
+    """
+    PROVIDER_URL = config('PROVIDER_URL')
+    MULTICALL_ADDRESS = config(
+        'MULTICALL_ADDRESS',
+        default='0xcA11bde05977b3631167028862bE2a173976CA11')
+    MULTICALL_ABI_PATH = os.path.join(
+        BASE_DIR, 'contractsABI', 'MULTICALL3.json')
+
+    with open(MULTICALL_ABI_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+        MULTICALL_ABI = json.loads(data['result'])
+
+    def __init__(self, w3=None):
+        """
+        Initialize an instance of the MulticallContract class.
+        Sets up the web3 instance and the contract.
+
+        Args:
+            w3 (Web3): The web3 instance to use, a new one if not given.
+        """
+        self.contract_address = self.MULTICALL_ADDRESS
+        self.w3 = w3 or Web3(Web3.HTTPProvider(self.PROVIDER_URL))
+        self.contract = self.w3.eth.contract(
+            address=self.contract_address,
+            abi=self.MULTICALL_ABI
+        )
+
+    def aggregate(self, calls):
+        """
+        Run many read calls in one eth_call. A failing call does not revert the others.
+
+        Args:
+            calls (list): (target address, encoded call data) tuples.
+
+        Returns:
+            list: (success, return data) tuples, in the order of the calls.
+        """
+        results = self.contract.functions.aggregate3(
+            [(target, True, call_data) for target, call_data in calls]
+        ).call()
+
+        return [(success, return_data) for success, return_data in results]
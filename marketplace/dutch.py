@@ -0,0 +1,53 @@
+"""
+Module for pricing Dutch listings.
+
+A Dutch listing's price declines from its start price, the listing's
+erc20_amount, at its startTime to its endPrice at its endTime, and stays at the
+end price afterwards. The price is computed when it is read, so nothing rewrites
+the listings as time passes.
+"""
+import time
+
+LINEAR = "linear"
+EXPONENTIAL = "exponential"
+DECAY_CURVES = (LINEAR, EXPONENTIAL)
+
+
+def is_dutch(listing):
+    """
+    Check if a listing has a declining price.
+
+    Args:
+        listing (dict): The listing, as stored in the book.
+
+    Returns:
+        bool: True for Dutch listings.
+    """
+    return listing.get("endPrice") is not None
+
+
+def current_price(listing, now=None):
+    """
+    Get the price of a listing at a time.
+
+    Args:
+        listing (dict): The listing, as stored in the book.
+        now (float): The time, now if not given.
+
+    Returns:
+        float: The fixed price, or the declined price of a Dutch listing.
+    """
+    if not is_dutch(listing):
+        return listing["erc20_amount"]
+
+    now = time.time() if now is None else now
+    start_price = listing["erc20_amount"]
+    end_price = listing["endPrice"]
+    elapsed = (now - listing["startTime"]) / (
+        listing["endTime"] - listing["startTime"])
+    elapsed = min(max(elapsed, 0.0), 1.0)
+
+    if listing.get("decay") == EXPONENTIAL:
+        # The same fraction of the price is lost in every equal period
+        return start_price * (end_price / start_price) ** elapsed
+    return start_price - (start_price - end_price) * elapsed
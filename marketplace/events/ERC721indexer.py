@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+from decouple import config, Csv
+from web3 import Web3
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+from marketplace.events.ingester import Checkpoint, LogIngester
+from marketplace.events.ownership import OwnershipIndex
+from marketplace.events.transfers import TRANSFER_TOPIC
+
+# Configuration
+INFURA_URL = config('PROVIDER_URL')
+OWNERSHIP_DB_PATH = (config('OWNERSHIP_DB_PATH', default='')
+                     or os.path.join(BASE_DIR, 'ownership.sqlite3'))
+COLLECTIONS = (config('INDEXER_COLLECTIONS', default='', cast=Csv())
+               or [config('MOCK_ERC721_CONTRACT_ADDRESS')])
+START_BLOCK = config('INDEXER_START_BLOCK', default=0, cast=int)
+CHECKPOINT_PATH = (config('INDEXER_CHECKPOINT_PATH', default='')
+                   or os.path.join(BASE_DIR, 'indexer_checkpoint.json'))
+CHUNK_SIZE = config('LISTENER_CHUNK_SIZE', default=2000, cast=int)
+MAX_CHUNK_SIZE = config('LISTENER_MAX_CHUNK_SIZE', default=10000, cast=int)
+POLL_INTERVAL = config('LISTENER_POLL_INTERVAL', default=10, cast=int)
+REORG_WINDOW = config('LISTENER_REORG_WINDOW', default=64, cast=int)
+
+w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+
+
+def index_ownership():
+    if not w3.is_connected():
+        print("Not connected to Ethereum network!")
+        sys.exit(1)
+
+    index = OwnershipIndex(OWNERSHIP_DB_PATH)
+    collections = [Web3.to_checksum_address(address) for address in COLLECTIONS]
+
+    # Backfill the whole Transfer history of the collections from
+    # INDEXER_START_BLOCK, then follow the head. Owners are written at the head
+    # and rolled back on reorgs
+    ingester = LogIngester(
+        w3,
+        collections,
+        [TRANSFER_TOPIC.hex()],
+        index.apply,
+        Checkpoint(CHECKPOINT_PATH),
+        start_block=START_BLOCK,
+        chunk_size=CHUNK_SIZE,
+        max_chunk_size=MAX_CHUNK_SIZE,
+        revert_handler=index.revert,
+        reorg_window=REORG_WINDOW)
+
+    # A collection added after the first run was not backfilled, it is indexed
+    # from now on but never trusted for ownership
+    if "block" in ingester.state:
+        trusted = [address for address in collections if index.is_indexed(address)]
+        for address in set(collections) - set(trusted):
+            print(f"{address} was added after the backfill, delete "
+                  f"{CHECKPOINT_PATH} and {OWNERSHIP_DB_PATH} to index it")
+    else:
+        trusted = collections
+
+    print("ERC721 indexing...")
+
+    while True:
+        ingester.run_once()
+        # Collections are trusted once their history is indexed, the lag is
+        # measured against the head seen after the run
+        index.add_collections(trusted)
+        index.update_head(w3.eth.block_number)
+        status = index.status()
+        print(f"Indexed up to block {status['block']}, lag {status['lag']}")
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    index_ownership()
@@ -1,50 +1,201 @@
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+import requests
 from decouple import config
 from web3 import Web3
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
 sys.path.append(BASE_DIR)
 
-from contracts import ERC721Contract
+from marketplace.events.dispatch import LogDispatcher
+from marketplace.events.erc20 import APPROVAL_TOPIC, decode_erc20_events
+from marketplace.events.ingester import Checkpoint, LogIngester
+from marketplace.events.ownership import OwnershipCache
+from marketplace.events.transfers import DECODE_BATCH_SIZE, TRANSFER_TOPIC
+from marketplace.events.transfers import decode_transfers
 
 # Configuration
 INFURA_URL = config('PROVIDER_URL')
+CHECKPOINT_PATH = (config('LISTENER_CHECKPOINT_PATH', default='')
+                   or os.path.join(BASE_DIR, 'listener_checkpoint.json'))
+ERC20_CHECKPOINT_PATH = (
+    config('LISTENER_ERC20_CHECKPOINT_PATH', default='')
+    or os.path.join(BASE_DIR, 'listener_erc20_checkpoint.json'))
+START_BLOCK = config('LISTENER_START_BLOCK', default=None)
+CHUNK_SIZE = config('LISTENER_CHUNK_SIZE', default=2000, cast=int)
+MAX_CHUNK_SIZE = config('LISTENER_MAX_CHUNK_SIZE', default=10000, cast=int)
+POLL_INTERVAL = config('LISTENER_POLL_INTERVAL', default=10, cast=int)
+CONFIRMATIONS = config('LISTENER_CONFIRMATIONS', default=0, cast=int)
+REORG_WINDOW = config('LISTENER_REORG_WINDOW', default=64, cast=int)
+BASE_URL = config('BASE_URL')
+LISTENER_TOKEN = config('LISTENER_TOKEN', default='')
+CATCH_UP_BLOCKS = config('LISTENER_CATCH_UP_BLOCKS', default=64, cast=int)
+DECODE_PROCESSES = config('LISTENER_DECODE_PROCESSES', default=0, cast=int)
+DECODE_BATCH = config('LISTENER_DECODE_BATCH_SIZE', default=DECODE_BATCH_SIZE,
+                      cast=int)
+
 w3 = Web3(Web3.HTTPProvider(INFURA_URL))
 
-erc721Contract = ERC721Contract()  # Moved instantiation outside the loop
+ownership_cache = OwnershipCache()
+dispatcher = LogDispatcher()
+# One pool for the whole listener, started once instead of per batch
+decode_pool = (ProcessPoolExecutor(max_workers=DECODE_PROCESSES)
+               if DECODE_PROCESSES else None)
+
+
+def print_transfer_events(logs, from_block, to_block):
+    # Transfers are decoded from their topics, large batches on a process pool
+    for transfer in decode_transfers(logs, decode_pool, DECODE_BATCH):
+        print(transfer)
+
+
+def print_reverted_events(logs):
+    for log in logs:
+        print(f"Reverted by reorg: {log['transactionHash'].hex()}")
+
+
+def post_transfer_events(transfers, reverted):
+    # Only the events are sent, the web process finds the affected listings
+    # through its token index
+    response = requests.post(
+        f"{BASE_URL}/events/transfers/",
+        json={"transfers": transfers, "reverted": reverted},
+        headers={"X-Listener-Token": LISTENER_TOKEN},
+        timeout=30)
+    response.raise_for_status()
+
+
+def push_transfer_events(logs, from_block, to_block):
+    transfers = decode_transfers(logs, decode_pool, DECODE_BATCH)
+    if transfers:
+        post_transfer_events(transfers, [])
+
+
+def push_reverted_events(logs):
+    reverted = decode_transfers(logs)
+    if reverted:
+        post_transfer_events([], reverted)
+
+
+def post_erc20_events(events, reverted):
+    response = requests.post(
+        f"{BASE_URL}/events/erc20/",
+        json={"events": events, "reverted": reverted},
+        headers={"X-Listener-Token": LISTENER_TOKEN},
+        timeout=30)
+    response.raise_for_status()
+
+
+def push_erc20_events(logs, from_block, to_block):
+    events = decode_erc20_events(logs)
+    if events:
+        post_erc20_events(events, [])
 
-if not w3.is_connected():
-    print("Not connected to Ethereum network!")
-    exit()
+
+def push_reverted_erc20_events(logs):
+    reverted = decode_erc20_events(logs)
+    if reverted:
+        post_erc20_events([], reverted)
+
+
+def watch_collection(address):
+    dispatcher.register(address, ownership_cache.apply, ownership_cache.revert)
+    if LISTENER_TOKEN:
+        # Invalidate the listings of transferred tokens on the web process
+        dispatcher.register(
+            address, push_transfer_events, push_reverted_events)
+
+
+def refresh_collections(ingester, erc20_ingester):
+    # Watch every collection with open listings, all of them are read with the
+    # same eth_getLogs call
+    response = requests.get(
+        f"{BASE_URL}/events/collections/",
+        headers={"X-Listener-Token": LISTENER_TOKEN},
+        timeout=30)
+    response.raise_for_status()
+
+    # Follow the ERC20 tokens of the buyer funds cached by the web process, its
+    # entries are kept current by their Transfer and Approval events
+    erc20_ingester.addresses = [
+        Web3.to_checksum_address(address)
+        for address in response.json().get("erc20Tokens", [])]
+
+    collections = set(response.json()["collections"])
+    collections.add(config('MOCK_ERC721_CONTRACT_ADDRESS').lower())
+    watched = set(dispatcher.handlers)
+
+    for address in watched - collections:
+        dispatcher.unregister(address)
+        ownership_cache.evict(address)
+
+    added = [Web3.to_checksum_address(address)
+             for address in collections - watched]
+    for address in added:
+        watch_collection(address)
+    ingester.addresses = dispatcher.addresses
+
+    # Collections listed while the last blocks were ingested may have missed
+    # transfers, read them again for the new collections only. The ingester
+    # keeps the logs, so a reorg reverts them too
+    ingester.catch_up(added, CATCH_UP_BLOCKS)
 
 
 def listen_for_transfer_events():
+    if not w3.is_connected():
+        print("Not connected to Ethereum network!")
+        sys.exit(1)
+
     # Event signature for Transfer event
     transfer_event_signature = w3.keccak(
         text="Transfer(address,address,uint256)").hex()
 
-    # Create a filter for catching Transfer events
-    event_filter = w3.eth.filter({
-        "fromBlock": "latest",
-        "address": config('MOCK_ERC721_CONTRACT_ADDRESS'),
-        "topics": [transfer_event_signature]
-    })
+    watch_collection(config('MOCK_ERC721_CONTRACT_ADDRESS'))
 
-    print("ERC721 listening...")
+    # Read Transfer logs by block range, resuming from the checkpoint and
+    # backfilling from LISTENER_START_BLOCK on the first run. Events are printed
+    # once LISTENER_CONFIRMATIONS deep, the per-collection handlers follow the
+    # head and are rolled back on reorgs
+    ingester = LogIngester(
+        w3,
+        dispatcher.addresses,
+        [transfer_event_signature],
+        print_transfer_events,
+        Checkpoint(CHECKPOINT_PATH),
+        start_block=int(START_BLOCK) if START_BLOCK else None,
+        chunk_size=CHUNK_SIZE,
+        max_chunk_size=MAX_CHUNK_SIZE,
+        revert_handler=print_reverted_events,
+        confirmations=CONFIRMATIONS,
+        reorg_window=REORG_WINDOW)
+    ingester.subscribe("collections", dispatcher.dispatch, dispatcher.revert)
+
+    # ERC20 Transfer and Approval logs of the tokens the web process caches
+    # buyer funds for, from their own checkpoint
+    erc20_ingester = LogIngester(
+        w3,
+        [],
+        [[TRANSFER_TOPIC.hex(), APPROVAL_TOPIC.hex()]],
+        push_erc20_events,
+        Checkpoint(ERC20_CHECKPOINT_PATH),
+        chunk_size=CHUNK_SIZE,
+        max_chunk_size=MAX_CHUNK_SIZE,
+        revert_handler=push_reverted_erc20_events,
+        reorg_window=REORG_WINDOW)
 
-    contract_instance = erc721Contract.get_contract_instance()
+    print("ERC721 listening...")
 
     while True:
-        events = event_filter.get_new_entries()
-        for event in events:
-            decoded_event = contract_instance.events.Transfer().process_log(event)
-            print(decoded_event)
-
-        # Use sleep to prevent spamming (you can adjust the sleep time as
-        # desired)
-        time.sleep(10)
+        if LISTENER_TOKEN:
+            refresh_collections(ingester, erc20_ingester)
+            erc20_ingester.run_once()
+        ingester.run_once()
+        time.sleep(POLL_INTERVAL)
 
 
 if __name__ == "__main__":
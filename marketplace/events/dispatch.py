@@ -0,0 +1,88 @@
+"""
+Module for routing ingested logs to the handlers of their contract.
+"""
+from web3 import Web3
+
+
+class LogDispatcher:
+    """
+    Routes logs to the handlers registered for their contract address.
+
+    All watched contracts are read with one eth_getLogs call per block range, the
+    dispatcher then splits the logs by address with a dict lookup per log, so
+    watching more contracts adds no RPC calls.
+
+    Attributes:
+        handlers (dict): Lowercase address to its (handler, revert) pairs.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty dispatcher.
+        """
+        self.handlers = {}
+
+    def register(self, address, handler, revert=None):
+        """
+        Route the logs of a contract to a handler.
+
+        Args:
+            address (str): The contract address, in any case.
+            handler (callable): Called with the contract's logs, first block and
+                last block of every delivered range.
+            revert (callable): Called with the contract's orphaned logs, optional.
+        """
+        self.handlers.setdefault(address.lower(), []).append((handler, revert))
+
+    def unregister(self, address):
+        """
+        Stop routing the logs of a contract.
+
+        Args:
+            address (str): The contract address, in any case.
+        """
+        self.handlers.pop(address.lower(), None)
+
+    @property
+    def addresses(self):
+        """
+        Get the addresses to read logs from.
+
+        Returns:
+            list: The checksummed addresses of the registered contracts.
+        """
+        return [Web3.to_checksum_address(address) for address in self.handlers]
+
+    def _group(self, logs):
+        """
+        Split logs by their lowercase contract address, keeping their order.
+        """
+        groups = {}
+        for log in logs:
+            groups.setdefault(log["address"].lower(), []).append(log)
+        return groups
+
+    def dispatch(self, logs, from_block, to_block):
+        """
+        Deliver logs to the handlers of their contract.
+
+        Args:
+            logs (list): The raw logs of a delivered range.
+            from_block (int): First block of the range.
+            to_block (int): Last block of the range.
+        """
+        for address, address_logs in self._group(logs).items():
+            for handler, _ in self.handlers.get(address, []):
+                handler(address_logs, from_block, to_block)
+
+    def revert(self, logs):
+        """
+        Deliver orphaned logs to the revert handlers of their contract.
+
+        Args:
+            logs (list): The orphaned raw logs, newest first.
+        """
+        for address, address_logs in self._group(logs).items():
+            for _, revert in self.handlers.get(address, []):
+                if revert:
+                    revert(address_logs)
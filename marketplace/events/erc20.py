@@ -0,0 +1,63 @@
+"""
+Module for decoding ERC20 Transfer and Approval logs.
+
+The addresses of both events are indexed and the amount is the only data word,
+so logs are decoded from their topics and data without an ABI.
+"""
+from web3 import Web3
+
+from .transfers import TRANSFER_TOPIC, checksum_address
+
+APPROVAL_TOPIC = Web3.keccak(text="Approval(address,address,uint256)")
+
+EVENT_NAMES = {
+    TRANSFER_TOPIC: "Transfer",
+    APPROVAL_TOPIC: "Approval",
+}
+
+
+def decode_erc20_event(log):
+    """
+    Decode an ERC20 Transfer or Approval log.
+
+    Args:
+        log (AttributeDict): The raw log.
+
+    Returns:
+        dict: The token address, event name, from (sender or owner), to
+        (receiver or spender) and value of the event with the blockNumber,
+        transactionHash and logIndex of its log, or None if the log is neither.
+        ERC721 Transfers share the topic but have a fourth one, and are skipped.
+    """
+    topics = log["topics"]
+    if len(topics) != 3 or topics[0] not in EVENT_NAMES:
+        return None
+
+    return {
+        "token": checksum_address(log["address"]),
+        "event": EVENT_NAMES[topics[0]],
+        "from": checksum_address(bytes(topics[1][-20:])),
+        "to": checksum_address(bytes(topics[2][-20:])),
+        "value": int.from_bytes(bytes(log["data"]), "big"),
+        "blockNumber": log["blockNumber"],
+        "transactionHash": "0x" + bytes(log["transactionHash"]).hex(),
+        "logIndex": log["logIndex"],
+    }
+
+
+def decode_erc20_events(logs):
+    """
+    Decode the ERC20 Transfer and Approval logs of a batch.
+
+    Args:
+        logs (list): The raw logs.
+
+    Returns:
+        list: The decoded events, in log order.
+    """
+    events = []
+    for log in logs:
+        event = decode_erc20_event(log)
+        if event:
+            events.append(event)
+    return events
@@ -0,0 +1,538 @@
+"""
+Module for ingesting contract logs by block range.
+
+Logs are read with eth_getLogs over adaptive block ranges and delivered to
+subscriptions, then the ingestion state is persisted, so the ingester resumes where
+it stopped and backfills anything it missed while down.
+
+Block hashes of the recent blocks are tracked to detect reorgs. Orphaned logs are
+reverted on the subscriptions that received them and the canonical blocks are
+ingested again. Every subscription has its own confirmation depth, so low-latency
+consumers and consumers that only want final logs share the same ingestion.
+"""
+import json
+import os
+import time
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+LOG_BYTES_FIELDS = ("blockHash", "data", "transactionHash")
+
+
+class ReorgTooDeep(Exception):
+    """Raised when a reorg goes past the oldest tracked block."""
+
+
+class Checkpoint:
+    """
+    The persisted ingestion state, stored as a JSON file.
+
+    Attributes:
+        path (str): Path of the checkpoint file.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            path (str): Path of the checkpoint file.
+        """
+        self.path = path
+
+    def load(self):
+        """
+        Load the ingestion state.
+
+        Returns:
+            dict: The saved state, empty if nothing was saved yet.
+        """
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state):
+        """
+        Save the ingestion state atomically.
+
+        Args:
+            state (dict): The state to save.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def dump_log(log):
+    """
+    Convert a raw log to a JSON serializable dict.
+
+    Args:
+        log (AttributeDict): The log as returned by eth_getLogs.
+
+    Returns:
+        dict: The log with every bytes value as a hex string.
+    """
+    return json.loads(Web3.to_json(log))
+
+
+def load_log(data):
+    """
+    Convert a dumped log back to the shape returned by eth_getLogs.
+
+    Args:
+        data (dict): The log as returned by `dump_log`.
+
+    Returns:
+        AttributeDict: The raw log.
+    """
+    log = dict(data)
+    for field in LOG_BYTES_FIELDS:
+        if field in log:
+            log[field] = HexBytes(log[field])
+    log["topics"] = [HexBytes(topic) for topic in log.get("topics", [])]
+    return AttributeDict(log)
+
+
+class Subscription:
+    """
+    A consumer of ingested logs.
+
+    Attributes:
+        name (str): Identifies the subscription in the checkpoint.
+        handler (callable): Called with the logs, first block and last block of
+            every delivered range.
+        revert (callable): Called with the orphaned logs, newest first, when a
+            reorg drops blocks already delivered. Optional.
+        confirmations (int): How many blocks deep a log must be before delivery,
+            0 delivers logs as soon as they are seen.
+    """
+
+    def __init__(self, name, handler, revert=None, confirmations=0):
+        """
+        Initialize the subscription.
+
+        Args:
+            name (str): Identifies the subscription in the checkpoint.
+            handler (callable): Receives the delivered logs.
+            revert (callable): Receives the orphaned logs, optional.
+            confirmations (int): The confirmation depth.
+        """
+        self.name = name
+        self.handler = handler
+        self.revert = revert
+        self.confirmations = confirmations
+
+
+class LogIngester:
+    """
+    Reads logs with eth_getLogs over block ranges sized to the log density.
+
+    The range grows while chunks come back with few logs and shrinks when they
+    come back with too many or the provider rejects the query.
+
+    Attributes:
+        w3 (Web3): The web3 instance to read logs with.
+        addresses (list): Contract addresses to read logs from, read again for
+            every range so it can change while the ingester runs.
+        topics (list): The topics filter of the logs.
+        checkpoint (Checkpoint): Where the ingestion state is persisted.
+        subscriptions (list): The consumers of the logs.
+        reorg_window (int): How many recent blocks are tracked for reorgs.
+        chunk_size (int): The current block range size.
+        logs_total (int): Logs ingested since the ingester was created.
+        elapsed (float): Seconds spent ingesting since the ingester was created.
+    """
+
+    def __init__(
+            self,
+            w3,
+            addresses,
+            topics,
+            handler,
+            checkpoint,
+            start_block=None,
+            chunk_size=2000,
+            max_chunk_size=10000,
+            target_logs=5000,
+            revert_handler=None,
+            confirmations=0,
+            reorg_window=64):
+        """
+        Initialize the ingester.
+
+        Args:
+            w3 (Web3): The web3 instance to read logs with.
+            addresses (list): Contract addresses to read logs from.
+            topics (list): The topics filter of the logs.
+            handler (callable): Handler of the default subscription, called with
+                the logs, first block and last block of every delivered range.
+            checkpoint (Checkpoint): Where the ingestion state is persisted.
+            start_block (int): First block to backfill from when there is no
+                checkpoint yet, the current head if not given.
+            chunk_size (int): The initial block range size.
+            max_chunk_size (int): The largest block range to request.
+            target_logs (int): The number of logs per range the sizing aims for.
+            revert_handler (callable): Revert handler of the default subscription.
+            confirmations (int): Confirmation depth of the default subscription.
+            reorg_window (int): How many recent blocks are tracked for reorgs,
+                0 disables reorg detection.
+        """
+        self.w3 = w3
+        self.addresses = addresses
+        self.topics = topics
+        self.checkpoint = checkpoint
+        self.start_block = start_block
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_logs = target_logs
+        self.reorg_window = reorg_window
+        self.subscriptions = []
+        self.logs_total = 0
+        self.elapsed = 0.0
+
+        self.state = checkpoint.load()
+        self.state.setdefault("hashes", {})
+        self.state.setdefault("delivered", {})
+        self.recent_logs = [load_log(log) for log in self.state.get("logs", [])]
+
+        self.subscribe("default", handler, revert_handler, confirmations)
+
+    def subscribe(self, name, handler, revert=None, confirmations=0):
+        """
+        Add a consumer of the ingested logs.
+
+        A new subscription starts at the ingester's next block, it does not
+        receive the history already ingested.
+
+        Args:
+            name (str): Identifies the subscription in the checkpoint.
+            handler (callable): Receives the delivered logs.
+            revert (callable): Receives the orphaned logs, optional.
+            confirmations (int): The confirmation depth.
+
+        Returns:
+            Subscription: The added subscription.
+
+        Raises:
+            ValueError: If the depth is larger than the tracked reorg window.
+        """
+        if self.reorg_window and confirmations > self.reorg_window:
+            raise ValueError(
+                "Confirmations can not be larger than the reorg window")
+
+        subscription = Subscription(name, handler, revert, confirmations)
+        self.subscriptions.append(subscription)
+        if "block" in self.state:
+            self.state["delivered"].setdefault(name, self.state["block"])
+        return subscription
+
+    @property
+    def logs_per_second(self):
+        """
+        Get the sustained ingestion throughput.
+
+        Returns:
+            float: Logs ingested per second spent ingesting.
+        """
+        return self.logs_total / self.elapsed if self.elapsed else 0.0
+
+    def next_block(self):
+        """
+        Get the first block that has not been ingested yet.
+
+        Returns:
+            int: The next block to ingest.
+        """
+        if "block" in self.state:
+            return self.state["block"] + 1
+        if self.start_block is not None:
+            return self.start_block
+        return self.w3.eth.block_number
+
+    def head_block(self):
+        """
+        Get the last block that may be ingested.
+
+        Returns:
+            int: The current head block.
+        """
+        return self.w3.eth.block_number
+
+    def block_hash(self, block_number):
+        """
+        Get the hash of a canonical block.
+
+        Returns:
+            str: The block hash as a hex string.
+        """
+        return self.w3.eth.get_block(block_number)["hash"].hex()
+
+    def get_logs(self, from_block, to_block, addresses=None):
+        """
+        Read the logs of a block range.
+
+        Args:
+            from_block (int): First block of the range.
+            to_block (int): Last block of the range.
+            addresses (list): Contract addresses to read, the ingester's if not given.
+
+        Returns:
+            list: The raw logs in the range.
+        """
+        if addresses is None:
+            addresses = self.addresses
+        if not addresses:
+            # An empty address filter would match every contract
+            return []
+
+        return self.w3.eth.get_logs({
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": addresses,
+            "topics": self.topics,
+        })
+
+    def catch_up(self, addresses, blocks):
+        """
+        Read the last ingested blocks again for contracts just added to the
+        addresses, which were not read when those blocks were ingested.
+
+        The logs are delivered to the subscriptions that are already past them,
+        and kept with the recent logs, so the others receive them when due and
+        a reorg reverts them like any ingested log.
+
+        Args:
+            addresses (list): The added contract addresses.
+            blocks (int): How many of the last ingested blocks to read.
+
+        Returns:
+            int: The number of logs read.
+        """
+        if not addresses or "block" not in self.state:
+            return 0
+
+        to_block = self.state["block"]
+        from_block = max(0, to_block - blocks + 1)
+        logs = self.get_logs(from_block, to_block, addresses)
+
+        hashes = self.state["hashes"]
+        for log in logs:
+            if self.reorg_window and \
+                    to_block - log["blockNumber"] < self.reorg_window:
+                hashes[str(log["blockNumber"])] = log["blockHash"].hex()
+        self.recent_logs = sorted(
+            self.recent_logs + list(logs),
+            key=lambda log: (log["blockNumber"], log["logIndex"]))
+
+        delivered = self.state["delivered"]
+        for subscription in self.subscriptions:
+            last_delivered = delivered.get(subscription.name, from_block - 1)
+            due = [log for log in logs if log["blockNumber"] <= last_delivered]
+            if due:
+                subscription.handler(due, from_block, last_delivered)
+
+        self.save()
+        return len(logs)
+
+    def _resize(self, logs_count):
+        """
+        Adapt the range size to the number of logs the last range returned.
+        """
+        if logs_count > self.target_logs:
+            self.chunk_size = max(1, self.chunk_size // 2)
+        elif logs_count < self.target_logs // 2:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+
+    def _track(self, logs, to_block, head):
+        """
+        Remember the hashes of the ingested blocks that can still be orphaned
+        and keep their logs until they are final and delivered.
+        """
+        self.recent_logs.extend(logs)
+
+        if not self.reorg_window or head - to_block >= self.reorg_window:
+            return
+
+        hashes = self.state["hashes"]
+        for log in logs:
+            if head - log["blockNumber"] < self.reorg_window:
+                hashes[str(log["blockNumber"])] = log["blockHash"].hex()
+        hashes[str(to_block)] = self.block_hash(to_block)
+
+    def _prune(self):
+        """
+        Forget hashes outside the reorg window and logs every subscription has
+        received and that can no longer be orphaned.
+        """
+        block = self.state["block"]
+        keep_from = block - self.reorg_window if self.reorg_window else block
+        delivered = self.state["delivered"]
+        for subscription in self.subscriptions:
+            keep_from = min(keep_from, delivered.get(subscription.name, block))
+
+        self.state["hashes"] = {
+            number: block_hash
+            for number, block_hash in self.state["hashes"].items()
+            if int(number) > block - self.reorg_window}
+        self.recent_logs = [
+            log for log in self.recent_logs if log["blockNumber"] > keep_from]
+
+    def _find_fork(self):
+        """
+        Find the last tracked block that is still canonical.
+
+        Returns:
+            int: The fork block, or None if the tip is still canonical.
+
+        Raises:
+            ReorgTooDeep: If no tracked block is canonical anymore.
+        """
+        tracked = sorted(
+            ((int(number), block_hash)
+             for number, block_hash in self.state["hashes"].items()),
+            reverse=True)
+
+        for index, (number, block_hash) in enumerate(tracked):
+            if self.block_hash(number) == block_hash:
+                return None if index == 0 else number
+
+        if tracked:
+            raise ReorgTooDeep(
+                f"Reorg deeper than block {tracked[-1][0]}, reingest from an "
+                "older checkpoint")
+        return None
+
+    def handle_reorg(self):
+        """
+        Detect a reorg and roll back everything ingested after the fork.
+
+        Returns:
+            int: The fork block, or None if there was no reorg.
+        """
+        if not self.reorg_window or "block" not in self.state:
+            return None
+
+        fork = self._find_fork()
+        if fork is None:
+            return None
+
+        orphaned = [log for log in self.recent_logs if log["blockNumber"] > fork]
+        delivered = self.state["delivered"]
+
+        for subscription in self.subscriptions:
+            last_delivered = delivered.get(subscription.name, fork)
+            if last_delivered <= fork:
+                continue
+
+            if subscription.revert:
+                subscription.revert([
+                    log for log in reversed(orphaned)
+                    if log["blockNumber"] <= last_delivered])
+            delivered[subscription.name] = fork
+
+        self.recent_logs = [
+            log for log in self.recent_logs if log["blockNumber"] <= fork]
+        self.state["hashes"] = {
+            number: block_hash
+            for number, block_hash in self.state["hashes"].items()
+            if int(number) <= fork}
+        self.state["block"] = fork
+        self.save()
+        return fork
+
+    def deliver(self, head):
+        """
+        Deliver the ingested logs each subscription is due at the given head.
+
+        Args:
+            head (int): The current head block.
+        """
+        block = self.state["block"]
+        delivered = self.state["delivered"]
+
+        for subscription in self.subscriptions:
+            target = min(block, head - subscription.confirmations)
+            last_delivered = delivered[subscription.name]
+            if target <= last_delivered:
+                continue
+
+            logs = [
+                log for log in self.recent_logs
+                if last_delivered < log["blockNumber"] <= target]
+            subscription.handler(logs, last_delivered + 1, target)
+            delivered[subscription.name] = target
+
+    def save(self):
+        """
+        Persist the ingestion state.
+        """
+        self.state["logs"] = [dump_log(log) for log in self.recent_logs]
+        self.checkpoint.save(self.state)
+
+    def run_once(self):
+        """
+        Check for reorgs, then ingest every block from the checkpoint up to the head.
+
+        Returns:
+            int: The number of logs ingested.
+        """
+        started = time.perf_counter()
+        ingested = 0
+
+        self.handle_reorg()
+        from_block = self.next_block()
+        head = self.head_block()
+
+        for subscription in self.subscriptions:
+            self.state["delivered"].setdefault(subscription.name, from_block - 1)
+
+        while from_block <= head:
+            to_block = min(head, from_block + self.chunk_size - 1)
+
+            try:
+                logs = self.get_logs(from_block, to_block)
+            except (ValueError, IOError):
+                # Providers reject ranges with too many results or time out on
+                # them, retry the same start with a smaller range
+                if self.chunk_size == 1:
+                    raise
+                self.chunk_size = max(1, self.chunk_size // 2)
+                continue
+
+            self._track(logs, to_block, head)
+            self.state["block"] = to_block
+            self.deliver(head)
+            self._prune()
+            self.save()
+
+            ingested += len(logs)
+            self._resize(len(logs))
+            from_block = to_block + 1
+
+        if "block" in self.state:
+            # Confirmed subscriptions catch up as the head moves, even without
+            # new logs
+            self.deliver(head)
+            self._prune()
+            self.save()
+
+        self.logs_total += ingested
+        self.elapsed += time.perf_counter() - started
+        return ingested
+
+    def run_forever(self, poll_interval=10):
+        """
+        Keep ingesting new blocks as they are produced.
+
+        Args:
+            poll_interval (int): Seconds to wait once the head is reached.
+        """
+        while True:
+            self.run_once()
+            time.sleep(poll_interval)
@@ -0,0 +1,293 @@
+"""
+Module for tracking token ownership from ERC721 Transfer logs.
+"""
+import sqlite3
+import threading
+import time
+
+from decouple import config
+
+from .transfers import ZERO_ADDRESS, checksum_address
+from .transfers import decode_transfer, decode_transfers
+
+
+class OwnershipCache:
+    """
+    An in-memory (collection, tokenId) to owner map built from Transfer logs.
+
+    It is meant to be an ingester subscription: `apply` receives the delivered
+    logs and `revert` the logs orphaned by a reorg.
+
+    Attributes:
+        owners (dict): (collection address, token ID) to owner address.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty cache.
+        """
+        self.owners = {}
+
+    def apply(self, logs, from_block=None, to_block=None):
+        """
+        Apply Transfer logs, oldest first.
+
+        Args:
+            logs (list): The raw logs.
+            from_block (int): First block of the delivered range, unused.
+            to_block (int): Last block of the delivered range, unused.
+        """
+        for log in logs:
+            transfer = decode_transfer(log)
+            if transfer:
+                self.owners[(transfer["collection"], transfer["tokenId"])] = \
+                    transfer["to"]
+
+    def revert(self, logs):
+        """
+        Undo Transfer logs, newest first, giving each token back to its sender.
+
+        Args:
+            logs (list): The orphaned raw logs.
+        """
+        for log in logs:
+            transfer = decode_transfer(log)
+            if not transfer:
+                continue
+
+            key = (transfer["collection"], transfer["tokenId"])
+            if transfer["from"] == ZERO_ADDRESS:
+                self.owners.pop(key, None)
+            else:
+                self.owners[key] = transfer["from"]
+
+    def evict(self, collection):
+        """
+        Forget the owners of a collection that is no longer watched.
+
+        Args:
+            collection (str): The collection address, in any case.
+        """
+        collection = collection.lower()
+        for key in [key for key in self.owners if key[0].lower() == collection]:
+            del self.owners[key]
+
+    def owner_of(self, collection, token_id):
+        """
+        Get the owner of a token.
+
+        Args:
+            collection (str): The checksummed collection address.
+            token_id (int): The ID of the token.
+
+        Returns:
+            str: The owner address, or None if the token was never seen.
+        """
+        return self.owners.get((collection, token_id))
+
+
+class OwnershipIndex:
+    """
+    A (collection, tokenId) to owner table in SQLite, built from the Transfer
+    log history of the indexed collections.
+
+    Like `OwnershipCache` it is an ingester subscription, and it also records
+    the last indexed block and the chain head seen by the indexer so readers can
+    tell how far behind it is.
+
+    Attributes:
+        path (str): The SQLite database path.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS owners (
+            collection TEXT NOT NULL,
+            token_id TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            PRIMARY KEY (collection, token_id));
+        CREATE TABLE IF NOT EXISTS collections (
+            address TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS status (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            block INTEGER,
+            head INTEGER,
+            updated_at REAL);
+    """
+
+    def __init__(self, path):
+        """
+        Open the index, creating its tables if needed.
+
+        Args:
+            path (str): The SQLite database path.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # The indexer writes while the API processes read
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+
+    def add_collections(self, addresses):
+        """
+        Mark collections as indexed from their first Transfer.
+
+        Args:
+            addresses (list): The collection addresses.
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO collections (address) VALUES (?)",
+                [(address.lower(),) for address in addresses])
+
+    def is_indexed(self, collection):
+        """
+        Check if a collection is indexed.
+
+        Args:
+            collection (str): The collection address, in any case.
+
+        Returns:
+            bool: True if the whole history of the collection is indexed.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM collections WHERE address = ?",
+                (collection.lower(),)).fetchone()
+        return row is not None
+
+    def _set_owners(self, owners):
+        """
+        Write (collection, token ID, owner) rows, an owner of None deletes the row.
+        """
+        for collection, token_id, owner in owners:
+            if owner is None:
+                self._db.execute(
+                    "DELETE FROM owners WHERE collection = ? AND token_id = ?",
+                    (collection.lower(), str(token_id)))
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO owners (collection, token_id, owner) "
+                    "VALUES (?, ?, ?)",
+                    (collection.lower(), str(token_id), owner))
+
+    def apply(self, logs, from_block=None, to_block=None):
+        """
+        Apply Transfer logs, oldest first, and record the indexed block.
+
+        Args:
+            logs (list): The raw logs.
+            from_block (int): First block of the delivered range, unused.
+            to_block (int): Last block of the delivered range.
+        """
+        owners = [(transfer["collection"], transfer["tokenId"], transfer["to"])
+                  for transfer in decode_transfers(logs)]
+
+        with self._lock, self._db:
+            self._set_owners(owners)
+            if to_block is not None:
+                self._db.execute(
+                    "INSERT INTO status (id, block) VALUES (1, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET block = excluded.block",
+                    (to_block,))
+
+    def revert(self, logs):
+        """
+        Undo Transfer logs, newest first, giving each token back to its sender.
+
+        Args:
+            logs (list): The orphaned raw logs.
+        """
+        owners = [(transfer["collection"], transfer["tokenId"],
+                   None if transfer["from"] == ZERO_ADDRESS else transfer["from"])
+                  for transfer in decode_transfers(logs)]
+
+        with self._lock, self._db:
+            self._set_owners(owners)
+
+    def update_head(self, head):
+        """
+        Record the chain head seen by the indexer.
+
+        Args:
+            head (int): The head block number.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO status (id, head, updated_at) VALUES (1, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET head = excluded.head, "
+                "updated_at = excluded.updated_at",
+                (head, time.time()))
+
+    def status(self):
+        """
+        Get how far the index is behind the chain.
+
+        Returns:
+            dict: The last indexed block, the last seen head, their difference as
+            lag and the time the head was seen, all None before the first run.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT block, head, updated_at FROM status WHERE id = 1").fetchone()
+
+        block, head, updated_at = row or (None, None, None)
+        lag = head - block if block is not None and head is not None else None
+        return {"block": block, "head": head, "lag": lag, "updatedAt": updated_at}
+
+    def is_fresh(self, max_lag, max_age):
+        """
+        Check if the index is caught up enough to be trusted.
+
+        Args:
+            max_lag (int): The most blocks the index may be behind the seen head.
+            max_age (int): The most seconds since the indexer last saw the head.
+
+        Returns:
+            bool: True if the index can answer instead of the chain.
+        """
+        status = self.status()
+        return (status["lag"] is not None
+                and status["lag"] <= max_lag
+                and time.time() - status["updatedAt"] <= max_age)
+
+    def owner_of(self, collection, token_id):
+        """
+        Get the owner of a token.
+
+        Args:
+            collection (str): The collection address, in any case.
+            token_id (int): The ID of the token.
+
+        Returns:
+            str: The checksummed owner address, or None if the token is unknown.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT owner FROM owners WHERE collection = ? AND token_id = ?",
+                (collection.lower(), str(token_id))).fetchone()
+        return checksum_address(row[0]) if row else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_ownership_index():
+    """
+    Get the process-wide ownership index from the configuration.
+
+    Returns:
+        OwnershipIndex: The shared index, or None if OWNERSHIP_DB_PATH is not set.
+    """
+    global _index
+
+    path = config('OWNERSHIP_DB_PATH', default='')
+    if not path:
+        return None
+
+    with _index_lock:
+        if _index is None or _index.path != path:
+            _index = OwnershipIndex(path)
+
+    return _index
@@ -0,0 +1,127 @@
+"""
+Module for decoding ERC721 Transfer logs.
+
+All three Transfer arguments are indexed, so logs are decoded straight from their
+topics instead of through the contract ABI. Large batches can be decoded on a
+process pool with `decode_transfers`, the pool is created once by its caller and
+reused for every batch.
+"""
+from functools import lru_cache
+
+from web3 import Web3
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)")
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# Logs per process pool task, a fraction of the ingester's 5000 logs per range
+# so a full range is spread over several workers
+DECODE_BATCH_SIZE = 1000
+
+
+@lru_cache(maxsize=65536)
+def checksum_address(address):
+    """
+    Checksum an address, caching the result.
+
+    Checksumming hashes the address, and a backfill sees the same collections
+    and holders over and over.
+
+    Args:
+        address (str | bytes): The address, as text or its 20 bytes.
+
+    Returns:
+        str: The checksummed address.
+    """
+    return Web3.to_checksum_address(address)
+
+
+def decode_transfer(log):
+    """
+    Decode an ERC721 Transfer log from its topics.
+
+    All three Transfer arguments are indexed, so they are read straight from the
+    topics without an ABI.
+
+    Args:
+        log (AttributeDict): The raw log.
+
+    Returns:
+        dict: The collection address, from, to and tokenId of the transfer with
+        the blockNumber, transactionHash and logIndex of its log, or None if the
+        log is not an ERC721 Transfer.
+    """
+    return _decode_row((log["address"], log["topics"], log["blockNumber"],
+                        log["transactionHash"], log["logIndex"]))
+
+
+def _decode_row(row):
+    """
+    Decode a Transfer from the fields of its log.
+
+    Args:
+        row (tuple): The address, topics, blockNumber, transactionHash and
+            logIndex of the log.
+
+    Returns:
+        dict: The decoded transfer, or None if the log is not an ERC721 Transfer.
+    """
+    address, topics, block_number, transaction_hash, log_index = row
+    if len(topics) != 4 or topics[0] != TRANSFER_TOPIC:
+        return None
+
+    return {
+        "collection": checksum_address(address),
+        "from": checksum_address(bytes(topics[1][-20:])),
+        "to": checksum_address(bytes(topics[2][-20:])),
+        "tokenId": int.from_bytes(topics[3], "big"),
+        "blockNumber": block_number,
+        "transactionHash": "0x" + bytes(transaction_hash).hex(),
+        "logIndex": log_index,
+    }
+
+
+def _decode_rows(rows):
+    """
+    Decode a batch of log rows, in a process pool worker.
+
+    Args:
+        rows (list): Log rows, see `_decode_row`.
+
+    Returns:
+        list: The decoded transfers, None for the logs that are not Transfers.
+    """
+    return [_decode_row(row) for row in rows]
+
+
+def decode_transfers(logs, executor=None, batch_size=DECODE_BATCH_SIZE):
+    """
+    Decode a batch of ERC721 Transfer logs, skipping the other logs.
+
+    Batches larger than `batch_size` are fanned out to the process pool when one
+    is given. Only the fields needed to decode are sent to the workers, as plain
+    bytes, which keeps pickling cheaper than the decoding itself.
+
+    Args:
+        logs (list): The raw logs.
+        executor (ProcessPoolExecutor): The pool for large batches, None to
+            decode in this process.
+        batch_size (int): Logs per worker task.
+
+    Returns:
+        list: The decoded transfers, in log order.
+    """
+    if executor is not None and len(logs) > batch_size:
+        rows = [
+            (log["address"], tuple(bytes(topic) for topic in log["topics"]),
+             log["blockNumber"], bytes(log["transactionHash"]), log["logIndex"])
+            for log in logs]
+        batches = [rows[i:i + batch_size]
+                   for i in range(0, len(rows), batch_size)]
+
+        decoded = [transfer
+                   for batch in executor.map(_decode_rows, batches)
+                   for transfer in batch]
+    else:
+        decoded = map(decode_transfer, logs)
+
+    return [transfer for transfer in decoded if transfer]
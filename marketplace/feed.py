@@ -0,0 +1,287 @@
+"""
+Module for pushing order-book changes to subscribed clients.
+
+Every change is published once with a sequence number and fanned out to the
+subscribers of its topics only: every change, its collection and its sale. A
+bounded history lets reconnecting clients resume from the last sequence number
+they saw.
+"""
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+from decouple import config
+
+FEED_HISTORY_SIZE = config('FEED_HISTORY_SIZE', default=10000, cast=int)
+FEED_QUEUE_SIZE = config('FEED_QUEUE_SIZE', default=1000, cast=int)
+
+ALL_TOPIC = "all"
+
+
+def collection_topic(collection):
+    """
+    Build the topic of a collection.
+
+    Args:
+        collection (str): The collection address, in any case.
+
+    Returns:
+        str: The topic of the collection's events.
+    """
+    return f"collection:{collection.lower()}"
+
+
+def sale_topic(sale_id):
+    """
+    Build the topic of a sale.
+
+    Args:
+        sale_id (int): The listing identifier.
+
+    Returns:
+        str: The topic of the sale's events.
+    """
+    return f"sale:{int(sale_id)}"
+
+
+def event_topics(event):
+    """
+    Get the topics an event is published to.
+
+    Args:
+        event (dict): The published event.
+
+    Returns:
+        list: The topics, "all" first.
+    """
+    topics = [ALL_TOPIC]
+    if event["collection"]:
+        topics.append(collection_topic(event["collection"]))
+    if event["sale_id"] is not None:
+        topics.append(sale_topic(event["sale_id"]))
+    return topics
+
+
+class FeedSubscription:
+    """
+    The queue of events of one client.
+
+    Attributes:
+        topics (list): The topics the client subscribed to.
+        reset (bool): True if the client asked to resume from a sequence number
+            no longer in the history, and must reload the book.
+        overflowed (bool): True if the client fell more than the queue size
+            behind and was dropped, it must resume from its last sequence number.
+    """
+
+    def __init__(self, topics, max_size=FEED_QUEUE_SIZE):
+        """
+        Initialize the subscription.
+
+        Args:
+            topics (list): The topics to subscribe to.
+            max_size (int): The most events queued before the client is dropped.
+        """
+        self.topics = topics
+        self.max_size = max_size
+        self.reset = False
+        self.overflowed = False
+        self.last_seq = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._loop = None
+        self._wakeup = None
+
+    def push(self, event, replay=False):
+        """
+        Queue an event, skipping the ones already queued through another topic.
+
+        Args:
+            event (dict): The published event.
+            replay (bool): True for events replayed from the history, which are
+                queued past the queue size.
+        """
+        with self._condition:
+            if self.overflowed or event["seq"] <= self.last_seq:
+                return
+            if len(self._events) >= self.max_size and not replay:
+                self.overflowed = True
+            else:
+                self._events.append(event)
+                self.last_seq = event["seq"]
+            self._condition.notify()
+
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _drain(self):
+        """
+        Take every queued event.
+        """
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def get(self, timeout=None):
+        """
+        Wait for events, from a thread.
+
+        Args:
+            timeout (float): Seconds to wait, forever if None.
+
+        Returns:
+            list: The queued events, empty if none arrived in time.
+        """
+        with self._condition:
+            if not self._events and not self.overflowed:
+                self._condition.wait(timeout)
+            return self._drain()
+
+    async def aget(self, timeout=None):
+        """
+        Wait for events, from an event loop.
+
+        Args:
+            timeout (float): Seconds to wait, forever if None.
+
+        Returns:
+            list: The queued events, empty if none arrived in time.
+        """
+        if self._loop is None:
+            self._wakeup = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+
+        self._wakeup.clear()
+        with self._condition:
+            if self._events or self.overflowed:
+                return self._drain()
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        with self._condition:
+            return self._drain()
+
+
+class OrderBookFeed:
+    """
+    A publish/subscribe hub of order-book events, indexed by topic.
+
+    Attributes:
+        history (deque): The latest events, oldest first.
+    """
+
+    def __init__(self, history_size=FEED_HISTORY_SIZE):
+        """
+        Initialize an empty feed.
+
+        Args:
+            history_size (int): How many events are kept for resuming clients.
+        """
+        self.history = deque(maxlen=history_size)
+        self._seq = 0
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, record, **data):
+        """
+        Publish an order-book change to the subscribers of its topics.
+
+        Args:
+            event_type (str): The kind of change, e.g. "listing_created".
+            record (dict): The listing or intent that changed, signatures are left
+                out of the event.
+            **data: Extra fields of the event.
+
+        Returns:
+            dict: The published event.
+        """
+        payload = {key: value for key, value in record.items()
+                   if not key.endswith("Sig")}
+        payload.update(data)
+
+        with self._lock:
+            self._seq += 1
+            event = {
+                "seq": self._seq,
+                "type": event_type,
+                "sale_id": record.get("sale_id"),
+                "collection": record.get("nft_collection_address"),
+                "data": payload,
+            }
+            self.history.append(event)
+
+            for topic in event_topics(event):
+                for subscription in self._subscribers.get(topic, ()):
+                    subscription.push(event)
+
+        return event
+
+    def subscribe(self, topics, since=None):
+        """
+        Subscribe to topics, optionally replaying the events after a sequence number.
+
+        Args:
+            topics (list): The topics, see `collection_topic` and `sale_topic`.
+            since (int): The last sequence number the client saw.
+
+        Returns:
+            FeedSubscription: The new subscription.
+        """
+        subscription = FeedSubscription(topics)
+
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+
+            if since is not None and since != self._seq:
+                first_seq = (self.history[0]["seq"] if self.history
+                             else self._seq + 1)
+                if since > self._seq or since < first_seq - 1:
+                    # The client saw events this process no longer has, or
+                    # never had since a restart
+                    subscription.reset = True
+                else:
+                    # Sequence numbers are contiguous, so the replay starts at
+                    # a known offset of the history
+                    wanted = set(topics)
+                    for event in itertools.islice(
+                            self.history, since - first_seq + 1, None):
+                        if wanted.intersection(event_topics(event)):
+                            subscription.push(event, replay=True)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Remove a subscription from its topics.
+
+        Args:
+            subscription (FeedSubscription): The subscription to remove.
+        """
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def subscriber_count(self, topic):
+        """
+        Get the number of subscribers of a topic.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            int: The number of subscriptions.
+        """
+        with self._lock:
+            return len(self._subscribers.get(topic, ()))
+
+
+order_book_feed = OrderBookFeed()
@@ -0,0 +1,228 @@
+"""
+Module for answering buyer ERC20 balance and allowance checks without an RPC
+round trip per order.
+
+Balances and marketplace allowances are cached per (token, holder) and kept
+current by the ERC20 Transfer and Approval events pushed by the listener. An
+entry is read again from the chain once it is older than FUNDS_CACHE_TTL, so a
+missed event is only trusted for a bounded time. Missing and expired entries are
+read together, with the block they were read at, in a single Multicall3 call.
+"""
+import threading
+import time
+
+from decouple import config
+from eth_abi import decode
+from web3 import Web3
+
+from .contracts import ERC20Contract, MarketplaceContract, MulticallContract
+
+FUNDS_CACHE_TTL = config('FUNDS_CACHE_TTL', default=300, cast=float)
+
+
+def funds_key(token_address, holder_address):
+    """
+    Build the cache key of a holder's funds.
+
+    Args:
+        token_address (str): The ERC20 address, in any case.
+        holder_address (str): The holder address, in any case.
+
+    Returns:
+        tuple: The lowercase token and holder addresses.
+    """
+    return token_address.lower(), holder_address.lower()
+
+
+class FundsCache:
+    """
+    ERC20 balances and marketplace allowances by (token, holder).
+
+    Attributes:
+        entries (dict): Key to the "balance", "allowance", the "block" they were
+            read at and when they were read, "fetchedAt".
+        spender_address (str): The spender whose allowances are cached.
+        ttl (float): Seconds an entry is trusted before it is read again.
+        fetches (int): Multicall reads made since the cache was created.
+    """
+
+    def __init__(self, multicall=None, spender_address=None, ttl=FUNDS_CACHE_TTL,
+                 clock=time.time):
+        """
+        Initialize an empty cache.
+
+        Args:
+            multicall (MulticallContract): The multicall to read with, created on
+                the first read if not given.
+            spender_address (str): The spender, the configured marketplace if not
+                given.
+            ttl (float): Seconds an entry is trusted before it is read again.
+            clock (callable): Returns the current time.
+        """
+        self.entries = {}
+        self.spender_address = Web3.to_checksum_address(
+            spender_address or MarketplaceContract.MARKETPLACE_ADDRESS)
+        self.ttl = ttl
+        self.fetches = 0
+        self._multicall = multicall
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def tokens(self):
+        """
+        Get the tokens whose events keep entries current.
+
+        Returns:
+            list: The lowercase token addresses.
+        """
+        with self._lock:
+            return sorted({token for token, _ in self.entries})
+
+    def get(self, token_address, holder_address):
+        """
+        Get a holder's balance and allowance, reading them if not cached.
+
+        Args:
+            token_address (str): The ERC20 address.
+            holder_address (str): The holder address.
+
+        Returns:
+            tuple: The balance and allowance, in the token's smallest unit.
+        """
+        key = funds_key(token_address, holder_address)
+        return self.get_many([key])[key]
+
+    def get_many(self, keys):
+        """
+        Get the balance and allowance of many holders, reading the missing and
+        expired ones with one call.
+
+        Args:
+            keys (list): (token, holder) keys, see `funds_key`.
+
+        Returns:
+            dict: Key to its (balance, allowance).
+        """
+        now = self._clock()
+        with self._lock:
+            stale = [key for key in dict.fromkeys(keys)
+                     if key not in self.entries
+                     or now - self.entries[key]["fetchedAt"] >= self.ttl]
+
+        fetched = self.fetch(stale) if stale else {}
+
+        with self._lock:
+            funds = {}
+            for key in keys:
+                entry = self.entries.get(key)
+                # An event may have dropped a fetched entry in the meantime
+                funds[key] = ((entry["balance"], entry["allowance"]) if entry
+                              else fetched[key])
+            return funds
+
+    def fetch(self, keys):
+        """
+        Read balances and allowances from the chain, with the block they are at.
+
+        Args:
+            keys (list): (token, holder) keys, see `funds_key`.
+
+        Returns:
+            dict: Key to its (balance, allowance).
+        """
+        if self._multicall is None:
+            self._multicall = MulticallContract()
+        multicall = self._multicall
+        erc20 = multicall.w3.eth.contract(abi=ERC20Contract.MOCK_ERC20_ABI)
+
+        calls = [(multicall.contract_address,
+                  multicall.contract.encodeABI(fn_name="getBlockNumber"))]
+        for token, holder in keys:
+            token = Web3.to_checksum_address(token)
+            holder = Web3.to_checksum_address(holder)
+            calls.append((token, erc20.encodeABI(
+                fn_name="balanceOf", args=[holder])))
+            calls.append((token, erc20.encodeABI(
+                fn_name="allowance", args=[holder, self.spender_address])))
+
+        results = multicall.aggregate(calls)
+        values = [decode(["uint256"], return_data)[0]
+                  if success and return_data else 0
+                  for success, return_data in results]
+        fetched_at = self._clock()
+
+        fetched = {key: (values[1 + 2 * i], values[2 + 2 * i])
+                   for i, key in enumerate(keys)}
+
+        with self._lock:
+            self.fetches += 1
+            for key, (balance, allowance) in fetched.items():
+                self.entries[key] = {
+                    "balance": balance,
+                    "allowance": allowance,
+                    "block": values[0],
+                    "fetchedAt": fetched_at,
+                }
+
+        return fetched
+
+    def apply(self, events):
+        """
+        Apply ERC20 events, oldest first, to the cached entries they touch.
+
+        Events at or before the block an entry was read at are already part of
+        it and are skipped.
+
+        Args:
+            events (list): Decoded Transfer and Approval events, see
+                `decode_erc20_event`.
+        """
+        spender = self.spender_address.lower()
+
+        with self._lock:
+            for event in events:
+                if event["event"] == "Transfer":
+                    self._move_balance(event, event["from"], -event["value"])
+                    self._move_balance(event, event["to"], event["value"])
+                elif event["to"].lower() == spender:
+                    entry = self._entry(event, event["from"])
+                    if entry:
+                        entry["allowance"] = event["value"]
+
+    def revert(self, events):
+        """
+        Drop the entries touched by events orphaned by a reorg, so they are read
+        again. The value an Approval replaced is not known.
+
+        Args:
+            events (list): The orphaned decoded events.
+        """
+        with self._lock:
+            for event in events:
+                for address in (event["from"], event["to"]):
+                    self.entries.pop(funds_key(event["token"], address), None)
+
+    def _entry(self, event, holder_address):
+        """
+        Get the entry an event applies to, if it is cached and older.
+        """
+        entry = self.entries.get(funds_key(event["token"], holder_address))
+        if entry and event["blockNumber"] > entry["block"]:
+            return entry
+        return None
+
+    def _move_balance(self, event, holder_address, amount):
+        """
+        Move the balance of an entry the event applies to.
+        """
+        entry = self._entry(event, holder_address)
+        if not entry:
+            return
+
+        entry["balance"] += amount
+        if entry["balance"] < 0:
+            # An event was missed, read the entry again
+            del self.entries[funds_key(event["token"], holder_address)]
+
+
+funds_cache = FundsCache()
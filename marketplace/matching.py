@@ -0,0 +1,196 @@
+"""
+Module for matching collection-wide offers with fixed-price listings.
+
+An offer buys any token of a collection for at most a price of an ERC20. Offers
+and listings rest in a book per (collection, ERC20): offers in a heap by highest
+price, listings in a heap by lowest price, both oldest first on equal prices.
+An incoming order is matched against the best resting order of the other side,
+so adding, matching and cancelling are O(log n). A match trades at the listing's
+price, which the buyer then pays through the purchase path.
+"""
+import heapq
+import itertools
+import threading
+
+
+def book_key(nft_collection_address, erc20_address):
+    """
+    Build the key of the book of a collection and ERC20.
+
+    Args:
+        nft_collection_address (str): The collection address, in any case.
+        erc20_address (str): The ERC20 address, in any case.
+
+    Returns:
+        tuple: The lowercase addresses.
+    """
+    return nft_collection_address.lower(), erc20_address.lower()
+
+
+class CollectionBook:
+    """
+    The resting offers and listings of one collection and ERC20.
+
+    Attributes:
+        offers (list): Heap of (negated price, arrival, offer ID).
+        listings (list): Heap of (price, arrival, listing, listing version).
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty book.
+        """
+        self.offers = []
+        self.listings = []
+
+
+class MatchingEngine:
+    """
+    Price-time priority matching of collection offers and listings.
+
+    Cancelled offers, listings that are no longer for sale and the entries of
+    repriced listings are left in their heap and dropped when they reach its top.
+
+    Attributes:
+        books (dict): `book_key` to its `CollectionBook`.
+        offers (dict): Offer ID to the resting offer.
+        is_open (callable): Tells if a resting listing can still be bought.
+    """
+
+    def __init__(self, is_open=None):
+        """
+        Initialize an empty engine.
+
+        Args:
+            is_open (callable): Called with a resting listing, returns False once
+                it can no longer be bought. Listings stay open if not given.
+        """
+        self.books = {}
+        self.offers = {}
+        self.is_open = is_open or (lambda listing: True)
+        self._offer_ids = itertools.count(1)
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def _book(self, order):
+        """
+        Get the book of an offer or listing, creating it if needed.
+        """
+        key = book_key(order["nft_collection_address"], order["erc20Address"])
+        book = self.books.get(key)
+        if book is None:
+            book = self.books[key] = CollectionBook()
+        return book
+
+    @staticmethod
+    def _match(offer, listing):
+        """
+        Build the matched pair of an offer and a listing.
+        """
+        return {
+            "offerId": offer["offerId"],
+            "sale_id": listing["sale_id"],
+            "nft_collection_address": listing["nft_collection_address"],
+            "tokenId": listing["tokenId"],
+            "erc20Address": listing["erc20Address"],
+            "erc20_amount": listing["erc20_amount"],
+            "buyerAddress": offer["buyerAddress"],
+            "ownerAddress": listing["ownerAddress"],
+        }
+
+    def add_offer(self, offer):
+        """
+        Match an offer with the cheapest open listing, or rest it in the book.
+
+        Args:
+            offer (dict): The offer, its "offerId" is set.
+
+        Returns:
+            dict: The matched pair, or None if the offer rests.
+        """
+        with self._lock:
+            offer["offerId"] = next(self._offer_ids)
+            book = self._book(offer)
+
+            while book.listings:
+                price, _, listing, version = book.listings[0]
+                if version != listing.get("version", 0) or \
+                        not self.is_open(listing):
+                    heapq.heappop(book.listings)
+                    continue
+                if price > offer["erc20_amount"]:
+                    break
+                heapq.heappop(book.listings)
+                return self._match(offer, listing)
+
+            self.offers[offer["offerId"]] = offer
+            heapq.heappush(book.offers, (
+                -offer["erc20_amount"], next(self._arrivals), offer["offerId"]))
+            return None
+
+    def add_listing(self, listing):
+        """
+        Match a fixed-price listing with the best offer, or rest it in the book.
+
+        A repriced listing is added again, its previous entry is then stale.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+
+        Returns:
+            dict: The matched pair, or None if the listing rests.
+        """
+        with self._lock:
+            book = self._book(listing)
+
+            while book.offers:
+                negated_price, _, offer_id = book.offers[0]
+                offer = self.offers.get(offer_id)
+                if offer is None:
+                    # Cancelled
+                    heapq.heappop(book.offers)
+                    continue
+                if -negated_price < listing["erc20_amount"]:
+                    break
+                heapq.heappop(book.offers)
+                del self.offers[offer_id]
+                return self._match(offer, listing)
+
+            heapq.heappush(book.listings, (
+                listing["erc20_amount"], next(self._arrivals), listing,
+                listing.get("version", 0)))
+            return None
+
+    def cancel_offer(self, offer_id):
+        """
+        Remove a resting offer.
+
+        Args:
+            offer_id (int): The offer identifier.
+
+        Returns:
+            dict: The cancelled offer, or None if it is not resting.
+        """
+        with self._lock:
+            return self.offers.pop(offer_id, None)
+
+    def resting_offers(self, nft_collection_address, erc20_address=None):
+        """
+        Get the resting offers of a collection.
+
+        Args:
+            nft_collection_address (str): The collection address, in any case.
+            erc20_address (str): Only the offers in this ERC20, any if not given.
+
+        Returns:
+            list: The offers, highest price first, oldest first on ties.
+        """
+        with self._lock:
+            ranked = []
+            for (collection, erc20), book in self.books.items():
+                if collection != nft_collection_address.lower() or (
+                        erc20_address and erc20 != erc20_address.lower()):
+                    continue
+                ranked += [entry for entry in book.offers
+                           if entry[2] in self.offers]
+            return [self.offers[offer_id] for _, _, offer_id in sorted(ranked)]
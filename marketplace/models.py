@@ -4,7 +4,9 @@ This module defines data models for the NFT marketplace.
 Here, the various database models related to the NFT marketplace are defined.
 """
 
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 # Create your models here.
 
@@ -14,7 +16,9 @@ class NFTListing(BaseModel):
     Data model representing an NFT listing.
 
     This model captures essential details about an NFT listing, including collection address,
-    token ID, price, auction status and owner address.
+    token ID, price, auction status and owner address. Auctions can have start and end
+    times, as Unix timestamps. Dutch listings have an end price, reached at their end
+    time, and a decay curve, "linear" or "exponential".
     """
 
     nft_collection_address: str
@@ -23,6 +27,10 @@ class NFTListing(BaseModel):
     erc20_amount: float
     isAuction: bool
     ownerAddress: str
+    startTime: Optional[int] = None
+    endTime: Optional[int] = None
+    endPrice: Optional[float] = None
+    decay: Optional[str] = None
 
 
 class NFTPurchaseIntent(BaseModel):
@@ -42,6 +50,61 @@ class NFTPurchaseIntent(BaseModel):
     sale_id: int
 
 
+class NFTCollectionOffer(BaseModel):
+    """
+    Data model representing an offer for any token of a collection.
+
+    This model captures the collection, the ERC20 and the highest amount the buyer
+    pays, and the buyer's signature over them.
+    """
+
+    nft_collection_address: str
+    erc20Address: str
+    erc20_amount: float
+    buyerSig: str
+    buyerAddress: str
+
+
+class NFTCollectionOfferCancel(BaseModel):
+    """
+    Data model representing the cancellation of a collection offer.
+
+    This model captures the offerId, the buyer address and the buyer's signature
+    over the cancellation of the offer.
+    """
+
+    offerId: int
+    buyerAddress: str
+    buyerSig: str
+
+
+class NFTListingCancel(BaseModel):
+    """
+    Data model representing the cancellation of an NFT listing.
+
+    This model captures the sale_id, the owner address and the owner's signature
+    over the cancellation of the listing's current version.
+    """
+
+    sale_id: int
+    ownerAddress: str
+    ownerSig: str
+
+
+class NFTListingUpdate(BaseModel):
+    """
+    Data model representing a new price for an NFT listing.
+
+    This model captures the sale_id, the new price, the owner address and the
+    owner's signature over the new price of the listing's current version.
+    """
+
+    sale_id: int
+    erc20_amount: float
+    ownerAddress: str
+    ownerSig: str
+
+
 class NFTSettle(BaseModel):
     """
     Data model representing an intent to settle an NFT.
@@ -53,3 +116,73 @@ class NFTSettle(BaseModel):
     sale_id: int
     owner_approval_sig: str
     owner_address: str
+
+
+class NFTSettleBatch(BaseModel):
+    """
+    Data model representing a batch of NFT settlements.
+
+    This model captures a list of settlement requests, each one with the same
+    fields as a single settlement.
+    """
+
+    settlements: list[NFTSettle]
+
+
+class NFTTransfer(BaseModel):
+    """
+    Data model representing a decoded ERC721 Transfer event.
+
+    This model captures the token that moved, its sender and receiver, and the
+    transaction hash and log index identifying the event.
+    """
+
+    collection: str
+    sender: str = Field(alias="from")
+    to: str
+    tokenId: int
+    transactionHash: str
+    logIndex: int
+
+
+class NFTTransferEvents(BaseModel):
+    """
+    Data model representing a batch of Transfer events pushed by the listener.
+
+    This model captures the newly seen transfers and the transfers orphaned by
+    a reorg.
+    """
+
+    transfers: list[NFTTransfer] = []
+    reverted: list[NFTTransfer] = []
+
+
+class ERC20Event(BaseModel):
+    """
+    Data model representing a decoded ERC20 Transfer or Approval event.
+
+    This model captures the token, the event name, the sender or owner, the
+    receiver or spender, the amount and the block, transaction hash and log
+    index identifying the event.
+    """
+
+    token: str
+    event: str
+    sender: str = Field(alias="from")
+    to: str
+    value: int
+    blockNumber: int
+    transactionHash: str
+    logIndex: int
+
+
+class ERC20Events(BaseModel):
+    """
+    Data model representing a batch of ERC20 events pushed by the listener.
+
+    This model captures the newly seen events and the events orphaned by a
+    reorg.
+    """
+
+    events: list[ERC20Event] = []
+    reverted: list[ERC20Event] = []
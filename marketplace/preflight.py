@@ -0,0 +1,192 @@
+"""
+Module for checking settlements against the chain before they are submitted.
+
+A settlement reverts, after spending gas, when the buyer cannot pay or the seller
+can no longer deliver. These conditions are read for a whole batch with a single
+Multicall3 call, and can optionally be confirmed with an eth_call dry run.
+"""
+from eth_abi import decode
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+from .contracts import ERC20Contract, ERC721Contract
+from .contracts import MarketplaceContract, MulticallContract
+
+
+def settlement_bidder_address(intent):
+    """
+    Get the address paying for an intent.
+
+    Args:
+        intent (dict): A purchase or bid intent.
+
+    Returns:
+        str: The bidder address of a bid, or the buyer address of a purchase.
+    """
+    return intent.get("bidderAddress") or intent["buyerAddress"]
+
+
+class SettlementPreflight:
+    """
+    Batched on-chain precondition checks for pending settlements.
+
+    For every settlement it checks the buyer's ERC20 balance and marketplace
+    allowance, the seller's ownership of the token and the seller's
+    setApprovalForAll to the marketplace.
+
+    Attributes:
+        multicall (MulticallContract): The contract used to aggregate the reads.
+        marketplace_address (str): The spender and operator being checked.
+    """
+
+    def __init__(self, multicall=None, marketplace_address=None):
+        """
+        Initialize the preflight.
+
+        Args:
+            multicall (MulticallContract): The multicall to use, a new one if not given.
+            marketplace_address (str): The marketplace address, the configured one
+                if not given.
+        """
+        self.multicall = multicall or MulticallContract()
+        self.marketplace_address = (
+            marketplace_address or MarketplaceContract.MARKETPLACE_ADDRESS)
+        self._erc20 = self.multicall.w3.eth.contract(
+            abi=ERC20Contract.MOCK_ERC20_ABI)
+        self._erc721 = self.multicall.w3.eth.contract(
+            abi=ERC721Contract.MOCK_ERC721_ABI)
+
+    def _read_calls(self, settlements):
+        """
+        Build the deduplicated reads needed by the settlements.
+
+        Returns:
+            dict: Read key to (target address, encoded call data), in insertion order.
+        """
+        reads = {}
+
+        for settlement in settlements:
+            intent = settlement["intent"]
+            erc20_address = Web3.to_checksum_address(intent["erc20Address"])
+            nft_address = Web3.to_checksum_address(
+                intent["nft_collection_address"])
+            bidder = Web3.to_checksum_address(
+                settlement_bidder_address(intent))
+            owner = Web3.to_checksum_address(settlement["owner_address"])
+            token_id = int(intent["tokenId"])
+
+            reads.setdefault(
+                ("balanceOf", erc20_address, bidder),
+                (erc20_address, self._erc20.encodeABI(
+                    fn_name="balanceOf", args=[bidder])))
+            reads.setdefault(
+                ("allowance", erc20_address, bidder),
+                (erc20_address, self._erc20.encodeABI(
+                    fn_name="allowance",
+                    args=[bidder, self.marketplace_address])))
+            reads.setdefault(
+                ("ownerOf", nft_address, token_id),
+                (nft_address, self._erc721.encodeABI(
+                    fn_name="ownerOf", args=[token_id])))
+            reads.setdefault(
+                ("isApprovedForAll", nft_address, owner),
+                (nft_address, self._erc721.encodeABI(
+                    fn_name="isApprovedForAll",
+                    args=[owner, self.marketplace_address])))
+
+        return reads
+
+    def check(self, settlements):
+        """
+        Check the on-chain preconditions of many settlements with one call.
+
+        Settlements are checked in order, and a buyer's balance and allowance are
+        consumed by their earlier settlements in the same batch.
+
+        Args:
+            settlements (list): Dicts holding the "intent" to settle and the
+                "owner_address" approving it.
+
+        Returns:
+            list: An error message per settlement, None if it can be settled.
+        """
+        if not settlements:
+            return []
+
+        reads = self._read_calls(settlements)
+        results = self.multicall.aggregate(list(reads.values()))
+        values = {}
+
+        output_types = {
+            "balanceOf": "uint256",
+            "allowance": "uint256",
+            "ownerOf": "address",
+            "isApprovedForAll": "bool",
+        }
+        for key, (success, return_data) in zip(reads, results):
+            if success and return_data:
+                values[key] = decode([output_types[key[0]]], return_data)[0]
+            else:
+                values[key] = None
+
+        errors = []
+        for settlement in settlements:
+            intent = settlement["intent"]
+            erc20_address = Web3.to_checksum_address(intent["erc20Address"])
+            nft_address = Web3.to_checksum_address(
+                intent["nft_collection_address"])
+            bidder = Web3.to_checksum_address(
+                settlement_bidder_address(intent))
+            owner = Web3.to_checksum_address(settlement["owner_address"])
+            amount = int(intent["erc20_amount"])
+
+            balance_key = ("balanceOf", erc20_address, bidder)
+            allowance_key = ("allowance", erc20_address, bidder)
+            token_owner = values[("ownerOf", nft_address, int(intent["tokenId"]))]
+            approved = values[("isApprovedForAll", nft_address, owner)]
+
+            if token_owner is None:
+                errors.append("Token does not exist")
+            elif Web3.to_checksum_address(token_owner) != owner:
+                errors.append("Seller no longer owns the token")
+            elif not approved:
+                errors.append("Seller has not approved the marketplace")
+            elif values[balance_key] is None or values[balance_key] < amount:
+                errors.append("Buyer ERC20 balance is too low")
+            elif values[allowance_key] is None or values[allowance_key] < amount:
+                errors.append("Buyer ERC20 allowance is too low")
+            else:
+                values[balance_key] -= amount
+                values[allowance_key] -= amount
+                errors.append(None)
+
+        return errors
+
+    @staticmethod
+    def dry_run(marketplace_contract, settlement):
+        """
+        Dry run a settlement's finishAuction with eth_call.
+
+        Args:
+            marketplace_contract (MarketplaceContract): The marketplace to call.
+            settlement (dict): The "intent", "bidderSig", "owner_approval_sig" and
+                "owner_address" of the settlement.
+
+        Returns:
+            str: The revert reason, or None if the settlement would succeed.
+        """
+        intent = settlement["intent"]
+
+        try:
+            marketplace_contract.simulate_finish_auction(
+                intent["nft_collection_address"],
+                intent["tokenId"],
+                intent["erc20Address"],
+                intent["erc20_amount"],
+                settlement["bidderSig"],
+                settlement["owner_approval_sig"],
+                settlement["owner_address"])
+        except ContractLogicError as e:
+            return f"Settlement would revert: {e}"
+
+        return None
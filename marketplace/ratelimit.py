@@ -0,0 +1,187 @@
+"""
+Module for admitting write requests through per-client token buckets.
+
+Every limited endpoint has a bucket per client IP and per address, refilled at
+the endpoint's rate up to its burst. A request takes one token from each of the
+buckets it is admitted through, or none if any is empty. The buckets are kept in
+a local SQLite database, so every worker process of the host draws from the same
+buckets, and are updated in one immediate transaction, so two workers cannot
+spend the same token. The IP bucket admits a request before anything costly
+runs, so a flood from one client burns neither RPC calls nor signature
+recoveries. The address bucket is only charged once the address is verified, so
+a client cannot drain the bucket of an address it does not hold.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from decouple import config
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# endpoint:tokens per second:burst, comma separated
+DEFAULT_RATE_LIMITS = (
+    "list_nft:1:10,purchase_order:5:20,bid_order:5:20,collection_offers:5:20,"
+    "cancel_offer:1:10,cancel_listing:1:10,update_listing:1:10,settle_purchase_order:1:5,"
+    "settle_auction_order:1:5,settle_batch:0.2:2")
+# Buckets are pruned once every this many admissions
+PRUNE_EVERY = 1000
+# Relative to the project root, empty to admit every request
+DEFAULT_DB_PATH = "ratelimit.sqlite3"
+
+
+def parse_limits(value):
+    """
+    Parse a list of endpoint limits.
+
+    Args:
+        value (str): Comma separated endpoint:tokens per second:burst items.
+
+    Returns:
+        dict: Endpoint name to its (tokens per second, burst) tuple.
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        endpoint, rate, burst = item.strip().split(":")
+        if float(rate) <= 0 or float(burst) < 1:
+            raise ValueError(f"Invalid rate limit: {item}")
+        limits[endpoint] = (float(rate), float(burst))
+    return limits
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets per endpoint and client, stored in SQLite.
+
+    A missing bucket is full, so only the buckets of recent clients are stored.
+
+    Attributes:
+        path (str): The SQLite database path.
+        limits (dict): Endpoint name to its (tokens per second, burst) tuple,
+            endpoints not in it are not limited.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL);
+    """
+
+    def __init__(self, path, limits):
+        """
+        Open the buckets, creating their table if needed.
+
+        Args:
+            path (str): The SQLite database path.
+            limits (dict): Endpoint name to its (tokens per second, burst) tuple.
+        """
+        self.path = path
+        self.limits = limits
+        self._admissions = 0
+        self._lock = threading.Lock()
+        # Transactions are opened explicitly, see `acquire`
+        self._db = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False)
+        # Every worker writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+
+    def acquire(self, endpoint, clients, now=None):
+        """
+        Take a token from the bucket of each client of a request.
+
+        Args:
+            endpoint (str): The endpoint name.
+            clients (list): The client identities, such as "ip:1.2.3.4" or
+                "address:0xabc...". Empty ones are skipped.
+            now (float): The current time, time.time() if not given.
+
+        Returns:
+            float: 0 if the request is admitted, or the seconds until every
+            bucket has a token again.
+        """
+        limit = self.limits.get(endpoint)
+        keys = [f"{endpoint}|{client}" for client in clients if client]
+        if limit is None or not keys:
+            return 0
+        rate, burst = limit
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            # Taken for writing at once, other workers wait for the commit
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                stored = {
+                    key: (tokens, updated_at) for key, tokens, updated_at in
+                    self._db.execute(
+                        "SELECT key, tokens, updated_at FROM buckets WHERE key IN "
+                        f"({','.join('?' * len(keys))})", keys)}
+
+                levels = {}
+                for key in keys:
+                    tokens, updated_at = stored.get(key, (burst, now))
+                    levels[key] = min(
+                        burst, tokens + max(now - updated_at, 0) * rate)
+
+                wait = max((1 - tokens) / rate for tokens in levels.values())
+                if wait > 0:
+                    self._db.execute("ROLLBACK")
+                    return wait
+
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) "
+                    "VALUES (?, ?, ?)",
+                    [(key, tokens - 1, now) for key, tokens in levels.items()])
+
+                self._admissions += 1
+                if self._admissions % PRUNE_EVERY == 0:
+                    self._prune(now)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+        return 0
+
+    def _prune(self, now):
+        """
+        Delete the buckets refilled to their burst, as good as missing ones.
+        """
+        full_after = max((burst / rate for rate, burst in self.limits.values()),
+                         default=0)
+        self._db.execute(
+            "DELETE FROM buckets WHERE updated_at < ?", (now - full_after,))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Get the process-wide limiter from the configuration.
+
+    Returns:
+        TokenBucketLimiter: The shared limiter, or None if RATE_LIMIT_DB_PATH is
+        set empty.
+    """
+    global _limiter
+
+    path = config('RATE_LIMIT_DB_PATH', default=DEFAULT_DB_PATH)
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+
+    with _limiter_lock:
+        if _limiter is None or _limiter.path != path:
+            _limiter = TokenBucketLimiter(
+                path, parse_limits(
+                    config('RATE_LIMITS', default=DEFAULT_RATE_LIMITS)))
+
+    return _limiter
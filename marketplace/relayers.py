@@ -0,0 +1,178 @@
+"""
+Module for managing the relayer accounts that submit settlement transactions.
+
+Settlements only carry the buyer and owner signatures, so any account can send
+them to the Marketplace contract. Spreading them over a pool of relayers gives
+each settlement its own nonce stream instead of queueing behind the owner's.
+"""
+import threading
+import time
+
+from decouple import config, Csv
+from eth_account import Account
+
+ROUND_ROBIN = "round_robin"
+LEAST_PENDING = "least_pending"
+RELAYER_SYNC_SECONDS = config('RELAYER_SYNC_SECONDS', default=5, cast=float)
+
+
+class RelayerPool:
+    """
+    A pool of relayer accounts with per-key nonce tracking.
+
+    Attributes:
+        accounts (list): The relayer accounts, in the configured order.
+        strategy (str): How the next relayer is picked, either ``round_robin``
+            or ``least_pending``.
+        sync_seconds (float): How often the pending counters are reconciled
+            with the mined nonces, see `sync`.
+    """
+
+    STRATEGIES = (ROUND_ROBIN, LEAST_PENDING)
+
+    def __init__(self, w3, private_keys, strategy=ROUND_ROBIN,
+                 sync_seconds=RELAYER_SYNC_SECONDS):
+        """
+        Initialize the pool.
+
+        Args:
+            w3 (Web3): The web3 instance used to read on-chain nonces.
+            private_keys (list): Private keys of the relayer accounts.
+            strategy (str): The relayer selection strategy.
+            sync_seconds (float): How often the pending counters are reconciled.
+
+        Raises:
+            ValueError: If no keys are given or the strategy is unknown.
+        """
+        if not private_keys:
+            raise ValueError("A relayer pool needs at least one private key")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown relayer strategy: {strategy}")
+
+        self.w3 = w3
+        self.strategy = strategy
+        self.sync_seconds = sync_seconds
+        self.accounts = [Account.from_key(key) for key in private_keys]
+        self._next_nonce = {}
+        self._pending = {account.address: 0 for account in self.accounts}
+        self._cursor = 0
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _select(self):
+        """
+        Pick the next relayer account according to the strategy.
+
+        Returns:
+            LocalAccount: The selected relayer account.
+        """
+        if self.strategy == LEAST_PENDING:
+            return min(self.accounts,
+                       key=lambda account: self._pending[account.address])
+
+        account = self.accounts[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self.accounts)
+        return account
+
+    def acquire(self):
+        """
+        Reserve a relayer and its next nonce.
+
+        The on-chain nonce is read once per relayer, afterwards nonces are
+        handed out locally so concurrent settlements never share one. Mined
+        transactions are only released by `sync`, run here every sync_seconds,
+        so the pending counters stay the in-flight transactions.
+
+        Returns:
+            tuple: The relayer account and the reserved nonce.
+        """
+        if time.monotonic() - self._synced_at >= self.sync_seconds:
+            self.sync()
+
+        with self._lock:
+            account = self._select()
+            address = account.address
+
+            if address not in self._next_nonce:
+                self._next_nonce[address] = self.w3.eth.get_transaction_count(
+                    address, 'pending')
+
+            nonce = self._next_nonce[address]
+            self._next_nonce[address] = nonce + 1
+            self._pending[address] += 1
+
+        return account, nonce
+
+    def release(self, address, failed=False):
+        """
+        Release a relayer slot once its transaction is mined or dropped.
+
+        Args:
+            address (str): The relayer address.
+            failed (bool): True if the transaction never reached the network.
+                The nonce cache is then dropped and re-read on the next use,
+                so the gap left by the unused nonce is filled.
+        """
+        with self._lock:
+            self._pending[address] = max(0, self._pending[address] - 1)
+            if failed:
+                self._next_nonce.pop(address, None)
+
+    def sync(self):
+        """
+        Reconcile the pending counters with the mined nonces on chain.
+        """
+        with self._lock:
+            self._synced_at = time.monotonic()
+            addresses = list(self._next_nonce)
+
+        # Read without the lock, acquire keeps handing out nonces meanwhile
+        mined = {address: self.w3.eth.get_transaction_count(address, 'latest')
+                 for address in addresses}
+
+        with self._lock:
+            for address, mined_nonce in mined.items():
+                next_nonce = self._next_nonce.get(address)
+                if next_nonce is not None:
+                    self._pending[address] = max(0, next_nonce - mined_nonce)
+
+    def pending(self):
+        """
+        Get the number of in-flight transactions per relayer.
+
+        Returns:
+            dict: Relayer address to pending transaction count.
+        """
+        with self._lock:
+            return dict(self._pending)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_relayer_pool(w3):
+    """
+    Get the process-wide relayer pool built from the configuration.
+
+    Args:
+        w3 (Web3): The web3 instance used if the pool has to be created.
+
+    Returns:
+        RelayerPool: The shared pool, or None if no relayer keys are configured.
+    """
+    global _pool
+
+    private_keys = config('RELAYER_PRIVATE_KEYS', default='', cast=Csv())
+    if not private_keys:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = RelayerPool(
+                w3,
+                private_keys,
+                config('RELAYER_STRATEGY', default=ROUND_ROBIN),
+                RELAYER_SYNC_SECONDS)
+
+    return _pool
@@ -0,0 +1,133 @@
+"""
+Module for queueing the buyers of a fixed-price listing.
+
+The first buyer of a sale holds a reservation, its purchase intent, for a limited
+lease. Later buyers wait in a first-in, first-out queue behind it. When the lease
+expires or the settlement fails, the holder is released and the next buyer is
+promoted with a new lease, so an abandoned intent no longer blocks the listing.
+Lease deadlines are kept in a timer wheel, so expiring them scans nothing.
+"""
+from collections import deque
+
+from decouple import config
+
+PURCHASE_LEASE_SECONDS = config('PURCHASE_LEASE_SECONDS', default=900, cast=float)
+PURCHASE_QUEUE_SIZE = config('PURCHASE_QUEUE_SIZE', default=100, cast=int)
+
+
+class ReservationQueue:
+    """
+    The leases of the purchase intents holding a sale, and the buyers waiting
+    behind them.
+
+    It is not locked itself, the caller holds the lock of the sale.
+
+    Attributes:
+        leases (dict): Sale ID to the deadline of its holder's lease.
+        waiting (dict): Sale ID to its waiting purchase intents, oldest first.
+        lease_seconds (float): How long a holder keeps a sale.
+        max_waiting (int): The most buyers waiting for a sale.
+    """
+
+    def __init__(self, lease_seconds=PURCHASE_LEASE_SECONDS,
+                 max_waiting=PURCHASE_QUEUE_SIZE):
+        """
+        Initialize an empty queue.
+
+        Args:
+            lease_seconds (float): How long a holder keeps a sale.
+            max_waiting (int): The most buyers waiting for a sale.
+        """
+        self.leases = {}
+        self.waiting = {}
+        self.lease_seconds = lease_seconds
+        self.max_waiting = max_waiting
+
+    def lease(self, sale_id, now):
+        """
+        Start the lease of a sale's new holder.
+
+        Args:
+            sale_id (int): The listing identifier.
+            now (float): The current time.
+
+        Returns:
+            float: The deadline of the lease.
+        """
+        deadline = self.leases[sale_id] = now + self.lease_seconds
+        return deadline
+
+    def is_expired(self, sale_id, now):
+        """
+        Check if the lease of a sale is over.
+
+        Args:
+            sale_id (int): The listing identifier.
+            now (float): The current time.
+
+        Returns:
+            bool: True if the sale has a lease and it ended.
+        """
+        deadline = self.leases.get(sale_id)
+        return deadline is not None and now >= deadline
+
+    def enqueue(self, purchase_intent):
+        """
+        Queue a purchase intent behind the holder of its sale.
+
+        Args:
+            purchase_intent (dict): The purchase intent.
+
+        Returns:
+            int: Its position in the queue, from 1, or None if the queue is full.
+        """
+        waiting = self.waiting.setdefault(purchase_intent["sale_id"], deque())
+        if len(waiting) >= self.max_waiting:
+            return None
+        waiting.append(purchase_intent)
+        return len(waiting)
+
+    def is_waiting(self, sale_id, buyer_address):
+        """
+        Check if a buyer is waiting for a sale.
+
+        Args:
+            sale_id (int): The listing identifier.
+            buyer_address (str): The buyer address, in any case.
+
+        Returns:
+            bool: True if one of the waiting intents is the buyer's.
+        """
+        return any(intent["buyerAddress"].lower() == buyer_address.lower()
+                   for intent in self.waiting.get(sale_id, ()))
+
+    def promote(self, sale_id):
+        """
+        Take the next waiting purchase intent of a sale.
+
+        Args:
+            sale_id (int): The listing identifier.
+
+        Returns:
+            dict: The oldest waiting intent, or None if nobody waits.
+        """
+        waiting = self.waiting.get(sale_id)
+        if not waiting:
+            return None
+        promoted = waiting.popleft()
+        if not waiting:
+            del self.waiting[sale_id]
+        return promoted
+
+    def end(self, sale_id):
+        """
+        Drop the lease and the waiting buyers of a sale that is over.
+
+        Args:
+            sale_id (int): The listing identifier.
+
+        Returns:
+            list: The dropped waiting intents.
+        """
+        self.leases.pop(sale_id, None)
+        return list(self.waiting.pop(sale_id, ()))
@@ -0,0 +1,427 @@
+"""
+Module for keeping collection statistics up to date as the book changes.
+
+Statistics are kept per collection and ERC20, since prices in different tokens
+cannot be compared: the open listings, the floor price of the fixed-price
+listings that can still be bought, the best live bid and the settled volume.
+They are updated on every listing, intent, bid and settlement, so reading them
+never scans the book.
+
+The price of a Dutch listing changes with time, so it is indexed by its end
+price, the lowest it can reach, and by its start price, the highest. The floor
+and price range queries only evaluate the Dutch listings that these bounds
+cannot rule out.
+"""
+import bisect
+import threading
+import time
+
+from .dutch import current_price, is_dutch
+
+
+class SortedMultiset:
+    """
+    A sorted list of values that may repeat.
+
+    Finding a value is a binary search, and the smallest and largest values are
+    read in O(1).
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty multiset.
+        """
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def add(self, value):
+        """
+        Add a value.
+
+        Args:
+            value (float): The value.
+        """
+        bisect.insort(self._values, value)
+
+    def remove(self, value):
+        """
+        Remove one occurrence of a value.
+
+        Args:
+            value (float): The value, which must be in the multiset.
+        """
+        del self._values[bisect.bisect_left(self._values, value)]
+
+    def min(self):
+        """
+        Get the smallest value, or None if empty.
+        """
+        return self._values[0] if self._values else None
+
+    def max(self):
+        """
+        Get the largest value, or None if empty.
+        """
+        return self._values[-1] if self._values else None
+
+    def _bounds(self, low, high):
+        """
+        Get the positions of the first and past the last tuple whose key is in a
+        range.
+        """
+        start = 0 if low is None else bisect.bisect_left(self._values, (low,))
+        end = len(self._values) if high is None else bisect.bisect_right(
+            self._values, (high, float("inf")))
+        return start, max(start, end)
+
+    def between(self, low, high):
+        """
+        Get the (key, ...) tuples whose key is in a range.
+
+        Args:
+            low (float): The lowest key, unbounded if None.
+            high (float): The highest key, unbounded if None.
+
+        Returns:
+            list: The tuples, sorted.
+        """
+        start, end = self._bounds(low, high)
+        return self._values[start:end]
+
+    def count_between(self, low, high):
+        """
+        Count the (key, ...) tuples whose key is in a range, without copying
+        them.
+
+        Args:
+            low (float): The lowest key, unbounded if None.
+            high (float): The highest key, unbounded if None.
+
+        Returns:
+            int: The number of tuples.
+        """
+        start, end = self._bounds(low, high)
+        return end - start
+
+
+class CollectionStats:
+    """
+    The statistics of one collection in one ERC20.
+
+    Attributes:
+        open_count (int): Listings open for their token.
+        prices (SortedMultiset): (price, sale ID) of the fixed-price listings
+            still for sale.
+        dutch (SortedMultiset): (end price, sale ID) of the Dutch listings still
+            for sale.
+        dutch_starts (SortedMultiset): (start price, sale ID) of the same Dutch
+            listings.
+        dutch_listings (dict): Sale ID to the Dutch listings still for sale.
+        bids (SortedMultiset): Best bid of every auction still taking bids.
+        volume (float): Amount of the settled sales.
+        settled_count (int): Settled sales.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty statistics.
+        """
+        self.open_count = 0
+        self.prices = SortedMultiset()
+        self.dutch = SortedMultiset()
+        self.dutch_starts = SortedMultiset()
+        self.dutch_listings = {}
+        self.bids = SortedMultiset()
+        self.volume = 0
+        self.settled_count = 0
+
+    def floor_price(self, now):
+        """
+        Get the lowest price of the listings still for sale.
+
+        Dutch listings are visited by end price, and only until their end price
+        cannot beat the floor found so far.
+
+        Args:
+            now (float): The time to price Dutch listings at.
+
+        Returns:
+            float: The floor price, or None if nothing is for sale.
+        """
+        lowest = self.prices.min()
+        floor = lowest[0] if lowest else None
+
+        for end_price, sale_id in self.dutch:
+            if floor is not None and end_price >= floor:
+                break
+            price = current_price(self.dutch_listings[sale_id], now)
+            floor = price if floor is None else min(floor, price)
+
+        return floor
+
+    def for_sale(self, low, high, now):
+        """
+        Get the listings still for sale in a price range.
+
+        Args:
+            low (float): The lowest price, unbounded if None.
+            high (float): The highest price, unbounded if None.
+            now (float): The time to price Dutch listings at.
+
+        Returns:
+            list: (price, sale ID) tuples, cheapest first.
+        """
+        found = list(self.prices.between(low, high))
+
+        # A Dutch listing is priced between its end and start prices, so only
+        # the ones ending under the range's top and starting over its bottom
+        # can be in it. The narrower of the two indexes is scanned.
+        if self.dutch_starts.count_between(low, None) < \
+                self.dutch.count_between(None, high):
+            candidates = self.dutch_starts.between(low, None)
+        else:
+            candidates = self.dutch.between(None, high)
+
+        for _, sale_id in candidates:
+            listing = self.dutch_listings[sale_id]
+            if (high is not None and listing["endPrice"] > high) or \
+                    (low is not None and listing["erc20_amount"] < low):
+                continue
+            price = current_price(listing, now)
+            if (low is None or price >= low) and (high is None or price <= high):
+                found.append((price, sale_id))
+
+        return sorted(found)
+
+    def as_dict(self, now):
+        """
+        Get the statistics as a JSON-serializable dict.
+
+        Args:
+            now (float): The time to price Dutch listings at.
+
+        Returns:
+            dict: The open count, floor price, best bid, volume and settled count.
+        """
+        return {
+            "openCount": self.open_count,
+            "floorPrice": self.floor_price(now),
+            "bestBid": self.bids.max(),
+            "volume": self.volume,
+            "settledCount": self.settled_count,
+        }
+
+
+class StatsBook:
+    """
+    The statistics of every collection, updated by the book.
+
+    Each sale remembers what it contributes, so updates are idempotent and a
+    sale is counted in the floor or the best bids at most once.
+
+    Attributes:
+        by_collection (dict): Lowercase collection to lowercase ERC20 to its
+            `CollectionStats`.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty statistics.
+        """
+        self.by_collection = {}
+        self._sales = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, listing):
+        """
+        Get the statistics a listing counts in, creating them if needed.
+        """
+        erc20s = self.by_collection.setdefault(
+            listing["nft_collection_address"].lower(), {})
+        stats = erc20s.get(listing["erc20Address"].lower())
+        if stats is None:
+            stats = erc20s[listing["erc20Address"].lower()] = CollectionStats()
+        return stats
+
+    def _sale(self, listing):
+        """
+        Get what a sale contributes, creating its entry if needed.
+        """
+        sale = self._sales.get(listing["sale_id"])
+        if sale is None:
+            sale = self._sales[listing["sale_id"]] = {
+                "stats": self._stats(listing), "open": False, "price": None,
+                "dutch": None, "dutch_start": None, "bid": None,
+                "settled": False}
+        return sale
+
+    @staticmethod
+    def _withdraw(sale):
+        """
+        Remove a sale from the floor and the best bids.
+        """
+        if sale["price"] is not None:
+            sale["stats"].prices.remove(sale["price"])
+            sale["price"] = None
+        if sale["dutch"] is not None:
+            sale["stats"].dutch.remove(sale["dutch"])
+            sale["stats"].dutch_starts.remove(sale["dutch_start"])
+            del sale["stats"].dutch_listings[sale["dutch"][1]]
+            sale["dutch"] = sale["dutch_start"] = None
+        if sale["bid"] is not None:
+            sale["stats"].bids.remove(sale["bid"])
+            sale["bid"] = None
+
+    def open(self, listing, available=True, best_bid=None):
+        """
+        Count a listing as open.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+            available (bool): False if it already has a purchase intent.
+            best_bid (float): The best bid of an auction, if any.
+        """
+        with self._lock:
+            sale = self._sale(listing)
+            if sale["open"] or sale["settled"]:
+                return
+
+            sale["open"] = True
+            sale["stats"].open_count += 1
+            if not available or listing.get("closedAt"):
+                return
+            if is_dutch(listing):
+                sale["dutch"] = (listing["endPrice"], listing["sale_id"])
+                sale["dutch_start"] = (listing["erc20_amount"], listing["sale_id"])
+                sale["stats"].dutch.add(sale["dutch"])
+                sale["stats"].dutch_starts.add(sale["dutch_start"])
+                sale["stats"].dutch_listings[listing["sale_id"]] = listing
+            elif not listing["isAuction"]:
+                sale["price"] = (listing["erc20_amount"], listing["sale_id"])
+                sale["stats"].prices.add(sale["price"])
+            elif best_bid is not None:
+                sale["bid"] = best_bid
+                sale["stats"].bids.add(best_bid)
+
+    def close(self, listing):
+        """
+        Stop counting a listing as open.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+        """
+        with self._lock:
+            sale = self._sale(listing)
+            self._withdraw(sale)
+            if sale["open"]:
+                sale["open"] = False
+                sale["stats"].open_count -= 1
+
+    def forget(self, listing):
+        """
+        Stop counting a listing and drop what is kept for its sale, once it is
+        removed from the book. Its settled volume is kept.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+        """
+        with self._lock:
+            sale = self._sales.pop(listing["sale_id"], None)
+            if sale is None:
+                return
+            self._withdraw(sale)
+            if sale["open"]:
+                sale["stats"].open_count -= 1
+
+    def take(self, listing):
+        """
+        Remove a listing from the floor and the best bids, once it has a purchase
+        intent or its auction stopped taking bids. It stays open.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+        """
+        with self._lock:
+            self._withdraw(self._sale(listing))
+
+    def bid(self, listing, amount):
+        """
+        Replace the best bid of an open auction.
+
+        Args:
+            listing (dict): The auction listing.
+            amount (float): The new best bid.
+        """
+        with self._lock:
+            sale = self._sale(listing)
+            if not sale["open"] or listing.get("closedAt"):
+                return
+            if sale["bid"] is not None:
+                sale["stats"].bids.remove(sale["bid"])
+            sale["bid"] = amount
+            sale["stats"].bids.add(amount)
+
+    def settle(self, listing, amount):
+        """
+        Add a settled sale to the volume, once.
+
+        Args:
+            listing (dict): The listing, as stored in the book.
+            amount (float): The settled amount.
+
+        Returns:
+            bool: False if the sale was already settled.
+        """
+        with self._lock:
+            sale = self._sale(listing)
+            self._withdraw(sale)
+            if sale["settled"]:
+                return False
+
+            sale["settled"] = True
+            sale["stats"].volume += amount
+            sale["stats"].settled_count += 1
+            return True
+
+    def collection(self, nft_collection_address, now=None):
+        """
+        Get the statistics of a collection.
+
+        Args:
+            nft_collection_address (str): The collection address, in any case.
+            now (float): The time to price Dutch listings at, now if not given.
+
+        Returns:
+            dict: Lowercase ERC20 address to its statistics.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return {erc20: stats.as_dict(now) for erc20, stats in
+                    self.by_collection.get(
+                        nft_collection_address.lower(), {}).items()}
+
+    def for_sale(self, nft_collection_address, erc20_address, low=None,
+                 high=None, now=None):
+        """
+        Get the listings of a collection still for sale in a price range.
+
+        Args:
+            nft_collection_address (str): The collection address, in any case.
+            erc20_address (str): The ERC20 of the prices, in any case.
+            low (float): The lowest price, unbounded if None.
+            high (float): The highest price, unbounded if None.
+            now (float): The time to price Dutch listings at, now if not given.
+
+        Returns:
+            list: (price, sale ID) tuples, cheapest first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            stats = self.by_collection.get(
+                nft_collection_address.lower(), {}).get(erc20_address.lower())
+            return stats.for_sale(low, high, now) if stats else []
@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import time
+from decouple import config
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+from marketplace.auctions import TimerWheel
+
+# Configuration, the clock is simulated so the run takes seconds
+AUCTIONS = config('BENCH_AUCTIONS', default=100000, cast=int)
+DURATION = config('BENCH_AUCTION_DURATION', default=86400, cast=int)
+TICKS = config('BENCH_TICKS', default=3600, cast=int)
+EXTENSIONS_PER_TICK = config('BENCH_EXTENSIONS_PER_TICK', default=20, cast=int)
+
+
+def main():
+    start = 1700000000
+    wheel = TimerWheel(tick=1, slots=4096, start=start)
+    random.seed(1)
+
+    ends = {sale_id: start + random.randint(60, DURATION)
+            for sale_id in range(AUCTIONS)}
+
+    cpu = time.process_time()
+    for sale_id, end in ends.items():
+        wheel.schedule(sale_id, end)
+    elapsed = time.process_time() - cpu
+    print(f"Scheduled {AUCTIONS} auctions in {elapsed:.2f}s CPU")
+
+    cpu = time.process_time()
+    closed = set()
+    extended = 0
+    for tick in range(1, TICKS + 1):
+        now = start + tick
+        # Late bids on random auctions, the ones ending within 5 minutes are
+        # extended as anti-sniping does
+        for _ in range(EXTENSIONS_PER_TICK):
+            sale_id = random.randrange(AUCTIONS)
+            if sale_id not in closed and ends[sale_id] - now < 300:
+                ends[sale_id] = now + 300
+                wheel.schedule(sale_id, ends[sale_id])
+                extended += 1
+        closed.update(wheel.advance(now))
+    elapsed = time.process_time() - cpu
+
+    print(f"Simulated {TICKS} ticks: {len(closed)} closed, {extended} extended, "
+          f"{len(wheel)} open")
+    print(f"CPU per tick: {elapsed / TICKS * 1e6:.0f}us")
+
+
+if __name__ == "__main__":
+    main()
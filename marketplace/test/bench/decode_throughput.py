@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+from marketplace.contracts import ERC721Contract
+from marketplace.events.transfers import TRANSFER_TOPIC, decode_transfers
+
+# Configuration, the logs are synthetic so no chain is needed
+LOGS = config('BENCH_LOGS', default=1000000, cast=int)
+ABI_SAMPLE = config('BENCH_ABI_SAMPLE', default=20000, cast=int)
+PROCESSES = config('BENCH_PROCESSES', default=os.cpu_count(), cast=int)
+COLLECTIONS = config('BENCH_COLLECTIONS', default=50, cast=int)
+HOLDERS = config('BENCH_HOLDERS', default=5000, cast=int)
+
+
+def build_logs(count):
+    collections = [Web3.to_checksum_address(i.to_bytes(20, "big"))
+                   for i in range(1, COLLECTIONS + 1)]
+    holders = [HexBytes(bytes(12) + (i + 1000).to_bytes(20, "big"))
+               for i in range(HOLDERS)]
+
+    return [AttributeDict({
+        "address": collections[i % COLLECTIONS],
+        "topics": [
+            TRANSFER_TOPIC,
+            holders[i % HOLDERS],
+            holders[(i * 7 + 1) % HOLDERS],
+            HexBytes(i.to_bytes(32, "big"))],
+        "data": HexBytes(b""),
+        "blockNumber": i // 100,
+        "blockHash": HexBytes(bytes(32)),
+        "transactionHash": HexBytes(i.to_bytes(32, "big")),
+        "transactionIndex": 0,
+        "logIndex": i % 100,
+        "removed": False,
+    }) for i in range(count)]
+
+
+def report(name, count, elapsed):
+    print(f"{name}: {count} logs in {elapsed:.2f}s, "
+          f"{count / elapsed:.0f} logs/s")
+
+
+def main():
+    logs = build_logs(LOGS)
+
+    # Baseline, one log at a time through the contract ABI
+    event = Web3().eth.contract(
+        abi=ERC721Contract.MOCK_ERC721_ABI).events.Transfer()
+    sample = logs[:ABI_SAMPLE]
+    start = time.perf_counter()
+    for log in sample:
+        event.process_log(log)
+    report("ABI process_log", len(sample), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    decoded = decode_transfers(logs)
+    report("Topic decoder", len(decoded), time.perf_counter() - start)
+
+    with ProcessPoolExecutor(max_workers=PROCESSES) as executor:
+        # Started before timing, the listener keeps its pool for its lifetime
+        executor.submit(int).result()
+        start = time.perf_counter()
+        decoded = decode_transfers(logs, executor)
+        report(f"Topic decoder, {PROCESSES} processes", len(decoded),
+               time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
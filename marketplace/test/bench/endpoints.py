@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+from decouple import config
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nftmktplace.settings")
+
+import django
+django.setup()
+
+from django.test import Client
+from django.test.utils import setup_test_environment
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+from marketplace import book, encoding, views
+from marketplace.cache import ResponseCache
+from marketplace.contracts import ERC721Contract
+from marketplace.models import NFTPurchaseIntent
+
+# Configuration
+LISTINGS = config('BENCH_LISTINGS', default=2000, cast=int)
+ORDERS = config('BENCH_ORDERS', default=1000, cast=int)
+LIST_READS = config('BENCH_LIST_READS', default=50, cast=int)
+COLLECTION = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+ERC20_ADDRESS = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+
+def listing_body(token_id, is_auction=False):
+    return json.dumps({
+        "nft_collection_address": COLLECTION,
+        "tokenId": token_id,
+        "erc20Address": ERC20_ADDRESS,
+        "erc20_amount": 1000,
+        "isAuction": is_auction,
+        "ownerAddress": "0x0000000000000000000000000000000000000001",
+    })
+
+
+def order_body(sale_id, token_id, amount):
+    buyer = Account.create()
+    message = Web3.solidity_keccak(
+        ['address', 'address', 'uint256', 'uint256'],
+        [COLLECTION, ERC20_ADDRESS, token_id, amount])
+    signature = Account.sign_message(
+        encode_defunct(hexstr=message.hex()), private_key=buyer.key)
+    return json.dumps({
+        "nft_collection_address": COLLECTION,
+        "tokenId": token_id,
+        "erc20Address": ERC20_ADDRESS,
+        "erc20_amount": amount,
+        "bidderSig": signature.signature.hex(),
+        "buyerAddress": buyer.address,
+        "sale_id": sale_id,
+    }).encode()
+
+
+def post_all(client, url, bodies):
+    start = time.perf_counter()
+    for body in bodies:
+        response = client.post(url, body, content_type='application/json')
+        assert response.status_code < 300, response.content
+    return len(bodies) / (time.perf_counter() - start)
+
+
+def main():
+    setup_test_environment()
+    client = Client()
+    # Requests are not rate limited, the runs would be cut short
+    patch.object(views, 'get_rate_limiter', return_value=None).start()
+    # No chain to read the buyer funds from
+    patch.object(views, 'INTAKE_ONCHAIN_CHECKS', []).start()
+
+    # Listings, and one auction at the end for the bids
+    with patch.object(ERC721Contract, 'is_token_owner', return_value=True):
+        rate = post_all(client, "/list/",
+                        [listing_body(token_id) for token_id in range(1, LISTINGS + 1)])
+        post_all(client, "/list/", [listing_body(LISTINGS + 1, is_auction=True)])
+    print(f"POST /list/: {rate:,.0f} requests/s")
+
+    def read_rate(**headers):
+        start = time.perf_counter()
+        for _ in range(LIST_READS):
+            client.get("/list/", **headers)
+        return LIST_READS / (time.perf_counter() - start)
+
+    # Nothing kept, every read is serialized
+    with patch.object(views, 'response_cache', ResponseCache(max_entries=0)):
+        for fast in (False, True):
+            with patch.object(encoding, 'FAST_JSON_RESPONSES', fast):
+                rate = read_rate()
+            print(f"GET /list/ of {LISTINGS + 1} listings, "
+                  f"{'orjson' if fast else 'stdlib json'}: {rate:,.1f} requests/s")
+
+    etag = client.get("/list/")["ETag"]
+    print(f"GET /list/ cached: {read_rate():,.0f} requests/s, "
+          f"304: {read_rate(HTTP_IF_NONE_MATCH=etag):,.0f} requests/s")
+
+    # Signed before timing, so the runs measure the views
+    orders = min(ORDERS, LISTINGS)
+    purchases = [order_body(sale_id, sale_id, 1000)
+                 for sale_id in range(1, orders + 1)]
+    bids = [order_body(LISTINGS + 1, LISTINGS + 1, 1001 + i)
+            for i in range(orders)]
+
+    start = time.perf_counter()
+    for body in purchases:
+        NFTPurchaseIntent(**json.loads(body))
+    loads_rate = orders / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for body in purchases:
+        NFTPurchaseIntent.model_validate_json(body)
+    validate_rate = orders / (time.perf_counter() - start)
+    print(f"Order parsing: json.loads + model {loads_rate:,.0f}/s, "
+          f"model_validate_json {validate_rate:,.0f}/s")
+
+    print(f"POST /purchaseOrder/: "
+          f"{post_all(client, '/purchaseOrder/', purchases):,.0f} requests/s")
+    print(f"POST /bidOrder/: {post_all(client, '/bidOrder/', bids):,.0f} requests/s")
+
+    print(f"Stored {len(book.listings_by_id)} listings, "
+          f"{len(book.purchase_intents_by_sale)} purchase intents, "
+          f"{len(views.bid_intents[LISTINGS + 1])} bids")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+from decouple import config
+from web3 import Web3
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+from marketplace.events.ingester import Checkpoint, LogIngester
+
+# Configuration, point PROVIDER_URL to a local chain (anvil, hardhat, ...)
+INFURA_URL = config('PROVIDER_URL')
+CONTRACT_ADDRESS = config('MOCK_ERC721_CONTRACT_ADDRESS')
+START_BLOCK = config('BENCH_START_BLOCK', default=0, cast=int)
+CHUNK_SIZE = config('LISTENER_CHUNK_SIZE', default=2000, cast=int)
+MAX_CHUNK_SIZE = config('LISTENER_MAX_CHUNK_SIZE', default=10000, cast=int)
+
+w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+
+if not w3.is_connected():
+    print("Not connected!")
+    sys.exit(1)
+
+
+def main():
+    transfer_event_signature = w3.keccak(
+        text="Transfer(address,address,uint256)").hex()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ingester = LogIngester(
+            w3,
+            [CONTRACT_ADDRESS],
+            [transfer_event_signature],
+            lambda logs, from_block, to_block: None,
+            Checkpoint(os.path.join(tmp_dir, 'checkpoint.json')),
+            start_block=START_BLOCK,
+            chunk_size=CHUNK_SIZE,
+            max_chunk_size=MAX_CHUNK_SIZE)
+
+        ingester.run_once()
+
+    print(f"Blocks: {START_BLOCK} - {ingester.state['block']}")
+    print(f"Logs: {ingester.logs_total}")
+    print(f"Elapsed: {ingester.elapsed:.2f}s")
+    print(f"Throughput: {ingester.logs_per_second:.0f} logs/s")
+    print(f"Final chunk size: {ingester.chunk_size} blocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import random
+import sys
+import time
+from decouple import config
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+from marketplace.matching import MatchingEngine
+
+# Configuration
+RESTING_OFFERS = config('BENCH_RESTING_OFFERS', default=100000, cast=int)
+LISTINGS = config('BENCH_LISTINGS', default=200000, cast=int)
+COLLECTIONS = config('BENCH_COLLECTIONS', default=100, cast=int)
+ERC20_ADDRESS = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+
+def collection(i):
+    return "0x" + f"{i:040x}"
+
+
+def main():
+    random.seed(1)
+    engine = MatchingEngine()
+
+    cpu = time.process_time()
+    for i in range(RESTING_OFFERS):
+        engine.add_offer({
+            "nft_collection_address": collection(random.randrange(COLLECTIONS)),
+            "erc20Address": ERC20_ADDRESS,
+            "erc20_amount": random.randint(500, 1500),
+            "buyerAddress": collection(i),
+        })
+    elapsed = time.process_time() - cpu
+    print(f"Rested {RESTING_OFFERS} offers in {elapsed:.2f}s CPU "
+          f"({RESTING_OFFERS / elapsed:,.0f} offers/s)")
+
+    # Listings around the offer prices, about half of them match and the others
+    # rest, so new offers also match resting listings
+    listings = [{
+        "sale_id": sale_id,
+        "nft_collection_address": collection(random.randrange(COLLECTIONS)),
+        "tokenId": sale_id,
+        "erc20Address": ERC20_ADDRESS,
+        "erc20_amount": random.randint(1000, 2000),
+        "ownerAddress": collection(sale_id),
+    } for sale_id in range(LISTINGS)]
+
+    cpu = time.process_time()
+    matches = sum(1 for listing in listings if engine.add_listing(listing))
+    elapsed = time.process_time() - cpu
+    print(f"Added {LISTINGS} listings in {elapsed:.2f}s CPU: {matches} matched, "
+          f"{LISTINGS / elapsed:,.0f} listings/s, {matches / elapsed:,.0f} matches/s")
+
+    cpu = time.process_time()
+    matches = sum(1 for i in range(RESTING_OFFERS) if engine.add_offer({
+        "nft_collection_address": collection(random.randrange(COLLECTIONS)),
+        "erc20Address": ERC20_ADDRESS,
+        "erc20_amount": random.randint(1500, 2500),
+        "buyerAddress": collection(i),
+    }))
+    elapsed = time.process_time() - cpu
+    print(f"Added {RESTING_OFFERS} crossing offers in {elapsed:.2f}s CPU: "
+          f"{matches} matched, {matches / elapsed:,.0f} matches/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+from datetime import datetime
+from unittest.mock import patch
+from decouple import config
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nftmktplace.settings")
+
+import django
+django.setup()
+
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from marketplace import book, compression, views
+from marketplace.cache import ResponseCache
+
+# Configuration
+LISTINGS = config('BENCH_RESPONSE_LISTINGS', default=100000, cast=int)
+READS = config('BENCH_RESPONSE_READS', default=5, cast=int)
+COLLECTION = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+ERC20_ADDRESS = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+FIELDS = "sale_id,tokenId,erc20_amount"
+
+
+def build_book():
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return {sale_id: {
+        "sale_id": sale_id,
+        "nft_collection_address": COLLECTION,
+        "tokenId": sale_id,
+        "erc20Address": ERC20_ADDRESS,
+        "erc20_amount": 1000 + sale_id % 500,
+        "isAuction": False,
+        "ownerAddress": "0x" + f"{sale_id:040x}",
+        "createdAt": created_at,
+        "purchaseAt": "",
+    } for sale_id in range(1, LISTINGS + 1)}
+
+
+def read(client, query, accept_encoding):
+    """Time uncached reads, returning the last response and the mean seconds."""
+    start = time.perf_counter()
+    for _ in range(READS):
+        response = client.get("/list/", query, HTTP_ACCEPT_ENCODING=accept_encoding)
+    return response, (time.perf_counter() - start) / READS
+
+
+def main():
+    setup_test_environment()
+    client = Client()
+
+    codings = ["identity", "gzip"]
+    if compression.brotli is not None:
+        codings.append("br")
+    else:
+        print("brotli is not installed, skipping br (pip install brotli)")
+
+    with patch.dict(book.listings_by_id, build_book(), clear=True), \
+            patch.object(views, 'response_cache', ResponseCache(max_entries=0)):
+        full_size = None
+        for label, query in (("all fields", {}), (FIELDS, {"fields": FIELDS})):
+            for coding in codings:
+                response, seconds = read(client, query, coding)
+                size = len(response.content)
+                full_size = full_size or size
+                print(f"GET /list/ of {LISTINGS:,} listings, {label}, {coding}: "
+                      f"{size / 1024:,.0f} KiB on the wire "
+                      f"({100 * (1 - size / full_size):.1f}% saved), "
+                      f"{seconds * 1000:,.0f} ms")
+
+    # Compressed once per book version, then served from the cache
+    with patch.dict(book.listings_by_id, build_book(), clear=True), \
+            patch.object(views, 'response_cache', ResponseCache()):
+        client.get("/list/", HTTP_ACCEPT_ENCODING="gzip")
+        _, seconds = read(client, {}, "gzip")
+        print(f"GET /list/ cached, gzip: {seconds * 1000:,.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,50 @@ Here, you can add unit tests, integration tests, and other tests to ensure the f
 and correctness of the 'marketplace' app.
 """
 
+import asyncio
+import gzip
+import importlib
 import json
-from unittest.mock import patch
-from django.test import TestCase, Client, SimpleTestCase
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import MagicMock, patch
+from django.test import TestCase, Client, RequestFactory, SimpleTestCase
+from eth_abi import encode
+from eth_account import Account
 from eth_account.messages import encode_defunct
+from hexbytes import HexBytes
+from requests.exceptions import ReadTimeout
 from web3 import Web3, EthereumTesterProvider
-
+from web3.datastructures import AttributeDict
+
+from . import book, compression, encoding, views
+from .auctions import AuctionScheduler, TimerWheel
+from .bids import BidLadder
+from .cache import ResponseCache, etag_matches
+from .candles import CandleSeries, PriceHistory
+from .compression import accepted_codings, negotiate
+from .matching import MatchingEngine
+from .contracts import ERC721Contract
+from .contracts import MulticallContract
+from .dutch import current_price
+from .events.dispatch import LogDispatcher
+from .events.erc20 import APPROVAL_TOPIC, decode_erc20_event
+from .events.ingester import Checkpoint, LogIngester
+from .events.ownership import OwnershipCache, OwnershipIndex
+from .events.transfers import TRANSFER_TOPIC, ZERO_ADDRESS, decode_transfers
+from .funds import FundsCache, funds_key
+from .feed import ALL_TOPIC, OrderBookFeed, collection_topic, sale_topic
+from .preflight import SettlementPreflight
+from .ratelimit import TokenBucketLimiter, parse_limits
+from .stats import StatsBook
+from .relayers import LEAST_PENDING, RelayerPool
+from .reservations import ReservationQueue
 from .views import find_listing
 
 # Create your tests here.
@@ -18,6 +56,71 @@ from .views import find_listing
 listings = []
 
 
+def setUpModule():
+    """Admit every request, the rate limits are tested by RateLimitTestCase."""
+    limiter = patch('marketplace.views.get_rate_limiter', return_value=None)
+    limiter.start()
+    unittest.addModuleCleanup(limiter.stop)
+
+
+def patch_listings(listings):
+    """Patch the book to hold only the given listings."""
+    return patch.dict(book.listings_by_id, {
+        listing["sale_id"]: listing for listing in listings}, clear=True)
+
+
+class OrderBookMixin:
+    """
+    Shared setup of the test cases that index listings in a fresh book and sign
+    orders for them.
+    """
+
+    collection = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+    erc20 = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+    def patch_book(self):
+        """Give the test fresh collection statistics and empty book indexes."""
+        self.stats = StatsBook()
+        patcher = patch.object(book, 'collection_stats', self.stats)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for index in (book.listings_by_id, book.purchase_intents_by_sale,
+                      book.open_sales_by_token, book.open_sales_by_collection,
+                      book.bids_by_sale):
+            patcher = patch.dict(index, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def index_listing(self, sale_id, amount, is_auction=False, **fields):
+        """Index a new listing of the test collection."""
+        listing = {"sale_id": sale_id, "nft_collection_address": self.collection,
+                   "tokenId": sale_id, "erc20Address": self.erc20,
+                   "erc20_amount": amount, "isAuction": is_auction,
+                   "ownerAddress": "0xA", "purchaseAt": "", **fields}
+        book.index_listing(listing)
+        return listing
+
+    @staticmethod
+    def signed_order(listing, amount, buyer):
+        """Build the body of a bid or purchase of a listing, signed by a buyer."""
+        message = Web3.solidity_keccak(
+            ['address', 'address', 'uint256', 'uint256'],
+            [listing["nft_collection_address"], listing["erc20Address"],
+             listing["tokenId"], amount])
+        signature = Account.sign_message(
+            encode_defunct(hexstr=message.hex()),
+            private_key=buyer.key).signature.hex()
+
+        return {
+            "nft_collection_address": listing["nft_collection_address"],
+            "tokenId": listing["tokenId"],
+            "erc20Address": listing["erc20Address"],
+            "erc20_amount": amount,
+            "bidderSig": signature,
+            "buyerAddress": buyer.address,
+            "sale_id": listing["sale_id"]}
+
+
 class ListNFTTest(TestCase):
     """Test cases for the list_nft view in the marketplace app."""
 
@@ -36,7 +139,7 @@ class ListNFTTest(TestCase):
         mock_is_token_owner.return_value = True
 
         data = {
-            'nft_collection_address': 'some_address',
+            'nft_collection_address': '0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff',
             'tokenId': 123,
             'erc20Address': 'some_erc20_address',
             'erc20_amount': 100.5,
@@ -60,7 +163,7 @@ class ListNFTTest(TestCase):
     def test_list_nft_post_not_owner(self):
         """Test POST when someone who isn't the owner tries to list."""
         data = {
-            'nft_collection_address': 'some_address',
+            'nft_collection_address': '0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff',
             'tokenId': 123,
             'erc20Address': 'some_erc20_address',
             'erc20_amount': 100.5,
@@ -71,6 +174,33 @@ class ListNFTTest(TestCase):
             "/list/", json.dumps(data), content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    @patch('marketplace.views.LISTING_OWNERSHIP_MAX_LAG', new=5)
+    @patch('marketplace.views.get_erc721_contract')
+    def test_list_nft_checks_listed_collection(self, mock_get_erc721_contract):
+        """Ownership is checked in the listed collection with the API's lag."""
+        mock_get_erc721_contract.return_value.is_token_owner.return_value = True
+        data = {
+            'nft_collection_address': '0xfce9b92ec11680898c7fe57c4ddcea83aeaba3ff',
+            'tokenId': 123,
+            'erc20Address': 'some_erc20_address',
+            'erc20_amount': 100.5,
+            'isAuction': True,
+            'ownerAddress': 'some_ethereum_address'
+        }
+        with patch_listings([]):
+            response = self.client.post(
+                "/list/", json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        mock_get_erc721_contract.assert_called_once_with(
+            '0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff')
+        mock_get_erc721_contract.return_value.is_token_owner.assert_called_once_with(
+            'some_ethereum_address', 123, max_lag=5)
+
+        data['nft_collection_address'] = 'some_address'
+        response = self.client.post(
+            "/list/", json.dumps(data), content_type='application/json')
+        self.assertEqual(response.json()["error"], "Invalid collection address")
+
     def test_list_nft_disallowed_method(self):
         """Test using an unsupported method (PUT)."""
         response = self.client.put("/list/")
@@ -105,7 +235,7 @@ class TestFindListingFunction(SimpleTestCase):
 
     def test_find_listing_found(self):
         """Test the case when the listing is successfully found."""
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             # Assuming 1 is the sale_id of the first listing
             result = find_listing(1)
         self.assertEqual(result, self.listings[0])
@@ -117,11 +247,12 @@ class TestFindListingFunction(SimpleTestCase):
 
     def test_find_listing_empty_list(self):
         """Test the case when the listings list is empty."""
-        with patch('marketplace.views.listings', new=[]):  # Empty the list
+        with patch_listings([]):  # Empty the list
             result = find_listing(1)
         self.assertIsNone(result)
 
 
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
 class PurchaseOrderTestCase(TestCase):
     """
     Test cases for the `purchase_order` endpoint.
@@ -143,7 +274,7 @@ class PurchaseOrderTestCase(TestCase):
 
         self.valid_data = {
             'nft_collection_address': '0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff',
-            'tokenId': 1,
+            'tokenId': 123,
             'erc20Address': '0xbd65c58D6F46d5c682Bf2f36306D461e3561C747',
             'erc20_amount': 10000000000000000,
             'bidderSig': '',
@@ -166,7 +297,7 @@ class PurchaseOrderTestCase(TestCase):
         4. Check that the response message contains "Purchase initiated."
 
         """
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             w3 = Web3(EthereumTesterProvider())
             acct = w3.eth.account.create()
             private_key = acct.key
@@ -198,6 +329,7 @@ class PurchaseOrderTestCase(TestCase):
             self.assertIn("Purchase initiated", response.json()["message"])
 
 
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
 class SettlePurchaseOrderTestCase(TestCase):
     """
     Test cases for the `settle_purchase_order` endpoint.
@@ -277,7 +409,9 @@ class SettlePurchaseOrderTestCase(TestCase):
         4. Check that the response message contains "Transaction successful created."
 
         """
-        with patch('marketplace.views.purchase_intents', new=self.purchases_intents):
+        with patch.dict(book.purchase_intents_by_sale, {
+                intent["sale_id"]: intent for intent in self.purchases_intents},
+                clear=True):
             response = self.client.post(
                 '/settle_purchase_order/',
                 json.dumps(self.body_data),
@@ -289,6 +423,7 @@ class SettlePurchaseOrderTestCase(TestCase):
             self.assertEqual(response.status_code, 200)
 
 
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
 class BidOrderTestCase(TestCase):
     """
     Test cases for the `bid_order` endpoint.
@@ -333,7 +468,7 @@ class BidOrderTestCase(TestCase):
 
         """
 
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             w3 = Web3(EthereumTesterProvider())
             acct = w3.eth.account.create()
             private_key = acct.key
@@ -401,7 +536,7 @@ class BidOrderTestCase(TestCase):
         5. Check that the error message indicates "Listing not found."
 
         """
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             self.valid_bid_data.update({'sale_id': 2})
             response = self.client.post(
                 '/bidOrder/',
@@ -425,7 +560,7 @@ class BidOrderTestCase(TestCase):
         4. Check that the error message indicates "Auction already settled."
 
         """
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             self.listings[0].update({'purchaseAt': "2023-01-01"})
             response = self.client.post(
                 '/bidOrder/',
@@ -451,7 +586,7 @@ class BidOrderTestCase(TestCase):
         4. Check that the error message indicates "Listing is not for auction."
 
         """
-        with patch('marketplace.views.listings', new=self.listings):
+        with patch_listings(self.listings):
             self.listings[0].update({'isAuction': False})
             response = self.client.post(
                 '/bidOrder/',
@@ -488,7 +623,7 @@ class BidOrderTestCase(TestCase):
             "sale_id"), []).append(self.valid_bid_data)
 
         with patch('marketplace.views.bid_intents', new=mocked_bid_intents), \
-                patch('marketplace.views.listings', new=self.listings):
+                patch_listings(self.listings):
 
             response = self.client.post(
                 '/bidOrder/',
@@ -557,7 +692,7 @@ class BidOrderTestCase(TestCase):
             "sale_id"), []).append(self.valid_bid_data)
 
         with patch('marketplace.views.bid_intents', new=mocked_bid_intents), \
-                patch('marketplace.views.listings', new=self.listings):
+                patch_listings(self.listings):
 
             self.assertEqual(len(mocked_bid_intents[self.valid_bid_data.get(
                 "sale_id")]), 1)
@@ -573,7 +708,8 @@ class BidOrderTestCase(TestCase):
             self.assertEqual(response.status_code, 200)
 
 
-class SettleAuctionOrderTestCase(TestCase):
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class SettleAuctionOrderTestCase(OrderBookMixin, TestCase):
     """
     Test case class for testing the settlement of auction orders in the marketplace.
 
@@ -664,3 +800,2718 @@ class SettleAuctionOrderTestCase(TestCase):
                 "Transaction successfully created.",
                 response.json()["message"])
             self.assertEqual(response.status_code, 200)
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.MarketplaceContract')
+    def test_settled_auction_is_sold(self, mock_marketplace_contract):
+        """A settled auction leaves the open sales and is not settled again."""
+        mock_marketplace_contract.return_value.send_transaction.return_value = {
+            "nonce": 0}
+        self.patch_book()
+        listing = self.index_listing(1, 1000, is_auction=True)
+        self.stats.bid(listing, 10000000000000000)
+
+        with patch('marketplace.views.bid_intents', new=self.bid_intents):
+            settled = self.client.post(
+                '/settle_auction_order/', json.dumps(self.body_data),
+                content_type='application/json')
+            again = self.client.post(
+                '/settle_auction_order/', json.dumps(self.body_data),
+                content_type='application/json')
+
+        self.assertEqual(settled.status_code, 200)
+        self.assertTrue(listing["purchaseAt"])
+        stats = self.stats.collection(self.collection)[self.erc20.lower()]
+        self.assertEqual((stats["openCount"], stats["bestBid"]), (0, None))
+        self.assertEqual(again.json()["error"], "Listing already sold")
+
+
+class RelayerPoolTestCase(SimpleTestCase):
+    """
+    Test cases for the `RelayerPool` nonce tracking and relayer selection.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = MagicMock()
+        self.w3.eth.get_transaction_count.return_value = 7
+        self.private_keys = [
+            Web3().eth.account.create().key for _ in range(3)]
+
+    def test_round_robin_assigns_each_relayer_in_turn(self):
+        """Relayers are used in order and each keeps its own nonce stream."""
+        pool = RelayerPool(self.w3, self.private_keys)
+
+        acquired = [pool.acquire() for _ in range(6)]
+        addresses = [account.address for account, _ in acquired]
+        nonces = [nonce for _, nonce in acquired]
+
+        self.assertEqual(addresses[:3], addresses[3:])
+        self.assertEqual(len(set(addresses)), 3)
+        self.assertEqual(nonces, [7, 7, 7, 8, 8, 8])
+        self.assertEqual(self.w3.eth.get_transaction_count.call_count, 3)
+
+    def test_least_pending_prefers_idle_relayer(self):
+        """The relayer with the fewest in-flight transactions is picked."""
+        pool = RelayerPool(self.w3, self.private_keys, LEAST_PENDING)
+
+        first, _ = pool.acquire()
+        second, _ = pool.acquire()
+        pool.release(first.address)
+        third, _ = pool.acquire()
+
+        self.assertNotEqual(first.address, second.address)
+        self.assertEqual(third.address, first.address)
+
+    def test_failed_submission_rereads_nonce(self):
+        """A failed submission drops the cached nonce for that relayer."""
+        pool = RelayerPool(self.w3, self.private_keys[:1])
+
+        account, nonce = pool.acquire()
+        pool.release(account.address, failed=True)
+        _, retried_nonce = pool.acquire()
+
+        self.assertEqual(nonce, retried_nonce)
+        self.assertEqual(pool.pending()[account.address], 1)
+
+    def test_sync_counts_unmined_nonces(self):
+        """Pending counters follow the mined nonces on chain."""
+        pool = RelayerPool(self.w3, self.private_keys[:1])
+        account, _ = pool.acquire()
+        pool.acquire()
+
+        self.w3.eth.get_transaction_count.return_value = 8
+        pool.sync()
+
+        self.assertEqual(pool.pending()[account.address], 1)
+
+    def test_acquire_syncs_mined_transactions(self):
+        """Mined transactions stop counting as pending once the pool syncs."""
+        pool = RelayerPool(self.w3, self.private_keys, LEAST_PENDING,
+                           sync_seconds=0)
+
+        first, _ = pool.acquire()
+        pool.acquire()
+        self.w3.eth.get_transaction_count.return_value = 8
+        third, _ = pool.acquire()
+
+        self.assertEqual(third.address, first.address)
+
+    def test_unknown_strategy(self):
+        """An unknown selection strategy is rejected."""
+        with self.assertRaises(ValueError):
+            RelayerPool(self.w3, self.private_keys, "random")
+
+
+class SettleBatchTestCase(TestCase):
+    """
+    Test cases for the `settle_batch` endpoint.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.owner_acct = self.w3.eth.account.create()
+        self.bid_intents = {}
+        self.settlements = []
+        # Sales of other tests are not settled by the batches
+        patcher = patch_listings([])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for sale_id in (1, 2):
+            bidder_acct = self.w3.eth.account.create()
+            bid = {
+                "sale_id": sale_id,
+                "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+                "tokenId": sale_id,
+                "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+                "erc20_amount": 10000000000000000,
+                "bidderAddress": bidder_acct.address}
+
+            message = self.w3.solidity_keccak(
+                ['address', 'address', 'uint256', 'uint256'],
+                [bid["nft_collection_address"], bid["erc20Address"],
+                 bid["tokenId"], bid["erc20_amount"]])
+            bidder_signature = self.w3.eth.account.sign_message(
+                encode_defunct(hexstr=message.hex()),
+                private_key=bidder_acct.key).signature.hex()
+            bid["bidderSig"] = bidder_signature
+            self.bid_intents[sale_id] = [bid]
+
+            bidder_signature_hash = self.w3.solidity_keccak(
+                ['bytes'], [bidder_signature])
+            owner_signature = self.w3.eth.account.sign_message(
+                encode_defunct(hexstr=bidder_signature_hash.hex()),
+                private_key=self.owner_acct.key)
+
+            self.settlements.append({
+                "sale_id": sale_id,
+                "owner_approval_sig": owner_signature.signature.hex(),
+                "owner_address": self.owner_acct.address})
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.MarketplaceContract')
+    def test_batch_settlement(self, mock_marketplace_contract):
+        """
+        Test that every entry gets its own result and nonces are shared.
+
+        Steps:
+        1. Settle two valid sales, one sale with a wrong owner and one unknown sale.
+        2. Verify that valid sales get transactions with consecutive nonces.
+        3. Verify that invalid entries get an error without failing the batch.
+        """
+        contract = mock_marketplace_contract.return_value
+        contract.w3.eth.get_transaction_count.return_value = 4
+        contract.w3.to_wei.return_value = 20
+        contract.build_finish_auction.side_effect = (
+            lambda *args: {"nonce": args[6], "gasPrice": args[7]})
+
+        wrong_owner = dict(self.settlements[1],
+                           owner_address=self.w3.eth.account.create().address)
+        unknown_sale = dict(self.settlements[0], sale_id=3)
+        body = {"settlements": self.settlements + [wrong_owner, unknown_sale]}
+
+        with patch('marketplace.views.bid_intents', new=self.bid_intents):
+            response = self.client.post(
+                '/settle_batch/',
+                json.dumps(body),
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["sale_id"] for r in results], [1, 2, 2, 3])
+        self.assertEqual(results[0]["txHash"], {"nonce": 4, "gasPrice": 20})
+        self.assertEqual(results[1]["txHash"], {"nonce": 5, "gasPrice": 20})
+        self.assertEqual(
+            results[2]["error"],
+            "Signature does not match the provided owner address.")
+        self.assertEqual(results[3]["error"], "No intent for this sale id")
+        self.assertEqual(contract.w3.eth.get_transaction_count.call_count, 1)
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.MarketplaceContract')
+    def test_failed_build_keeps_nonce(self, mock_marketplace_contract):
+        """A settlement whose build fails leaves its nonce to the next one."""
+        contract = mock_marketplace_contract.return_value
+        contract.w3.eth.get_transaction_count.return_value = 4
+        contract.w3.to_wei.return_value = 20
+        contract.build_finish_auction.side_effect = [
+            ValueError("gas estimation failed"), {"nonce": 4}]
+
+        with patch('marketplace.views.bid_intents', new=self.bid_intents):
+            response = self.client.post(
+                '/settle_batch/',
+                json.dumps({"settlements": self.settlements}),
+                content_type='application/json')
+
+        results = response.json()["results"]
+        self.assertEqual(results[0]["error"], "gas estimation failed")
+        self.assertEqual(results[1]["txHash"], {"nonce": 4})
+        self.assertEqual(contract.build_finish_auction.call_args[0][6], 4)
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=True)
+    @patch('marketplace.views.SettlementPreflight')
+    @patch('marketplace.views.MarketplaceContract')
+    def test_batch_preflight_rejects(self, mock_marketplace_contract, mock_preflight):
+        """Test that settlements failing the preflight are never built."""
+        mock_preflight.return_value.check.return_value = [
+            "Buyer ERC20 allowance is too low", None]
+        contract = mock_marketplace_contract.return_value
+        contract.w3.eth.get_transaction_count.return_value = 0
+        contract.build_finish_auction.return_value = {"nonce": 0}
+
+        with patch('marketplace.views.bid_intents', new=self.bid_intents):
+            response = self.client.post(
+                '/settle_batch/',
+                json.dumps({"settlements": self.settlements}),
+                content_type='application/json')
+
+        results = response.json()["results"]
+        self.assertEqual(results[0]["error"], "Buyer ERC20 allowance is too low")
+        self.assertEqual(results[1]["txHash"], {"nonce": 0})
+        self.assertEqual(contract.build_finish_auction.call_count, 1)
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=True)
+    @patch('marketplace.views.SettlementPreflight')
+    @patch('marketplace.views.MarketplaceContract')
+    def test_batch_preflight_unavailable(self, mock_marketplace_contract,
+                                         mock_preflight):
+        """A failed preflight read errors every settlement instead of the batch."""
+        mock_preflight.return_value.check.side_effect = ConnectionError("timeout")
+        contract = mock_marketplace_contract.return_value
+
+        with patch('marketplace.views.bid_intents', new=self.bid_intents):
+            response = self.client.post(
+                '/settle_batch/',
+                json.dumps({"settlements": self.settlements}),
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["error"] for result in response.json()["results"]],
+                         ["Preflight failed: timeout"] * 2)
+        contract.build_finish_auction.assert_not_called()
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.MarketplaceContract')
+    def test_auction_settled_once_after_end(self, mock_marketplace_contract):
+        """A timed auction is settled once it ended, then sold."""
+        contract = mock_marketplace_contract.return_value
+        contract.w3.eth.get_transaction_count.return_value = 0
+        contract.build_finish_auction.return_value = {"nonce": 0}
+        listing = dict(self.bid_intents[1][0], isAuction=True, purchaseAt="",
+                       ownerAddress=self.owner_acct.address,
+                       endTime=int(time.time()) + 3600)
+        book.listings_by_id[1] = listing
+
+        def settle():
+            with patch('marketplace.views.bid_intents', new=self.bid_intents):
+                return self.client.post(
+                    '/settle_batch/',
+                    json.dumps({"settlements": self.settlements[:1]}),
+                    content_type='application/json').json()["results"][0]
+
+        self.assertEqual(settle()["error"], "Auction has not ended")
+
+        listing["closedAt"] = "2023-10-16 00:00:00"
+        self.assertEqual(settle()["txHash"], {"nonce": 0})
+        self.assertTrue(listing["purchaseAt"])
+        self.assertEqual(views.bid_rejection(listing, 2 * listing["erc20_amount"]),
+                         "Auction already settled")
+        self.assertEqual(settle()["error"], "Listing already sold")
+
+    def test_batch_too_large(self):
+        """Test that batches above the size limit are rejected."""
+        with patch('marketplace.views.SETTLE_BATCH_MAX_SIZE', new=1):
+            response = self.client.post(
+                '/settle_batch/',
+                json.dumps({"settlements": self.settlements}),
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SettlementPreflightTestCase(SimpleTestCase):
+    """
+    Test cases for the batched `SettlementPreflight` checks.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.multicall = MagicMock()
+        self.multicall.w3 = Web3()
+        self.owner = Web3().eth.account.create().address
+        self.bidder = Web3().eth.account.create().address
+        self.settlements = [
+            {"intent": {
+                "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+                "tokenId": token_id,
+                "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+                "erc20_amount": 60,
+                "bidderAddress": self.bidder},
+             "owner_address": self.owner}
+            for token_id in (1, 2)]
+        self.preflight = SettlementPreflight(
+            self.multicall, "0x597C9bC3F00a4Df00F85E9334628f6cDf03A1184")
+
+    def aggregate_returning(self, balance, allowance, token_owner, approved):
+        """Make the multicall answer every read with the given values."""
+        values = {
+            "balanceOf": encode(["uint256"], [balance]),
+            "allowance": encode(["uint256"], [allowance]),
+            "ownerOf": encode(["address"], [token_owner]),
+            "isApprovedForAll": encode(["bool"], [approved]),
+        }
+        selectors = {
+            Web3.keccak(text=signature)[:4].hex(): name
+            for signature, name in [
+                ("balanceOf(address)", "balanceOf"),
+                ("allowance(address,address)", "allowance"),
+                ("ownerOf(uint256)", "ownerOf"),
+                ("isApprovedForAll(address,address)", "isApprovedForAll")]}
+        self.multicall.aggregate.side_effect = lambda calls: [
+            (True, values[selectors[call_data[:10]]]) for _, call_data in calls]
+
+    def test_all_reads_in_one_call(self):
+        """Reads are deduplicated and sent in a single aggregated call."""
+        self.aggregate_returning(120, 120, self.owner, True)
+
+        self.assertEqual(self.preflight.check(self.settlements), [None, None])
+        self.assertEqual(self.multicall.aggregate.call_count, 1)
+        # balance, allowance and approval are shared, ownerOf is per token
+        self.assertEqual(len(self.multicall.aggregate.call_args[0][0]), 5)
+
+    def test_balance_consumed_across_batch(self):
+        """A buyer's balance must cover all of their settlements in the batch."""
+        self.aggregate_returning(100, 120, self.owner, True)
+
+        self.assertEqual(self.preflight.check(self.settlements),
+                         [None, "Buyer ERC20 balance is too low"])
+
+    def test_seller_checks(self):
+        """Ownership and approval of the seller are checked."""
+        self.aggregate_returning(120, 120, self.bidder, True)
+        self.assertEqual(self.preflight.check(self.settlements[:1]),
+                         ["Seller no longer owns the token"])
+
+        self.aggregate_returning(120, 120, self.owner, False)
+        self.assertEqual(self.preflight.check(self.settlements[:1]),
+                         ["Seller has not approved the marketplace"])
+
+
+def block_hash(number, forked_from=None):
+    """Build a fake block hash, different for blocks after a fork."""
+    fork = 1 if forked_from is not None and number >= forked_from else 0
+    return HexBytes(Web3.solidity_keccak(['uint256', 'uint256'], [number, fork]))
+
+
+def transfer_log(number, token_id, from_address, to_address, hash_of_block=None,
+                 collection="0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"):
+    """Build a raw ERC721 Transfer log as returned by eth_getLogs."""
+    return AttributeDict({
+        "address": collection,
+        "topics": [
+            TRANSFER_TOPIC,
+            HexBytes(bytes(12) + HexBytes(from_address)),
+            HexBytes(bytes(12) + HexBytes(to_address)),
+            HexBytes(token_id.to_bytes(32, "big"))],
+        "data": HexBytes(b""),
+        "blockNumber": number,
+        "blockHash": hash_of_block or block_hash(number),
+        "transactionHash": HexBytes(bytes(32)),
+        "transactionIndex": 0,
+        "logIndex": 0,
+        "removed": False,
+    })
+
+
+class LogIngesterTestCase(SimpleTestCase):
+    """
+    Test cases for the block-range `LogIngester`.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = Checkpoint(
+            os.path.join(self.tmp_dir.name, 'checkpoint.json'))
+        self.w3 = MagicMock()
+        self.w3.eth.block_number = 99
+        self.w3.eth.get_block.side_effect = lambda number: {
+            "hash": block_hash(number, self.forked_from)}
+        self.forked_from = None
+        self.owner = "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f"
+        self.addresses = ["0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"]
+        self.ranges = []
+
+    def tearDown(self):
+        """Remove the checkpoint directory."""
+        self.tmp_dir.cleanup()
+
+    def get_logs(self, params):
+        """Return one Transfer log per block of the requested range."""
+        return [
+            transfer_log(number, number, ZERO_ADDRESS, self.owner,
+                         block_hash(number, self.forked_from))
+            for number in range(params["fromBlock"], params["toBlock"] + 1)]
+
+    def handler(self, logs, from_block, to_block):
+        """Record the handled ranges."""
+        self.ranges.append((from_block, to_block, len(logs)))
+
+    def test_backfill_and_resume(self):
+        """The ingester backfills from the start block and resumes from its checkpoint."""
+        self.w3.eth.get_logs.side_effect = self.get_logs
+        ingester = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            start_block=10, chunk_size=30, target_logs=100)
+
+        self.assertEqual(ingester.run_once(), 90)
+        self.assertEqual(self.ranges[0], (10, 39, 30))
+        self.assertEqual(self.checkpoint.load()["block"], 99)
+
+        self.w3.eth.block_number = 120
+        resumed = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint, start_block=10)
+
+        self.assertEqual(resumed.run_once(), 21)
+        self.assertEqual(self.ranges[-1][0], 100)
+
+    def test_chunk_size_adapts(self):
+        """Ranges grow on sparse blocks and shrink when they return too many logs."""
+        self.w3.eth.get_logs.side_effect = self.get_logs
+        ingester = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            start_block=0, chunk_size=4, target_logs=20)
+
+        ingester.run_once()
+        self.assertEqual([count for _, _, count in self.ranges[:4]], [4, 8, 16, 16])
+
+        self.ranges = []
+        self.w3.eth.block_number = 299
+        ingester.chunk_size = 64
+        ingester.run_once()
+        self.assertEqual([count for _, _, count in self.ranges[:3]], [64, 32, 16])
+
+    def test_rejected_range_is_split(self):
+        """A range rejected by the provider is retried with a smaller one."""
+        def get_logs(params):
+            if params["toBlock"] - params["fromBlock"] >= 25:
+                raise ValueError({"code": -32005, "message": "too many results"})
+            return self.get_logs(params)
+
+        self.w3.eth.get_logs.side_effect = get_logs
+        ingester = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            start_block=0, chunk_size=100, max_chunk_size=100)
+
+        self.assertEqual(ingester.run_once(), 100)
+        self.assertEqual(self.ranges[0], (0, 24, 25))
+
+    def test_reorg_rolls_back_and_reapplies(self):
+        """
+        Orphaned logs are reverted on subscriptions that received them and the
+        canonical blocks are ingested again.
+        """
+        reverted = []
+        confirmed = []
+        self.w3.eth.get_logs.side_effect = self.get_logs
+        ingester = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            start_block=90, revert_handler=reverted.extend, reorg_window=10)
+        ingester.subscribe(
+            "confirmed",
+            lambda logs, from_block, to_block: confirmed.append((from_block, to_block)),
+            confirmations=5)
+
+        ingester.run_once()
+        self.assertEqual(confirmed, [(90, 94)])
+
+        self.forked_from = 97
+        self.w3.eth.block_number = 101
+        self.assertEqual(ingester.run_once(), 5)
+
+        self.assertEqual([log["blockNumber"] for log in reverted], [99, 98, 97])
+        self.assertEqual(self.ranges[-1], (97, 101, 5))
+        self.assertEqual(confirmed[-1], (95, 96))
+
+    def test_reorg_detected_after_restart(self):
+        """Block hashes and recent logs survive a restart through the checkpoint."""
+        reverted = []
+        self.w3.eth.get_logs.side_effect = self.get_logs
+        LogIngester(self.w3, self.addresses, [], self.handler, self.checkpoint,
+                    start_block=90, reorg_window=10).run_once()
+
+        self.forked_from = 99
+        restarted = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            revert_handler=reverted.extend, reorg_window=10)
+
+        self.assertEqual(restarted.handle_reorg(), 98)
+        self.assertEqual([log["blockNumber"] for log in reverted], [99])
+
+    def test_confirmations_within_reorg_window(self):
+        """A confirmation depth beyond the tracked window is rejected."""
+        with self.assertRaises(ValueError):
+            LogIngester(self.w3, self.addresses, [], self.handler, self.checkpoint,
+                        confirmations=20, reorg_window=10)
+
+    def test_no_addresses_reads_nothing(self):
+        """An empty address list never turns into an unfiltered eth_getLogs."""
+        ingester = LogIngester(
+            self.w3, [], [], self.handler, self.checkpoint, start_block=0)
+
+        self.assertEqual(ingester.run_once(), 0)
+        self.w3.eth.get_logs.assert_not_called()
+
+
+    def test_catch_up_logs_are_reverted(self):
+        """Logs read again for an added contract are reverted by a reorg."""
+        reverted = []
+        self.w3.eth.get_logs.side_effect = self.get_logs
+        ingester = LogIngester(
+            self.w3, self.addresses, [], self.handler, self.checkpoint,
+            start_block=90, revert_handler=reverted.extend, reorg_window=10)
+        ingester.run_once()
+        self.ranges = []
+
+        added = ["0xa1fC57f2Ba9f466b2BB2906dB3a5ea3000bA50C3"]
+        self.assertEqual(ingester.catch_up(added, 5), 5)
+        self.assertEqual(self.ranges, [(95, 99, 5)])
+        self.assertEqual(self.w3.eth.get_logs.call_args[0][0]["address"], added)
+
+        self.forked_from = 98
+        ingester.handle_reorg()
+
+        self.assertEqual([log["blockNumber"] for log in reverted],
+                         [99, 99, 98, 98])
+
+
+class LogDispatcherTestCase(SimpleTestCase):
+    """
+    Test cases for the per-address `LogDispatcher`.
+    """
+
+    def test_logs_routed_by_address(self):
+        """Each collection's logs only reach the handlers registered for it."""
+        first = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+        second = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+        received = {first: [], second: []}
+        reverted = []
+        dispatcher = LogDispatcher()
+        dispatcher.register(
+            first.lower(), lambda logs, *_: received[first].extend(logs),
+            reverted.extend)
+        dispatcher.register(
+            second, lambda logs, *_: received[second].extend(logs))
+
+        logs = [transfer_log(1, 1, ZERO_ADDRESS, second, collection=first),
+                transfer_log(1, 2, ZERO_ADDRESS, first, collection=second),
+                transfer_log(2, 3, ZERO_ADDRESS, second, collection=first)]
+        dispatcher.dispatch(logs, 1, 2)
+        dispatcher.revert(logs)
+
+        self.assertEqual(sorted(dispatcher.addresses), sorted([first, second]))
+        self.assertEqual(received[first], [logs[0], logs[2]])
+        self.assertEqual(received[second], [logs[1]])
+        self.assertEqual(reverted, [logs[0], logs[2]])
+
+        dispatcher.unregister(second)
+        self.assertEqual(dispatcher.addresses, [first])
+
+
+class DecodeTransfersTestCase(SimpleTestCase):
+    """
+    Test cases for the batch Transfer decoder.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.artist = "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f"
+        approval = AttributeDict(dict(
+            transfer_log(1, 9, self.artist, ZERO_ADDRESS),
+            topics=[HexBytes(bytes(32))] * 4))
+        self.logs = [transfer_log(number, number, ZERO_ADDRESS, self.artist)
+                     for number in range(1, 6)]
+        self.logs.insert(2, approval)
+
+    def test_decode_from_topics(self):
+        """Transfers are decoded from their topics, other logs are skipped."""
+        transfers = decode_transfers(self.logs)
+
+        self.assertEqual([transfer["tokenId"] for transfer in transfers],
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(transfers[0], {
+            "collection": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "from": ZERO_ADDRESS,
+            "to": self.artist,
+            "tokenId": 1,
+            "blockNumber": 1,
+            "transactionHash": "0x" + "00" * 32,
+            "logIndex": 0,
+        })
+
+    def test_process_pool_matches(self):
+        """Batches fanned out to a process pool decode the same, in order."""
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(decode_transfers(self.logs, executor, batch_size=2),
+                             decode_transfers(self.logs))
+
+
+class OwnershipCacheTestCase(SimpleTestCase):
+    """
+    Test cases for the `OwnershipCache` ingester subscription.
+    """
+
+    def test_apply_and_revert(self):
+        """Transfers set the owner and reverting them gives the token back."""
+        collection = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+        artist = Web3().eth.account.create().address
+        collector = Web3().eth.account.create().address
+        mint = transfer_log(1, 7, ZERO_ADDRESS, artist)
+        sale = transfer_log(2, 7, artist, collector)
+        cache = OwnershipCache()
+
+        cache.apply([mint, sale])
+        self.assertEqual(cache.owner_of(collection, 7), collector)
+
+        cache.revert([sale])
+        self.assertEqual(cache.owner_of(collection, 7), artist)
+
+        cache.revert([mint])
+        self.assertIsNone(cache.owner_of(collection, 7))
+
+    def test_evict(self):
+        """An unwatched collection leaves no owners behind."""
+        cache = OwnershipCache()
+        cache.apply([transfer_log(
+            1, 7, ZERO_ADDRESS, "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f")])
+
+        cache.evict("0xfce9b92ec11680898c7fe57c4ddcea83aeaba3ff")
+
+        self.assertIsNone(cache.owner_of(
+            "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff", 7))
+        self.assertEqual(cache.owners, {})
+
+
+class OwnershipIndexTestCase(SimpleTestCase):
+    """
+    Test cases for the SQLite `OwnershipIndex` and its use by `is_token_owner`.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.index = OwnershipIndex(os.path.join(self.tmp_dir.name, "owners.db"))
+        self.collection = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+        self.artist = "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f"
+        self.collector = "0xa1fC57f2Ba9f466b2BB2906dB3a5ea3000bA50C3"
+
+    def test_apply_and_revert(self):
+        """Owners follow the Transfer history and are rolled back on reorgs."""
+        mint = transfer_log(1, 7, ZERO_ADDRESS, self.artist)
+        sale = transfer_log(2, 7, self.artist, self.collector)
+
+        self.index.apply([mint, sale], 1, 2)
+        self.assertEqual(self.index.owner_of(self.collection.lower(), 7),
+                         self.collector)
+        self.assertIsNone(self.index.owner_of(self.collection, 8))
+
+        self.index.revert([sale])
+        self.assertEqual(self.index.owner_of(self.collection, 7), self.artist)
+        self.index.revert([mint])
+        self.assertIsNone(self.index.owner_of(self.collection, 7))
+
+    def test_status_lag(self):
+        """The lag is the distance between the indexed block and the seen head."""
+        self.assertEqual(self.index.status()["lag"], None)
+        self.assertFalse(self.index.is_fresh(2, 60))
+
+        self.index.apply([], 1, 100)
+        self.index.update_head(105)
+
+        self.assertEqual(self.index.status()["block"], 100)
+        self.assertEqual(self.index.status()["lag"], 5)
+        self.assertFalse(self.index.is_fresh(2, 60))
+        self.assertTrue(self.index.is_fresh(5, 60))
+
+    @patch('marketplace.contracts.ERC721Contract.get_owner_of_token')
+    def test_is_token_owner_uses_index(self, mock_get_owner_of_token):
+        """The index answers when it is caught up, ownerOf when it lags."""
+        mock_get_owner_of_token.return_value = self.collector
+        self.index.add_collections([self.collection])
+        self.index.apply([transfer_log(1, 7, ZERO_ADDRESS, self.artist)], 1, 10)
+        self.index.update_head(11)
+
+        with patch('marketplace.contracts.get_ownership_index',
+                   return_value=self.index):
+            erc721 = ERC721Contract(self.collection)
+            self.assertTrue(erc721.is_token_owner(self.artist, 7))
+            mock_get_owner_of_token.assert_not_called()
+
+            self.assertFalse(erc721.is_token_owner(self.artist, 7, max_lag=0))
+            mock_get_owner_of_token.assert_called_once_with(7)
+
+            self.index.update_head(20)
+            self.assertTrue(erc721.is_token_owner(self.collector, 7))
+
+    def test_ownership_status(self):
+        """The indexer's progress is exposed to the API clients."""
+        self.index.apply([], 1, 10)
+        self.index.update_head(12)
+
+        with patch('marketplace.views.get_ownership_index',
+                   return_value=self.index):
+            response = Client().get("/ownership/status/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["lag"], 2)
+
+        with patch('marketplace.views.get_ownership_index', return_value=None):
+            self.assertEqual(Client().get("/ownership/status/").status_code, 404)
+
+
+@patch('marketplace.views.LISTENER_TOKEN', new='listener-secret')
+@patch.dict(book.listings_by_id, clear=True)
+@patch.dict('marketplace.book.listings_by_id', clear=True)
+@patch.dict('marketplace.book.purchase_intents_by_sale', clear=True)
+@patch.dict('marketplace.book.open_sales_by_token', clear=True)
+@patch.dict('marketplace.book.open_sales_by_collection', clear=True)
+@patch.dict('marketplace.book.invalidated_by_transfer', clear=True)
+class TransferEventsTestCase(TestCase):
+    """
+    Test cases for the `transfer_events` endpoint invalidating stale listings.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.owner = "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f"
+        self.collector = "0xa1fC57f2Ba9f466b2BB2906dB3a5ea3000bA50C3"
+        self.transfer = {
+            "collection": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "from": self.owner,
+            "to": self.collector,
+            "tokenId": 123,
+            "transactionHash": "0x" + "ab" * 32,
+            "logIndex": 2,
+        }
+
+    @patch('marketplace.contracts.ERC721Contract.is_token_owner')
+    def list_token(self, token_id, mock_is_token_owner):
+        """List a token of the mock collection and return its sale_id."""
+        mock_is_token_owner.return_value = True
+        response = self.client.post(
+            "/list/",
+            json.dumps({
+                'nft_collection_address': '0xfce9b92ec11680898c7fe57c4ddcea83aeaba3ff',
+                'tokenId': token_id,
+                'erc20Address': '0xbd65c58D6F46d5c682Bf2f36306D461e3561C747',
+                'erc20_amount': 10000000000000000,
+                'isAuction': True,
+                'ownerAddress': self.owner}),
+            content_type='application/json')
+        return response.json()["sale_id"]
+
+    def post_events(self, transfers=(), reverted=(), token='listener-secret'):
+        """Push Transfer events as the listener does."""
+        return self.client.post(
+            "/events/transfers/",
+            json.dumps({"transfers": list(transfers), "reverted": list(reverted)}),
+            content_type='application/json',
+            HTTP_X_LISTENER_TOKEN=token)
+
+    def test_transfer_invalidates_listing(self):
+        """A transfer away from the seller invalidates only that token's listing."""
+        sale_id = self.list_token(123)
+        other_sale_id = self.list_token(456)
+
+        response = self.post_events([self.transfer])
+
+        self.assertEqual(response.json()["invalidated"], [sale_id])
+        self.assertTrue(book.is_sale_invalidated(sale_id))
+        self.assertFalse(book.is_sale_invalidated(other_sale_id))
+
+        response = self.client.post(
+            '/bidOrder/',
+            json.dumps({
+                'nft_collection_address': '0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff',
+                'tokenId': 123,
+                'erc20Address': '0xbd65c58D6F46d5c682Bf2f36306D461e3561C747',
+                'erc20_amount': 10500000000000000,
+                'bidderSig': '0x00',
+                'buyerAddress': self.collector,
+                'sale_id': sale_id}),
+            content_type='application/json')
+        self.assertEqual(response.json()["error"], "Listing is no longer valid")
+
+    def test_reverted_transfer_reopens_listing(self):
+        """A transfer orphaned by a reorg reopens the listings it invalidated."""
+        sale_id = self.list_token(123)
+        self.post_events([self.transfer])
+
+        response = self.post_events(reverted=[self.transfer])
+
+        self.assertEqual(response.json()["reopened"], [sale_id])
+        self.assertFalse(book.is_sale_invalidated(sale_id))
+        self.assertEqual(self.post_events([self.transfer]).json()["invalidated"],
+                         [sale_id])
+
+    def test_transfer_to_seller_keeps_listing(self):
+        """A transfer to the seller, like a mint, keeps the listing open."""
+        sale_id = self.list_token(123)
+
+        response = self.post_events([dict(self.transfer, to=self.owner)])
+
+        self.assertEqual(response.json()["invalidated"], [])
+        self.assertFalse(book.is_sale_invalidated(sale_id))
+
+    def test_invalid_listener_token(self):
+        """Events without the listener token are refused."""
+        response = self.post_events([self.transfer], token='wrong')
+        self.assertEqual(response.status_code, 403)
+
+    def test_watched_collections(self):
+        """Collections are watched while they have open listings."""
+        self.list_token(123)
+
+        response = self.client.get(
+            "/events/collections/", HTTP_X_LISTENER_TOKEN='listener-secret')
+        self.assertEqual(response.json()["collections"],
+                         ["0xfce9b92ec11680898c7fe57c4ddcea83aeaba3ff"])
+
+        self.post_events([self.transfer])
+        response = self.client.get(
+            "/events/collections/", HTTP_X_LISTENER_TOKEN='listener-secret')
+        self.assertEqual(response.json()["collections"], [])
+
+
+class OrderBookFeedTestCase(SimpleTestCase):
+    """
+    Test cases for the order-book `OrderBookFeed` and its SSE endpoint.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.feed = OrderBookFeed(history_size=3)
+        self.first = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+        self.second = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+    def listing(self, sale_id, collection):
+        """Build a listing as stored in the book."""
+        return {"sale_id": sale_id, "nft_collection_address": collection,
+                "tokenId": sale_id, "ownerAddress": self.first}
+
+    def test_fan_out_by_topic(self):
+        """Events only reach the subscribers of their topics, once each."""
+        everything = self.feed.subscribe([ALL_TOPIC])
+        collection = self.feed.subscribe([collection_topic(self.first)])
+        both = self.feed.subscribe(
+            [collection_topic(self.first), sale_topic(2)])
+
+        self.feed.publish("listing_created", self.listing(1, self.second))
+        self.feed.publish("bid_placed", dict(self.listing(2, self.first),
+                                             bidderSig="0x01"))
+
+        self.assertEqual([event["seq"] for event in everything.get(0)], [1, 2])
+        self.assertEqual([event["seq"] for event in collection.get(0)], [2])
+        events = both.get(0)
+        self.assertEqual([event["type"] for event in events], ["bid_placed"])
+        self.assertNotIn("bidderSig", events[0]["data"])
+
+        self.feed.unsubscribe(both)
+        self.assertEqual(
+            self.feed.subscriber_count(collection_topic(self.first)), 1)
+        self.assertEqual(self.feed.subscriber_count(sale_topic(2)), 0)
+
+    def test_resume_from_sequence(self):
+        """Clients resume after their last event, or reset past the history."""
+        for sale_id in range(1, 5):
+            self.feed.publish("listing_created", self.listing(sale_id, self.first))
+
+        resumed = self.feed.subscribe([sale_topic(3), sale_topic(4)], since=2)
+        self.assertEqual([event["seq"] for event in resumed.get(0)], [3, 4])
+        self.assertFalse(resumed.reset)
+
+        self.assertTrue(self.feed.subscribe([ALL_TOPIC], since=0).reset)
+        self.assertTrue(self.feed.subscribe([ALL_TOPIC], since=9).reset)
+
+    def test_async_subscriber_woken_by_publish(self):
+        """Subscribers on an event loop are woken by publishes from threads."""
+        subscription = self.feed.subscribe([ALL_TOPIC])
+
+        async def wait_for_event():
+            asyncio.get_running_loop().call_later(0.05, threading.Thread(
+                target=self.feed.publish,
+                args=("listing_created", self.listing(1, self.first))).start)
+            return await subscription.aget(5)
+
+        events = asyncio.run(wait_for_event())
+        self.assertEqual([event["seq"] for event in events], [1])
+
+    def test_sse_stream(self):
+        """The endpoint streams the events after the Last-Event-ID."""
+        self.feed.publish("listing_created", self.listing(1, self.first))
+        self.feed.publish("listing_created", self.listing(2, self.second))
+
+        with patch('marketplace.views.order_book_feed', new=self.feed):
+            response = Client().get(
+                "/feed/", {"collection": self.second.lower()},
+                HTTP_LAST_EVENT_ID="1")
+            message = next(iter(response.streaming_content)).decode()
+            response.close()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertTrue(message.startswith("id: 2\nevent: listing_created\n"))
+        self.assertEqual(self.feed.subscriber_count(
+            collection_topic(self.second)), 0)
+
+
+class TimerWheelTestCase(SimpleTestCase):
+    """
+    Test cases for the auction `TimerWheel`.
+    """
+
+    def test_due_timers_in_deadline_order(self):
+        """Timers fire once due, rescheduled and cancelled timers move or go."""
+        wheel = TimerWheel(tick=1, slots=8, start=100)
+        wheel.schedule("late", 130)
+        wheel.schedule("first", 103)
+        wheel.schedule("second", 101.5)
+        wheel.schedule("cancelled", 104)
+        wheel.schedule("moved", 101)
+        wheel.schedule("moved", 105)
+        wheel.cancel("cancelled")
+
+        self.assertEqual(wheel.advance(101.5), [])
+        self.assertEqual(wheel.advance(104), ["second", "first"])
+        self.assertEqual(wheel.advance(120), ["moved"])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(129), [])
+        self.assertEqual(wheel.advance(130), ["late"])
+
+    def test_past_deadline_fires_next_tick(self):
+        """A deadline already passed fires on the next tick."""
+        wheel = TimerWheel(tick=1, slots=8, start=100)
+        wheel.schedule(1, 50)
+        self.assertEqual(wheel.advance(101), [1])
+
+
+@patch('marketplace.views.auction_scheduler')
+@patch('marketplace.views.auction_settlements')
+@patch.dict('marketplace.views.auction_approvals', clear=True)
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class TimedAuctionTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for timed auctions, their anti-sniping and their auto-settlement.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.owner_acct = self.w3.eth.account.create()
+        self.bidder_acct = self.w3.eth.account.create()
+        self.listing = {
+            "sale_id": 1,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": 1,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": True,
+            "ownerAddress": self.owner_acct.address,
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+            "startTime": int(time.time()) - 60,
+            "endTime": int(time.time()) + 3600,
+        }
+        self.bid_intents = {}
+        for patcher in (patch_listings([self.listing]),
+                        patch('marketplace.views.bid_intents', new=self.bid_intents)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def bid(self, amount):
+        """Place a signed bid on the listing."""
+        return self.client.post("/bidOrder/", json.dumps(self.signed_order(
+            self.listing, amount, self.bidder_acct)),
+            content_type='application/json')
+
+    def approve(self):
+        """Approve the latest bid as the owner."""
+        bidder_sig = self.bid_intents[1][-1]["bidderSig"]
+        signature = self.w3.eth.account.sign_message(
+            encode_defunct(hexstr=self.w3.solidity_keccak(
+                ['bytes'], [bidder_sig]).hex()),
+            private_key=self.owner_acct.key).signature.hex()
+
+        return self.client.post("/auction_approval/", json.dumps({
+            "sale_id": 1,
+            "owner_approval_sig": signature,
+            "owner_address": self.owner_acct.address}),
+            content_type='application/json')
+
+    @patch('marketplace.contracts.ERC721Contract.is_token_owner')
+    def test_list_timed_auction(self, mock_is_token_owner, mock_settlements,
+                                mock_scheduler):
+        """Timed listings are scheduled to close, past end times are rejected."""
+        mock_is_token_owner.return_value = True
+        listing = dict(self.listing, endTime=int(time.time()) + 60)
+        body = {key: listing[key] for key in (
+            "nft_collection_address", "tokenId", "erc20Address", "erc20_amount",
+            "isAuction", "ownerAddress", "endTime")}
+
+        response = self.client.post(
+            "/list/", json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        mock_scheduler.schedule.assert_called_once_with(
+            response.json()["sale_id"], listing["endTime"])
+
+        body["endTime"] = int(time.time()) - 1
+        response = self.client.post(
+            "/list/", json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_late_bid_extends_auction(self, mock_settlements, mock_scheduler):
+        """A bid close to the end pushes the end time, bids after it are refused."""
+        self.listing["endTime"] = int(time.time()) + 10
+
+        self.assertEqual(self.bid(1000).status_code, 200)
+        self.assertGreaterEqual(self.listing["endTime"], int(time.time()) + 299)
+        mock_scheduler.schedule.assert_called_once_with(
+            1, self.listing["endTime"])
+
+        self.listing["endTime"] = int(time.time()) - 1
+        response = self.bid(2000)
+        self.assertEqual(response.json()["error"], "Auction has ended")
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.MarketplaceContract')
+    def test_close_settles_approved_winner(self, mock_marketplace_contract,
+                                           mock_settlements, mock_scheduler):
+        """The approved best bid is queued at close, then settled."""
+        mock_marketplace_contract.return_value.send_transaction.return_value = {
+            "nonce": 0}
+        self.bid(1000)
+        self.bid(1500)
+        self.assertEqual(self.approve().json()["message"],
+                         "Approval stored until the auction ends")
+
+        self.listing["endTime"] = int(time.time()) - 1
+        views.close_auction(1)
+
+        self.assertTrue(self.listing["closedAt"])
+        mock_settlements.put.assert_called_once_with(1)
+        self.assertEqual(self.bid(2000).json()["error"], "Auction has ended")
+
+        views.settle_closed_auction(1)
+        self.assertEqual(self.listing["settlementTx"], {"nonce": 0})
+        self.assertTrue(self.listing["purchaseAt"])
+
+    @patch('marketplace.contracts.ERC721Contract.is_token_owner')
+    def test_future_start_without_end(self, mock_is_token_owner,
+                                      mock_settlements, mock_scheduler):
+        """A start time is kept without an end time, bids wait for it."""
+        mock_is_token_owner.return_value = True
+        start_time = int(time.time()) + 3600
+        body = {key: self.listing[key] for key in (
+            "nft_collection_address", "tokenId", "erc20Address", "erc20_amount",
+            "isAuction", "ownerAddress")}
+        body["startTime"] = start_time
+
+        response = self.client.post(
+            "/list/", json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        listing = book.listings_by_id[response.json()["sale_id"]]
+        self.assertEqual(listing["startTime"], start_time)
+        self.assertNotIn("endTime", listing)
+        mock_scheduler.schedule.assert_not_called()
+
+        self.assertEqual(views.bid_rejection(listing, 1000),
+                         "Auction has not started")
+
+    @patch('marketplace.views.SETTLEMENT_PREFLIGHT', new=False)
+    @patch('marketplace.views.submit_settlement')
+    def test_failed_submission_is_recorded(self, mock_submit, mock_settlements,
+                                           mock_scheduler):
+        """A settlement that cannot be sent is recorded and published."""
+        mock_submit.side_effect = ValueError("nonce too low")
+        self.bid(1000)
+        self.approve()
+        self.listing["endTime"] = int(time.time()) - 1
+        views.close_auction(1)
+        version = book.version
+
+        with patch('marketplace.views.order_book_feed') as mock_feed:
+            views.settle_closed_auction(1)
+
+        self.assertEqual(self.listing["settlementError"],
+                         "Settlement failed: nonce too low")
+        self.assertFalse(self.listing["purchaseAt"])
+        self.assertEqual(book.version, version + 1)
+        self.assertEqual(mock_feed.publish.call_args.args[0],
+                         "settlement_failed")
+
+    def test_close_waits_for_approval(self, mock_settlements, mock_scheduler):
+        """Without an approval of the winner, the settlement waits for one."""
+        self.bid(1000)
+        self.approve()
+        self.bid(1500)
+
+        views.close_auction(1)
+        self.assertNotIn("closedAt", self.listing)
+
+        self.listing["endTime"] = int(time.time()) - 1
+        views.close_auction(1)
+        mock_settlements.put.assert_not_called()
+
+        self.assertEqual(self.approve().json()["message"], "Settlement queued")
+        mock_settlements.put.assert_called_once_with(1)
+
+
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class ConcurrentOrdersTestCase(OrderBookMixin, TestCase):
+    """
+    Stress tests of concurrent bids and purchases on the same sales.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.buyers = [self.w3.eth.account.create() for _ in range(8)]
+        self.listings = []
+        for sale_id, is_auction in ((1, True), (2, False), (3, True)):
+            self.listings.append({
+                "sale_id": sale_id,
+                "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+                "tokenId": sale_id,
+                "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+                "erc20_amount": 1000,
+                "isAuction": is_auction,
+                "ownerAddress": self.buyers[0].address,
+                "createdAt": "2023-10-16 00:00:00",
+                "purchaseAt": "",
+            })
+        self.bid_intents = {}
+        for patcher in (
+                patch.multiple('marketplace.views', bid_intents=self.bid_intents,
+                               purchase_reservations=ReservationQueue()),
+                patch_listings(self.listings),
+                patch.dict(book.purchase_intents_by_sale, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def order(self, sale_id, amount, buyer):
+        """Build a signed bid or purchase body."""
+        return json.dumps(
+            self.signed_order(self.listings[sale_id - 1], amount, buyer))
+
+    def post_concurrently(self, url, bodies):
+        """Post every body from its own thread, all released at once."""
+        barrier = threading.Barrier(len(bodies))
+        statuses = []
+
+        def post(body):
+            client = Client()
+            barrier.wait()
+            statuses.append(client.post(
+                url, body, content_type='application/json').status_code)
+
+        threads = [threading.Thread(target=post, args=(body,)) for body in bodies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_concurrent_bids_stay_increasing(self):
+        """Racing bids never store a bid lower than the one before it."""
+        amounts = list(range(1001, 1033))
+        random.Random(7).shuffle(amounts)
+        bodies = [self.order(1, amount, self.buyers[i % 8])
+                  for i, amount in enumerate(amounts)]
+
+        statuses = self.post_concurrently("/bidOrder/", bodies)
+
+        stored = [bid["erc20_amount"] for bid in self.bid_intents[1]]
+        self.assertEqual(stored, sorted(set(stored)))
+        self.assertEqual(statuses.count(200), len(stored))
+        self.assertEqual(stored[-1], 1032)
+
+    def test_concurrent_purchases_store_one_intent(self):
+        """Only one of many racing purchases of a sale holds it, the others are
+        queued."""
+        bodies = [self.order(2, 1000, buyer) for buyer in self.buyers]
+
+        statuses = self.post_concurrently("/purchaseOrder/", bodies)
+
+        self.assertEqual(statuses.count(200), 1)
+        self.assertEqual(statuses.count(202), len(self.buyers) - 1)
+        self.assertEqual(list(book.purchase_intents_by_sale), [2])
+        self.assertEqual(
+            len(views.purchase_reservations.waiting[2]), len(self.buyers) - 1)
+
+    def test_busy_sale_does_not_block_others(self):
+        """A held sale lock only blocks that sale."""
+        body = self.order(3, 1001, self.buyers[1])
+
+        with book.sale_lock(1):
+            response = self.client.post(
+                "/bidOrder/", body, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+
+class IntakePipelineTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for the staged intake of bids and purchases.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.buyer = self.w3.eth.account.create()
+        self.listings = [{
+            "sale_id": sale_id,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": sale_id,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": is_auction,
+            "ownerAddress": self.w3.eth.account.create().address,
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+        } for sale_id, is_auction in ((1, True), (2, False))]
+        # Funds are only read by the tests enabling the on-chain stage
+        for patcher in (
+                patch.multiple('marketplace.views', bid_intents={},
+                               INTAKE_ONCHAIN_CHECKS=[]),
+                patch_listings(self.listings),
+                patch.dict(book.purchase_intents_by_sale, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        signatures = patch.object(book, 'used_signatures', set())
+        signatures.start()
+        self.addCleanup(signatures.stop)
+        views.purchase_pipeline.reset()
+        views.bid_pipeline.reset()
+
+    def order(self, sale_id, amount):
+        """Build a signed bid or purchase body."""
+        return self.signed_order(self.listings[sale_id - 1], amount, self.buyer)
+
+    def post(self, url, body):
+        """Post a JSON body."""
+        return self.client.post(url, json.dumps(body),
+                                content_type='application/json')
+
+    def test_stages_count_passes(self):
+        """An accepted bid passes every stage once."""
+        response = self.post("/bidOrder/", self.order(1, 1001))
+
+        self.assertEqual(response.status_code, 200)
+        snapshot = views.bid_pipeline.snapshot()
+        self.assertEqual(list(snapshot),
+                         ["schema", "rate", "book", "replay", "signature",
+                          "buyer_rate", "onchain"])
+        for metrics in snapshot.values():
+            self.assertEqual((metrics["passed"], metrics["rejected"]), (1, 0))
+
+    def test_low_bid_skips_signature_recovery(self):
+        """A bid rejected by the book never reaches signature recovery."""
+        self.post("/bidOrder/", self.order(1, 1001))
+        views.bid_pipeline.reset()
+
+        with patch('marketplace.views.Account.recover_message') as recover:
+            response = self.post("/bidOrder/", self.order(1, 900))
+
+        self.assertEqual(response.status_code, 400)
+        recover.assert_not_called()
+        snapshot = views.bid_pipeline.snapshot()
+        self.assertEqual(snapshot["book"]["rejected"], 1)
+        self.assertEqual(
+            snapshot["book"]["reasons"], {"listing_rejected": 1})
+        self.assertEqual(snapshot["signature"]["passed"], 0)
+
+    def test_malformed_orders_share_a_reason(self):
+        """Rejections are counted by reason code, not by their message."""
+        for amount in ("abc", "def"):
+            response = self.post("/bidOrder/", dict(
+                self.order(1, 1001), erc20_amount=amount))
+            self.assertIn(amount, response.json()["error"])
+
+        self.assertEqual(views.bid_pipeline.snapshot()["schema"]["reasons"],
+                         {"invalid_body": 2})
+
+    def test_replayed_signature_rejected(self):
+        """A signature stored once cannot back another intent."""
+        body = self.order(2, 1000)
+        self.assertEqual(self.post("/purchaseOrder/", body).status_code, 200)
+        book.purchase_intents_by_sale.clear()
+
+        response = self.post("/purchaseOrder/", body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Signature already used")
+        self.assertEqual(
+            views.purchase_pipeline.snapshot()["replay"]["rejected"], 1)
+
+    def test_forged_signature_rejected(self):
+        """A signature of another address is rejected at the signature stage."""
+        body = self.order(2, 1000)
+        body["buyerAddress"] = self.listings[0]["ownerAddress"]
+
+        response = self.post("/purchaseOrder/", body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            views.purchase_pipeline.snapshot()["signature"]["rejected"], 1)
+
+    @patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=['purchase_order'])
+    @patch('marketplace.views.funds_cache')
+    def test_onchain_allowance_checked(self, funds_cache):
+        """With on-chain checks enabled, a missing allowance is rejected."""
+        funds_cache.get.return_value = (5000, 0)
+
+        response = self.post("/purchaseOrder/", self.order(2, 1000))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"],
+                         "Buyer ERC20 allowance is too low")
+        funds_cache.get.assert_called_once_with(
+            self.listings[1]["erc20Address"], self.buyer.address)
+
+    @patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=['purchase_order'])
+    def test_unavailable_funds_read_rejected(self):
+        """A provider error reading the funds answers a 503, not a crash."""
+        with patch.object(views.funds_cache, 'fetch',
+                          side_effect=ReadTimeout("timeout")):
+            response = self.post("/purchaseOrder/", self.order(2, 1000))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["error"],
+                         "Buyer funds could not be checked")
+        self.assertIsNone(views.find_purchase_intents(2))
+        self.assertEqual(
+            views.purchase_pipeline.snapshot()["onchain"]["reasons"],
+            {"funds_unavailable": 1})
+
+    @patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=['purchase_order'])
+    @patch('marketplace.views.funds_cache')
+    def test_order_for_other_token_rejected(self, funds_cache):
+        """An order signed for another ERC20 or token never reads funds."""
+        body = self.order(2, 1000)
+        body["erc20Address"] = "0x" + "11" * 20
+        other_erc20 = self.post("/purchaseOrder/", body)
+        body = self.order(2, 1000)
+        body["tokenId"] = 1
+        other_token = self.post("/purchaseOrder/", body)
+
+        for response in (other_erc20, other_token):
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"],
+                             "Order does not match the listing")
+        funds_cache.get.assert_not_called()
+
+    def test_metrics_endpoint(self):
+        """The metrics endpoint reports both pipelines."""
+        self.post("/purchaseOrder/", {"sale_id": 2})
+
+        response = self.client.get("/metrics/intake/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["purchase_order"]["schema"]["rejected"], 1)
+        self.assertIn("bid_order", response.json())
+
+
+class FundsCacheTestCase(SimpleTestCase):
+    """
+    Test cases for the event-driven cache of buyer ERC20 funds.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.token = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+        self.buyer = "0x929A4DfC610963246644b1A7f6D1aed40a27dD2f"
+        self.seller = "0xa1fC57f2Ba9f466b2BB2906dB3a5ea3000bA50C3"
+        self.spender = "0x597C9bC3F00a4Df00F85E9334628f6cDf03A1184"
+        self.chain = {"block": 100, "balance": 5000, "allowance": 2000}
+        self.now = 1000.0
+
+        w3 = Web3()
+        self.multicall = MagicMock()
+        self.multicall.w3 = w3
+        self.multicall.contract_address = MulticallContract.MULTICALL_ADDRESS
+        self.multicall.contract = w3.eth.contract(
+            abi=MulticallContract.MULTICALL_ABI)
+        self.multicall.aggregate.side_effect = self.aggregate
+
+        self.cache = FundsCache(self.multicall, self.spender, ttl=60,
+                                clock=lambda: self.now)
+
+    def aggregate(self, calls):
+        """Answer the block number, then a balance and allowance per holder."""
+        results = [(True, encode(["uint256"], [self.chain["block"]]))]
+        for _ in range((len(calls) - 1) // 2):
+            results.append((True, encode(["uint256"], [self.chain["balance"]])))
+            results.append(
+                (True, encode(["uint256"], [self.chain["allowance"]])))
+        return results
+
+    def event(self, name, sender, to, value, block):
+        """Build a decoded ERC20 event."""
+        return {"token": self.token, "event": name, "from": sender, "to": to,
+                "value": value, "blockNumber": block,
+                "transactionHash": "0x01", "logIndex": 0}
+
+    def test_reads_once_then_cached(self):
+        """A holder is read once, then answered from the cache."""
+        self.assertEqual(self.cache.get(self.token, self.buyer), (5000, 2000))
+        self.assertEqual(self.cache.get(self.token, self.buyer), (5000, 2000))
+
+        self.assertEqual(self.cache.fetches, 1)
+        self.assertEqual(self.cache.tokens(), [self.token.lower()])
+
+    def test_holders_read_in_one_call(self):
+        """Missing holders are read together with one multicall."""
+        keys = [funds_key(self.token, self.buyer),
+                funds_key(self.token, self.seller)]
+
+        funds = self.cache.get_many(keys)
+
+        self.assertEqual(self.multicall.aggregate.call_count, 1)
+        self.assertEqual(len(self.multicall.aggregate.call_args[0][0]), 5)
+        self.assertEqual(set(funds.values()), {(5000, 2000)})
+
+    def test_events_update_cached_funds(self):
+        """Transfers move balances and Approvals to the marketplace set allowances."""
+        self.cache.get(self.token, self.buyer)
+        self.cache.get(self.token, self.seller)
+
+        self.cache.apply([
+            self.event("Transfer", self.buyer, self.seller, 1500, 101),
+            self.event("Approval", self.buyer, self.spender, 7000, 101),
+            self.event("Approval", self.buyer, self.seller, 1, 102),
+        ])
+
+        self.assertEqual(self.cache.get(self.token, self.buyer), (3500, 7000))
+        self.assertEqual(self.cache.get(self.token, self.seller), (6500, 2000))
+        self.assertEqual(self.cache.fetches, 2)
+
+    def test_events_already_read_are_skipped(self):
+        """Events of blocks the entry was read at are not applied twice."""
+        self.cache.get(self.token, self.buyer)
+
+        self.cache.apply(
+            [self.event("Transfer", self.buyer, self.seller, 1500, 100)])
+
+        self.assertEqual(self.cache.get(self.token, self.buyer), (5000, 2000))
+
+    def test_expired_entry_read_again(self):
+        """An entry older than the TTL is read again from the chain."""
+        self.cache.get(self.token, self.buyer)
+        self.chain.update(block=120, balance=10)
+        self.now += 61
+
+        self.assertEqual(self.cache.get(self.token, self.buyer), (10, 2000))
+        self.assertEqual(self.cache.fetches, 2)
+
+    def test_reverted_events_drop_entries(self):
+        """Entries touched by an orphaned event are read again."""
+        self.cache.get(self.token, self.buyer)
+
+        self.cache.revert(
+            [self.event("Approval", self.buyer, self.spender, 0, 101)])
+
+        self.assertEqual(self.cache.entries, {})
+
+    def test_decode_erc20_event(self):
+        """ERC20 logs are decoded and ERC721 Transfers skipped."""
+        topics = [HexBytes(APPROVAL_TOPIC),
+                  HexBytes(bytes(12) + bytes.fromhex(self.buyer[2:])),
+                  HexBytes(bytes(12) + bytes.fromhex(self.spender[2:]))]
+        log = AttributeDict({
+            "address": self.token, "topics": topics,
+            "data": HexBytes(encode(["uint256"], [42])), "blockNumber": 7,
+            "transactionHash": HexBytes(b"\x01" * 32), "logIndex": 3})
+        nft_log = AttributeDict(dict(
+            log, topics=[HexBytes(TRANSFER_TOPIC)] + topics[1:]
+            + [HexBytes(bytes(32))]))
+
+        event = decode_erc20_event(log)
+
+        self.assertEqual(event["event"], "Approval")
+        self.assertEqual((event["from"], event["to"], event["value"]),
+                         (self.buyer, self.spender, 42))
+        self.assertIsNone(decode_erc20_event(nft_log))
+
+    @patch('marketplace.views.LISTENER_TOKEN', 'secret')
+    def test_erc20_events_endpoint(self):
+        """Pushed events update the web process cache."""
+        self.cache.get(self.token, self.buyer)
+
+        with patch('marketplace.views.funds_cache', self.cache):
+            response = self.client.post(
+                "/events/erc20/",
+                json.dumps({"events": [self.event(
+                    "Transfer", self.buyer, self.seller, 500, 101)]}),
+                content_type='application/json',
+                HTTP_X_LISTENER_TOKEN='secret')
+            collections = self.client.get(
+                "/events/collections/", HTTP_X_LISTENER_TOKEN='secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cache.get(self.token, self.buyer), (4500, 2000))
+        self.assertEqual(collections.json()["erc20Tokens"],
+                         [self.token.lower()])
+
+
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class BidQueriesTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for the bid ladder and the bid query endpoints.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.bidders = [self.w3.eth.account.create() for _ in range(3)]
+        self.listing = {
+            "sale_id": 1,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": 1,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": True,
+            "ownerAddress": self.w3.eth.account.create().address,
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+        }
+        for patcher in (patch('marketplace.views.bid_intents', new={}),
+                        patch_listings([self.listing])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        signatures = patch.object(book, 'used_signatures', set())
+        signatures.start()
+        self.addCleanup(signatures.stop)
+        ladders = patch.dict(book.bids_by_sale, clear=True)
+        ladders.start()
+        self.addCleanup(ladders.stop)
+
+    def bid(self, amount, bidder):
+        """Place a signed bid."""
+        return self.client.post("/bidOrder/", json.dumps(self.signed_order(
+            self.listing, amount, bidder)), content_type='application/json')
+
+    def test_ladder_orders_by_amount_then_arrival(self):
+        """The best bids come highest first, the earliest first on ties."""
+        ladder = BidLadder()
+        for amount, bidder in ((10, "0xA"), (30, "0xB"), (20, "0xC"),
+                               (30, "0xD")):
+            ladder.add({"erc20_amount": amount, "bidderAddress": bidder})
+
+        self.assertEqual([bid["bidderAddress"] for bid in ladder.top(3)],
+                         ["0xB", "0xD", "0xC"])
+        self.assertEqual([bid["bidderAddress"] for bid in ladder.page(1, 2)],
+                         ["0xC", "0xB"])
+        self.assertEqual(len(ladder.bids_of("0xa")), 1)
+
+    def test_top_bids_cached_until_next_bid(self):
+        """The serialized top bids are reused until a bid is accepted."""
+        self.bid(1100, self.bidders[0])
+        self.bid(1200, self.bidders[1])
+
+        first = self.client.get("/bids/top/", {"sale_id": 1, "n": 1})
+        ladder = book.bid_ladder(1)
+        self.assertIs(ladder.top_json(1), ladder.top_json(1))
+        self.bid(1300, self.bidders[2])
+        second = self.client.get("/bids/top/", {"sale_id": 1, "n": 1})
+
+        self.assertEqual(first.json()["bids"][0]["erc20_amount"], 1200)
+        self.assertEqual(second.json()["bids"][0]["erc20_amount"], 1300)
+        self.assertNotIn("bidderSig", second.json()["bids"][0])
+
+    def test_bid_history_pages(self):
+        """The history is paged newest first with the next offset."""
+        for i, amount in enumerate((1100, 1200, 1300)):
+            self.bid(amount, self.bidders[i])
+
+        first = self.client.get("/bids/", {"sale_id": 1, "limit": 2}).json()
+        last = self.client.get(
+            "/bids/", {"sale_id": 1, "limit": 2, "offset": 2}).json()
+
+        self.assertEqual([bid["erc20_amount"] for bid in first["bids"]],
+                         [1300, 1200])
+        self.assertEqual((first["total"], first["nextOffset"]), (3, 2))
+        self.assertEqual([bid["erc20_amount"] for bid in last["bids"]], [1100])
+        self.assertIsNone(last["nextOffset"])
+
+    def test_bidder_bids(self):
+        """The bids of one bidder are found by address, in any case."""
+        self.bid(1100, self.bidders[0])
+        self.bid(1200, self.bidders[1])
+        self.bid(1300, self.bidders[0])
+
+        response = self.client.get("/bids/bidder/", {
+            "sale_id": 1, "address": self.bidders[0].address.lower()})
+
+        self.assertEqual(
+            [bid["erc20_amount"] for bid in response.json()["bids"]],
+            [1100, 1300])
+
+    def test_unknown_auction(self):
+        """Queries of unknown sales and bad parameters are rejected."""
+        self.assertEqual(
+            self.client.get("/bids/top/", {"sale_id": 9}).status_code, 404)
+        self.assertEqual(
+            self.client.get("/bids/", {"sale_id": "x"}).status_code, 400)
+
+
+class MatchingEngineTestCase(TestCase):
+    """
+    Test cases for collection offers and their matching with listings.
+    """
+
+    collection = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+    erc20 = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.buyer = self.w3.eth.account.create()
+        self.engine = MatchingEngine()
+
+    def offer(self, amount, buyer="0xB"):
+        """Build an offer."""
+        return {"nft_collection_address": self.collection,
+                "erc20Address": self.erc20, "erc20_amount": amount,
+                "buyerAddress": buyer}
+
+    def listing(self, sale_id, amount):
+        """Build a fixed-price listing."""
+        return {"sale_id": sale_id, "nft_collection_address": self.collection,
+                "tokenId": sale_id, "erc20Address": self.erc20,
+                "erc20_amount": amount, "isAuction": False,
+                "ownerAddress": "0xA", "purchaseAt": ""}
+
+    def test_listing_matches_best_offer(self):
+        """A listing takes the highest offer, the oldest on ties."""
+        for amount, buyer in ((900, "0x1"), (1200, "0x2"), (1200, "0x3")):
+            self.assertIsNone(self.engine.add_offer(self.offer(amount, buyer)))
+
+        first = self.engine.add_listing(self.listing(1, 1000))
+        second = self.engine.add_listing(self.listing(2, 1000))
+        third = self.engine.add_listing(self.listing(3, 1000))
+
+        self.assertEqual((first["buyerAddress"], first["erc20_amount"]),
+                         ("0x2", 1000))
+        self.assertEqual(second["buyerAddress"], "0x3")
+        self.assertIsNone(third)
+
+    def test_offer_matches_cheapest_open_listing(self):
+        """An offer takes the cheapest listing still for sale."""
+        self.engine.is_open = lambda listing: listing["sale_id"] != 2
+        for sale_id, amount in ((1, 1100), (2, 800), (3, 900)):
+            self.assertIsNone(
+                self.engine.add_listing(self.listing(sale_id, amount)))
+
+        match = self.engine.add_offer(self.offer(1000))
+
+        self.assertEqual((match["sale_id"], match["erc20_amount"]), (3, 900))
+        self.assertIsNone(self.engine.add_offer(self.offer(1000)))
+
+    def test_cancelled_offer_skipped(self):
+        """A cancelled offer no longer matches."""
+        offer = self.offer(1200)
+        self.engine.add_offer(offer)
+        self.engine.add_offer(self.offer(1000, "0x2"))
+
+        self.engine.cancel_offer(offer["offerId"])
+        match = self.engine.add_listing(self.listing(1, 1000))
+
+        self.assertEqual(match["buyerAddress"], "0x2")
+
+    def test_other_books_do_not_match(self):
+        """Offers only match listings of their collection and ERC20."""
+        self.engine.add_offer(dict(self.offer(5000), erc20Address="0x1"))
+
+        self.assertIsNone(self.engine.add_listing(self.listing(1, 10)))
+
+    @patch.dict(book.listings_by_id, clear=True)
+    @patch.dict(book.purchase_intents_by_sale, clear=True)
+    @patch('marketplace.views.offer_matches', [])
+    @patch('marketplace.views.offer_holds', {})
+    @patch('marketplace.views.purchase_reservations', ReservationQueue())
+    @patch('marketplace.views.purchase_leases', MagicMock())
+    def test_offer_endpoint_matches_new_listing(self):
+        """A signed offer rests and is matched by a later listing."""
+        message = self.w3.solidity_keccak(
+            ['address', 'address', 'uint256'], [self.collection, self.erc20, 1000])
+        signature = self.w3.eth.account.sign_message(
+            encode_defunct(hexstr=message.hex()),
+            private_key=self.buyer.key).signature.hex()
+        body = dict(self.offer(1000, self.buyer.address), buyerSig=signature)
+
+        with patch('marketplace.views.matching_engine', MatchingEngine()):
+            placed = self.client.post(
+                "/offers/", json.dumps(body), content_type='application/json')
+            resting = self.client.get("/offers/", {"collection": self.collection})
+            with patch.object(ERC721Contract, 'is_token_owner',
+                              return_value=True):
+                self.client.post("/list/", json.dumps({
+                    "nft_collection_address": self.collection, "tokenId": 7,
+                    "erc20Address": self.erc20, "erc20_amount": 950,
+                    "isAuction": False, "ownerAddress": "0xA"}),
+                    content_type='application/json')
+            matches = self.client.get(
+                "/offers/matches/", {"buyer": self.buyer.address})
+
+        self.assertEqual(placed.json()["message"], "Offer placed")
+        self.assertNotIn("buyerSig", resting.json()["offers"][0])
+        match = matches.json()["matches"][0]
+        self.assertEqual((match["tokenId"], match["erc20_amount"]), (7, 950))
+
+    def sign(self, account, types, values):
+        """Sign a keccak message as an EIP-191 message."""
+        message = self.w3.solidity_keccak(types, values)
+        return self.w3.eth.account.sign_message(
+            encode_defunct(hexstr=message.hex()),
+            private_key=account.key).signature.hex()
+
+    def post(self, url, body):
+        """Post a JSON body."""
+        return self.client.post(url, json.dumps(body),
+                                content_type='application/json')
+
+    @patch.object(book, 'used_signatures', set())
+    def test_offer_replay_rejected(self):
+        """A signed offer is placed once, then cancelled by its buyer only."""
+        body = dict(self.offer(1000, self.buyer.address), buyerSig=self.sign(
+            self.buyer, ['address', 'address', 'uint256'],
+            [self.collection, self.erc20, 1000]))
+
+        with patch('marketplace.views.matching_engine', MatchingEngine()) as engine:
+            offer_id = self.post("/offers/", body).json()["offerId"]
+            replayed = self.post("/offers/", body)
+            forged = self.post("/offers/cancel/", {
+                "offerId": offer_id, "buyerAddress": self.buyer.address,
+                "buyerSig": self.sign(self.w3.eth.account.create(),
+                                      ['string', 'uint256'],
+                                      ["cancel_offer", offer_id])})
+            cancelled = self.post("/offers/cancel/", {
+                "offerId": offer_id, "buyerAddress": self.buyer.address,
+                "buyerSig": self.sign(self.buyer, ['string', 'uint256'],
+                                      ["cancel_offer", offer_id])})
+
+        self.assertEqual(replayed.json()["error"], "Signature already used")
+        self.assertEqual(forged.status_code, 400)
+        self.assertEqual(cancelled.status_code, 200)
+        self.assertEqual(engine.offers, {})
+
+    @patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+    @patch.dict(book.listings_by_id, clear=True)
+    @patch.dict(book.purchase_intents_by_sale, clear=True)
+    @patch('marketplace.views.offer_matches', [])
+    @patch('marketplace.views.offer_holds', {})
+    @patch('marketplace.views.purchase_reservations', ReservationQueue())
+    @patch('marketplace.views.purchase_leases')
+    @patch.object(book, 'used_signatures', set())
+    def test_match_holds_listing_for_buyer(self, purchase_leases):
+        """A matched listing is held for the offer's buyer, others queue."""
+        other = self.w3.eth.account.create()
+        body = dict(self.offer(1000, self.buyer.address), buyerSig=self.sign(
+            self.buyer, ['address', 'address', 'uint256'],
+            [self.collection, self.erc20, 1000]))
+
+        with patch('marketplace.views.matching_engine', MatchingEngine(
+                views.listing_is_open)):
+            self.post("/offers/", body)
+            with patch.object(ERC721Contract, 'is_token_owner',
+                              return_value=True):
+                sale_id = self.post("/list/", {
+                    "nft_collection_address": self.collection, "tokenId": 7,
+                    "erc20Address": self.erc20, "erc20_amount": 950,
+                    "isAuction": False, "ownerAddress": "0xA"}).json()["sale_id"]
+
+            purchases = [self.post("/purchaseOrder/", {
+                "nft_collection_address": self.collection, "tokenId": 7,
+                "erc20Address": self.erc20, "erc20_amount": 950,
+                "bidderSig": self.sign(
+                    buyer, ['address', 'address', 'uint256', 'uint256'],
+                    [self.collection, self.erc20, 7, 950]),
+                "buyerAddress": buyer.address, "sale_id": sale_id})
+                for buyer in (other, self.buyer)]
+
+        purchase_leases.schedule.assert_called()
+        self.assertEqual([response.status_code for response in purchases],
+                         [202, 200])
+        self.assertEqual(views.find_purchase_intents(sale_id)["buyerAddress"],
+                         self.buyer.address)
+        self.assertEqual(views.offer_holds, {})
+
+    def test_offer_signature_checked(self):
+        """An offer signed by another address is rejected."""
+        body = dict(self.offer(1000, self.buyer.address), buyerSig="0x" + "11" * 65)
+
+        response = self.client.post(
+            "/offers/", json.dumps(body), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class CollectionStatsTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for the incrementally kept collection statistics.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.patch_book()
+
+    def listing(self, sale_id, amount, is_auction=False):
+        """Index a new listing."""
+        return self.index_listing(sale_id, amount, is_auction)
+
+    def current(self):
+        """Read the statistics of the test collection and ERC20."""
+        return self.stats.collection(self.collection)[self.erc20.lower()]
+
+    def test_floor_follows_listings_and_intents(self):
+        """The floor is the cheapest fixed-price listing still for sale."""
+        self.listing(1, 900)
+        self.listing(2, 700)
+        self.listing(3, 700)
+        self.listing(4, 500, is_auction=True)
+
+        self.assertEqual((self.current()["floorPrice"],
+                          self.current()["openCount"]), (700, 4))
+
+        book.index_purchase_intent(
+            {"sale_id": 2, "buyerSig": "0x01", "erc20_amount": 700})
+        self.assertEqual(self.current()["floorPrice"], 700)
+        book.index_purchase_intent(
+            {"sale_id": 3, "buyerSig": "0x02", "erc20_amount": 700})
+        self.assertEqual(self.current()["floorPrice"], 900)
+
+    def test_best_bid_and_volume(self):
+        """Bids raise the best bid and settlements add to the volume once."""
+        self.listing(1, 500, is_auction=True)
+        self.listing(2, 500, is_auction=True)
+        for sale_id, amount in ((1, 600), (2, 800), (1, 900)):
+            book.index_bid({"sale_id": sale_id, "erc20_amount": amount,
+                            "bidderSig": f"0x{sale_id}{amount}",
+                            "bidderAddress": "0xB"})
+        self.assertEqual(self.current()["bestBid"], 900)
+
+        intent = {"sale_id": 1, "erc20_amount": 900}
+        book.record_settlement(intent)
+        book.record_settlement(intent)
+
+        self.assertEqual(self.current()["bestBid"], 800)
+        self.assertEqual((self.current()["volume"],
+                          self.current()["settledCount"]), (900, 1))
+
+    def test_invalidation_and_revert(self):
+        """An invalidated listing leaves the stats and comes back on revert."""
+        self.listing(1, 900)
+        transfer = {"collection": self.collection, "tokenId": 1, "to": "0xC",
+                    "transactionHash": "0x01", "logIndex": 0}
+
+        with patch.dict(book.invalidated_by_transfer, clear=True):
+            book.invalidate_transfer(transfer)
+            invalidated = self.current()
+            book.revert_transfer(transfer)
+
+        self.assertEqual((invalidated["openCount"], invalidated["floorPrice"]),
+                         (0, None))
+        self.assertEqual((self.current()["openCount"],
+                          self.current()["floorPrice"]), (1, 900))
+
+    def test_removed_listing_is_forgotten(self):
+        """Removing a listing drops its entry, its volume is kept."""
+        self.listing(1, 900)
+        self.listing(2, 700)
+        book.record_settlement({"sale_id": 1, "erc20_amount": 900})
+
+        with patch.object(book, 'tombstones', []), \
+                patch.object(book, 'tombstone_times', []):
+            for sale_id in (1, 2):
+                book.remove_listing(book.listings_by_id[sale_id], "cancelled")
+
+        self.assertEqual(self.stats._sales, {})
+        self.assertEqual((self.current()["openCount"],
+                          self.current()["floorPrice"],
+                          self.current()["volume"]), (0, None, 900))
+
+    def test_stats_endpoint(self):
+        """The endpoint serves the statistics per ERC20."""
+        self.listing(1, 900)
+
+        response = self.client.get("/stats/", {"collection": self.collection})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["erc20"][self.erc20.lower()]["floorPrice"], 900)
+        self.assertEqual(self.client.get("/stats/").status_code, 400)
+
+
+class PriceHistoryTestCase(TestCase):
+    """
+    Test cases for the OHLC price history.
+    """
+
+    collection = "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff"
+    erc20 = "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747"
+
+    def test_candles_roll_up_trades(self):
+        """Trades of an interval make one candle, empty intervals are skipped."""
+        series = CandleSeries(60, 10)
+        for timestamp, price in ((600, 10), (610, 14), (650, 8), (659, 12),
+                                 (780, 20)):
+            series.add(timestamp, price)
+
+        candles = series.query()
+
+        self.assertEqual(candles["time"], [600, 780])
+        self.assertEqual(
+            [candles[name][0] for name in ("open", "high", "low", "close")],
+            [10, 14, 8, 12])
+        self.assertEqual((candles["volume"][0], candles["count"][0]), (44, 4))
+
+    def test_retention_drops_old_candles(self):
+        """Only the last capacity intervals are kept."""
+        series = CandleSeries(60, 3)
+        for minute in range(6):
+            series.add(minute * 60, minute)
+        series.add(0, 99)
+
+        candles = series.query(start=0)
+
+        self.assertEqual(candles["time"], [180, 240, 300])
+        self.assertEqual(series.query(start=240, end=250)["time"], [240])
+
+    def test_settlements_recorded_once(self):
+        """A settled sale is recorded once, in every interval."""
+        history = PriceHistory()
+        listing = {"sale_id": 1, "nft_collection_address": self.collection,
+                   "tokenId": 1, "erc20Address": self.erc20,
+                   "erc20_amount": 900, "isAuction": False,
+                   "ownerAddress": "0xA", "purchaseAt": ""}
+
+        with patch.object(book, 'price_history', history), \
+                patch.object(book, 'collection_stats', StatsBook()), \
+                patch.dict(book.listings_by_id, {1: listing}):
+            book.record_settlement({"sale_id": 1, "erc20_amount": 900})
+            book.record_settlement({"sale_id": 1, "erc20_amount": 900})
+            response = self.client.get("/candles/", {
+                "collection": self.collection, "erc20Address": self.erc20,
+                "interval": "1d"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["candles"]["count"], [1])
+        self.assertEqual(response.json()["candles"]["close"], [900])
+
+    def test_invalid_query(self):
+        """Unknown intervals and bad times are rejected."""
+        for params in ({"interval": "5m"}, {"from": "yesterday"},
+                       {"from": "nan"}, {"to": "inf"}, {"to": "1e400"}):
+            response = self.client.get("/candles/", dict(
+                params, collection=self.collection, erc20Address=self.erc20))
+            self.assertEqual(response.status_code, 400)
+
+
+class DutchListingTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for declining-price listings.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.patch_book()
+
+    def listing(self, sale_id, amount, end_price=None, decay="linear"):
+        """Index a fixed-price or Dutch listing over 1000s from t=1000."""
+        if end_price is None:
+            return self.index_listing(sale_id, amount)
+        return self.index_listing(sale_id, amount, startTime=1000, endTime=2000,
+                                  endPrice=end_price, decay=decay)
+
+    def test_price_declines_with_time(self):
+        """The price follows its curve and stays at the end price."""
+        linear = self.listing(1, 1000, 200)
+        exponential = self.listing(2, 1000, 250, decay="exponential")
+
+        self.assertEqual(current_price(linear, 500), 1000)
+        self.assertEqual(current_price(linear, 1500), 600)
+        self.assertEqual(current_price(linear, 5000), 200)
+        self.assertAlmostEqual(current_price(exponential, 1500), 500)
+
+    def test_floor_includes_dutch_prices(self):
+        """The floor is the lowest current price, Dutch listings included."""
+        self.listing(1, 700)
+        self.listing(2, 1000, 200)
+        self.listing(3, 5000, 4000)
+
+        floors = [self.stats.collection(self.collection, now)[
+            self.erc20.lower()]["floorPrice"] for now in (1000, 1500, 2000)]
+
+        self.assertEqual(floors, [700, 600, 200])
+
+    def test_price_range_filter(self):
+        """Range queries price Dutch listings at the query time."""
+        self.listing(1, 700)
+        self.listing(2, 1000, 200)
+        self.listing(3, 5000, 4000)
+
+        found = self.stats.for_sale(self.collection, self.erc20, 500, 800, 1500)
+
+        self.assertEqual(found, [(600, 2), (700, 1)])
+
+    def test_price_range_skips_cheap_dutch_listings(self):
+        """Dutch listings starting under the range are never priced."""
+        for sale_id in range(1, 101):
+            self.listing(sale_id, 500, 100)
+        self.listing(101, 1000, 200)
+
+        with patch('marketplace.stats.current_price',
+                   wraps=current_price) as priced:
+            found = self.stats.for_sale(
+                self.collection, self.erc20, 550, 800, 1500)
+
+        self.assertEqual(found, [(600, 101)])
+        self.assertEqual(priced.call_count, 1)
+
+    @patch.dict(book.purchase_intents_by_sale, clear=True)
+    def test_purchase_at_current_price(self):
+        """A purchase at or above the current price is accepted."""
+        listing = self.listing(1, 1000, 200)
+
+        with patch('marketplace.views.time.time', return_value=1500), \
+                patch('marketplace.dutch.time.time', return_value=1500):
+            low = views.purchase_rejection(listing, 599)
+            enough = views.purchase_rejection(listing, 600)
+
+        self.assertEqual(
+            low, "Purchase intent amount must be at least the current price")
+        self.assertIsNone(enough)
+
+    @patch.dict(book.listings_by_id, clear=True)
+    @patch.object(ERC721Contract, 'is_token_owner', return_value=True)
+    def test_list_dutch(self, _):
+        """Dutch listings are validated and priced when read."""
+        data = {"nft_collection_address": self.collection, "tokenId": 1,
+                "erc20Address": self.erc20, "erc20_amount": 1000,
+                "isAuction": False, "ownerAddress": "0xA",
+                "endTime": int(time.time()) + 3600, "endPrice": 100}
+
+        created = self.client.post(
+            "/list/", json.dumps(data), content_type='application/json')
+        rejected = self.client.post(
+            "/list/", json.dumps(dict(data, endPrice=2000)),
+            content_type='application/json')
+        listed = self.client.get("/list/").json()
+
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(rejected.status_code, 400)
+        self.assertLessEqual(listed[0]["currentPrice"], 1000)
+        self.assertEqual(listed[0]["decay"], "linear")
+
+
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class PurchaseReservationTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for the queue of buyers behind a fixed-price listing.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.buyers = [self.w3.eth.account.create() for _ in range(3)]
+        self.listing = {
+            "sale_id": 1,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": 1,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": False,
+            "ownerAddress": "0xA",
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+        }
+        self.now = time.time()
+        self.leases = AuctionScheduler(
+            views.expire_purchase_lease, TimerWheel(start=self.now))
+        # The tests fire the timers, the scheduler thread would race them
+        patcher = patch.object(self.leases, '_start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch_listings([self.listing])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.multiple(
+            'marketplace.views',
+            purchase_reservations=ReservationQueue(lease_seconds=60),
+            purchase_leases=self.leases,
+            matching_engine=MatchingEngine(views.listing_is_open))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict(book.purchase_intents_by_sale, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def purchase(self, buyer):
+        """Post a signed purchase of the listing, with its lease starting now."""
+        with patch('marketplace.views.time.time', return_value=self.now):
+            return self.client.post("/purchaseOrder/", json.dumps(self.signed_order(
+                self.listing, 1000, buyer)), content_type='application/json')
+
+    def expire(self, seconds):
+        """Fire the lease timers due after some seconds."""
+        with patch('marketplace.views.time.time', return_value=self.now + seconds):
+            return self.leases.run_once(self.now + seconds)
+
+    def holder(self):
+        """Get the buyer address holding the sale."""
+        holder = views.find_purchase_intents(1)
+        return holder["buyerAddress"] if holder else None
+
+    def test_later_buyers_are_queued(self):
+        """The first buyer holds the sale, the next ones wait in order."""
+        first = self.purchase(self.buyers[0])
+        second = self.purchase(self.buyers[1])
+        third = self.purchase(self.buyers[2])
+        again = self.purchase(self.buyers[1])
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("leaseExpiresAt", first.json())
+        self.assertEqual([second.json()["position"], third.json()["position"]],
+                         [1, 2])
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(self.holder(), self.buyers[0].address)
+
+    def test_expired_lease_promotes_next_buyer(self):
+        """Expired leases hand the sale to the waiting buyers in order."""
+        for buyer in self.buyers[:2]:
+            self.purchase(buyer)
+        first = views.find_purchase_intents(1)
+
+        self.assertEqual(self.expire(30), [])
+        self.assertEqual(self.holder(), self.buyers[0].address)
+
+        self.assertEqual(self.expire(61), [1])
+        self.assertEqual(self.holder(), self.buyers[1].address)
+        self.assertEqual(first["releaseReason"], "expired")
+
+        self.expire(200)
+        self.assertIsNone(self.holder())
+        self.assertTrue(views.listing_is_open(self.listing))
+
+    def test_failed_settlement_promotes_next_buyer(self):
+        """A failed settlement promotes the next buyer, a settled one ends the
+        queue."""
+        for buyer in self.buyers:
+            self.purchase(buyer)
+
+        views.finish_purchase_settlement(
+            {"intent": views.find_purchase_intents(1), "error": "Low balance"})
+        self.assertEqual(self.holder(), self.buyers[1].address)
+
+        views.finish_purchase_settlement(
+            {"intent": views.find_purchase_intents(1)})
+        self.assertTrue(self.listing["purchaseAt"])
+        self.assertNotIn(1, views.purchase_reservations.waiting)
+        self.assertEqual(self.expire(61), [])
+        self.assertEqual(self.purchase(self.buyers[2]).json()["error"],
+                         "Listing already sold")
+        settled_again = self.client.post("/settle_purchase_order/", json.dumps({
+            "sale_id": 1, "owner_approval_sig": "0x" + "11" * 65,
+            "owner_address": "0xA"}), content_type='application/json')
+        self.assertEqual(settled_again.json()["error"], "Listing already sold")
+
+    def test_sent_settlement_sells_after_lease_expiry(self):
+        """A settlement sent after its lease expired still sells the listing."""
+        for buyer in self.buyers[:2]:
+            self.purchase(buyer)
+        first = views.find_purchase_intents(1)
+
+        self.expire(61)
+        self.assertEqual(self.holder(), self.buyers[1].address)
+        promoted = views.find_purchase_intents(1)
+        views.finish_purchase_settlement({"intent": first})
+
+        self.assertTrue(self.listing["purchaseAt"])
+        self.assertIsNone(self.holder())
+        self.assertEqual(promoted["releaseReason"], "sold")
+
+
+class ListingChangeTestCase(OrderBookMixin, TestCase):
+    """
+    Test cases for the cancellation and repricing of listings by their owner.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.owner = self.w3.eth.account.create()
+        self.buyer = self.w3.eth.account.create()
+        self.listings = [{
+            "sale_id": sale_id,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": sale_id,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": is_auction,
+            "ownerAddress": self.owner.address,
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+        } for sale_id, is_auction in ((1, False), (2, True))]
+        self.offer_matches = []
+        self.patch_book()
+
+        patcher = patch.multiple(
+            'marketplace.views', bid_intents={},
+            offer_matches=self.offer_matches, offer_holds={},
+            purchase_reservations=ReservationQueue(),
+            purchase_leases=MagicMock(),
+            matching_engine=MatchingEngine(views.listing_is_open))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, value in (("tombstones", []), ("tombstone_times", []),
+                            ("tombstones_pruned_before", 0.0)):
+            patcher = patch.object(book, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        for listing in self.listings:
+            book.index_listing(listing)
+
+    def change_body(self, action, sale_id, amount=0, signer=None):
+        """Build a cancellation or new price signed by the owner."""
+        listing = self.listings[sale_id - 1]
+        signature = Account.sign_message(
+            views.listing_change_signable_message(action, listing, amount),
+            private_key=(signer or self.owner).key).signature.hex()
+        body = {"sale_id": sale_id, "ownerAddress": self.owner.address,
+                "ownerSig": signature}
+        if action == "update":
+            body["erc20_amount"] = amount
+        return json.dumps(body)
+
+    def change(self, action, sale_id, amount=0, signer=None):
+        """Post a cancellation or new price signed by the owner."""
+        return self.client.post(
+            f"/list/{action}/", self.change_body(action, sale_id, amount, signer),
+            content_type='application/json')
+
+    def floor(self):
+        """Get the floor price of the collection."""
+        stats = self.stats.collection(self.listings[0]["nft_collection_address"])
+        return stats[self.listings[0]["erc20Address"].lower()]["floorPrice"]
+
+    def test_cancel_removes_listing(self):
+        """A cancelled listing leaves every index and leaves a tombstone."""
+        holder = {
+            "sale_id": 1, "nft_collection_address": "0xFCE9", "tokenId": 1,
+            "erc20Address": "0xbd65", "erc20_amount": 1000,
+            "buyerSig": "0x01", "buyerAddress": self.buyer.address}
+        with book.sale_lock(1):
+            views.hold_purchase(holder)
+
+        response = self.change("cancel", 1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(find_listing(1))
+        self.assertNotIn(1, book.listings_by_id)
+        self.assertIsNone(views.find_purchase_intents(1))
+        self.assertEqual(holder["releaseReason"], "cancelled")
+        self.assertEqual(self.stats.collection(
+            self.listings[0]["nft_collection_address"])[
+                self.listings[0]["erc20Address"].lower()]["openCount"], 1)
+        removed = self.client.get("/list/removed/", {"since": 0}).json()
+        self.assertEqual([tombstone["sale_id"] for tombstone in removed["removed"]],
+                         [1])
+        self.assertEqual(self.change("cancel", 1).status_code, 404)
+
+    def test_changes_need_the_owner_signature(self):
+        """Only the owner's signature of the current version is accepted."""
+        by_buyer = self.change("cancel", 2, signer=self.buyer)
+        body = self.change_body("update", 1, 900)
+        first = self.client.post(
+            "/list/update/", body, content_type='application/json')
+        replayed = self.client.post(
+            "/list/update/", body, content_type='application/json')
+
+        self.assertEqual(by_buyer.json()["error"],
+                         "Signature does not match the listing owner.")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replayed.json()["error"],
+                         "Signature does not match the listing owner.")
+        self.assertEqual(self.listings[0]["version"], 1)
+
+    def test_update_reprices_listing(self):
+        """A new price moves the floor and is matched with resting offers."""
+        views.matching_engine.add_offer({
+            "nft_collection_address": self.listings[0]["nft_collection_address"],
+            "erc20Address": self.listings[0]["erc20Address"],
+            "erc20_amount": 800, "buyerAddress": self.buyer.address})
+
+        response = self.change("update", 1, 750)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.listings[0]["erc20_amount"], 750)
+        self.assertEqual(self.offer_matches[0]["erc20_amount"], 750)
+        self.assertEqual(self.change("update", 2, 750).json()["error"],
+                         "Only fixed-price listings can be repriced")
+
+    def test_fractional_price_rejected(self):
+        """A price the signed uint256 cannot hold exactly is rejected."""
+        response = self.change("update", 1, 750.5)
+
+        self.assertEqual(response.json()["error"],
+                         "Price must be a whole number of ERC20 base units")
+        self.assertEqual(self.listings[0]["erc20_amount"], 1000)
+
+    @patch.object(book, 'TOMBSTONE_RETENTION', 60)
+    def test_old_tombstones_pruned(self):
+        """Tombstones past the retention are dropped and reported as pruned."""
+        with patch('marketplace.book.time.time', return_value=1000):
+            self.change("cancel", 1)
+        with patch('marketplace.book.time.time', return_value=1100):
+            self.change("cancel", 2)
+
+        removed = self.client.get("/list/removed/", {"since": 0}).json()
+
+        self.assertEqual([tombstone["sale_id"] for tombstone in removed["removed"]],
+                         [2])
+        self.assertEqual(removed["prunedBefore"], 1040)
+
+
+class EncodingTestCase(SimpleTestCase):
+    """
+    Test cases for the JSON encoding of responses and the parsing of bodies.
+    """
+
+    def test_fast_and_stdlib_encoders_agree(self):
+        """Both encoders produce the same JSON, int keys included."""
+        data = {"bids": [{"erc20_amount": 1000.5, "tokenId": 7}], 3: None,
+                "erc20": {"0xbd65": {"floorPrice": 700}}}
+
+        fast = json.loads(encoding.dumps(data, fast=True))
+        stdlib = json.loads(encoding.dumps(data, fast=False))
+
+        self.assertEqual(fast, stdlib)
+        self.assertEqual(fast["3"], None)
+
+    def test_wide_integers_fall_back(self):
+        """Integers orjson cannot encode go through the standard encoder."""
+        wei = 10 ** 30
+
+        self.assertEqual(json.loads(encoding.dumps({"value": wei}, fast=True)),
+                         {"value": wei})
+
+    def test_encoder_without_orjson(self):
+        """Without orjson installed, responses use the standard encoder."""
+        self.addCleanup(importlib.reload, encoding)
+        with patch.dict(sys.modules, {"orjson": None}):
+            fallback = importlib.reload(encoding)
+
+        self.assertIsNone(fallback.orjson)
+        self.assertEqual(fallback.dumps({3: 10 ** 30, "a": [1.5]}, fast=True),
+                         b'{"3": 1000000000000000000000000000000, "a": [1.5]}')
+
+    def test_response_refuses_non_dict_unless_unsafe(self):
+        """The response keeps Django's safe default."""
+        with self.assertRaises(TypeError):
+            encoding.JsonResponse([1])
+
+        response = encoding.JsonResponse([1], safe=False, status=201)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content), [1])
+
+    def test_invalid_json_body_is_rejected(self):
+        """Bodies are validated from bytes, malformed JSON is a 400."""
+        for url in ("/list/", "/purchaseOrder/", "/settle_batch/"):
+            response = self.client.post(
+                url, b'{"tokenId": 1,', content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn("Invalid JSON", response.json()["error"])
+
+
+class ResponseCacheTestCase(TestCase):
+    """
+    Test cases for the versioned cache and conditional GETs of the read views.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.listings = [{
+            "sale_id": 1,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": 1,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": False,
+            "ownerAddress": "0xA",
+            "purchaseAt": "",
+        }]
+        self.cache = ResponseCache()
+        for patcher in (patch('marketplace.views.response_cache', new=self.cache),
+                        patch_listings(self.listings)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unchanged_poll_returns_not_modified(self):
+        """A poll with the current ETag gets a 304 without running the view."""
+        first = self.client.get("/list/")
+
+        with patch('marketplace.views.current_price') as mock_price, \
+                patch('marketplace.views.is_dutch') as mock_dutch:
+            second = self.client.get(
+                "/list/", HTTP_IF_NONE_MATCH=first["ETag"])
+            mock_dutch.assert_not_called()
+            mock_price.assert_not_called()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_change_bumps_version(self):
+        """A published change of the book invalidates the cached responses."""
+        first = self.client.get("/list/")
+        self.listings[0]["erc20_amount"] = 900
+        views.publish_change("listing_updated", self.listings[0])
+
+        second = self.client.get("/list/", HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.json()[0]["erc20_amount"], 900)
+
+    def test_dutch_prices_expire(self):
+        """Responses holding Dutch prices are only cached briefly."""
+        self.listings[0].update(startTime=1000, endTime=2000, endPrice=200,
+                                decay="linear")
+
+        self.client.get("/list/")
+        self.client.get("/list/", {"page": "x"})
+
+        entries = list(self.cache.entries.values())
+        self.assertEqual(len(entries), 2)
+        self.assertTrue(all(entry.expires for entry in entries))
+        self.assertIsNone(self.cache.get(
+            ("/list/", ()), book.version, time.time() + 2))
+
+    def test_lru_keeps_newest_version(self):
+        """Older builds never replace newer ones, and the oldest key goes first."""
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", 2, b"new", "application/json", 0)
+        cache.put("a", 1, b"old", "application/json", 0)
+        cache.put("b", 2, b"b", "application/json", 0)
+        cache.get("a", 2, 0)
+        cache.put("c", 2, b"c", "application/json", 0)
+
+        self.assertEqual(cache.get("a", 2, 0).content, b"new")
+        self.assertNotIn("b", cache.entries)
+        self.assertTrue(etag_matches('W/"2", "3"', '"3"'))
+        self.assertFalse(etag_matches(None, '"3"'))
+
+
+class SparseFieldsTestCase(TestCase):
+    """
+    Test cases for the fields projection and the compression of the read views.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.listings = [{
+            "sale_id": sale_id,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": sale_id,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": sale_id == 1,
+            "ownerAddress": "0xA",
+            "purchaseAt": "",
+        } for sale_id in range(1, 51)]
+        ladder = BidLadder()
+        ladder.add({"sale_id": 1, "bidderAddress": "0xB", "erc20_amount": 1100,
+                    "bidderSig": "0x1"})
+        patchers = [
+            patch('marketplace.views.response_cache', new=ResponseCache()),
+            patch_listings(self.listings),
+            patch.dict(book.bids_by_sale, {1: ladder}, clear=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_listing_fields(self):
+        """Only the requested listing fields are serialized, in their order."""
+        response = self.client.get("/list/", {"fields": "sale_id,erc20_amount,nope"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[1], {"sale_id": 2, "erc20_amount": 1000})
+
+    def test_bid_fields_leave_signatures_out(self):
+        """Bid projections cannot ask for the signatures back."""
+        for url in ("/bids/top/", "/bids/"):
+            response = self.client.get(
+                url, {"sale_id": 1, "fields": ["erc20_amount", "bidderSig"]})
+
+            self.assertEqual(response.json()["bids"], [{"erc20_amount": 1100}])
+
+    def test_compression_is_negotiated(self):
+        """Large bodies are gzipped for clients accepting it, with their own ETag."""
+        plain = self.client.get("/list/")
+        gzipped = self.client.get("/list/", HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        small = self.client.get(
+            "/list/", {"fields": "sale_id"}, HTTP_ACCEPT_ENCODING="gzip")
+        again = self.client.get("/list/", HTTP_ACCEPT_ENCODING="gzip",
+                                HTTP_IF_NONE_MATCH=gzipped["ETag"])
+
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertLess(len(gzipped.content), len(plain.content))
+        self.assertNotEqual(gzipped["ETag"], plain["ETag"])
+        self.assertEqual(gzipped["Vary"], "Accept-Encoding")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        self.assertEqual(again.status_code, 304)
+
+    def test_negotiation(self):
+        """Refused codings and small bodies are sent as they are."""
+        self.assertEqual(accepted_codings("gzip;q=0, deflate, BR"), {"deflate", "br"})
+        self.assertIsNone(negotiate("gzip", 10, min_bytes=100))
+        self.assertIsNone(negotiate("identity", 1000, min_bytes=100))
+        self.assertEqual(negotiate("gzip;q=0.5", 1000, min_bytes=100), "gzip")
+
+    def test_gzip_without_brotli(self):
+        """Without brotli installed, clients preferring br are sent gzip."""
+        self.addCleanup(importlib.reload, compression)
+        with patch.dict(sys.modules, {"brotli": None}):
+            fallback = importlib.reload(compression)
+
+        self.assertIsNone(fallback.brotli)
+        self.assertEqual(fallback.negotiate("br, gzip", 1000, min_bytes=100), "gzip")
+        self.assertIsNone(fallback.negotiate("br", 1000, min_bytes=100))
+
+
+@patch('marketplace.views.INTAKE_ONCHAIN_CHECKS', new=[])
+class RateLimitTestCase(TestCase):
+    """
+    Test cases for the token bucket admission of write requests.
+    """
+
+    def setUp(self):
+        """Set up common resources for testing."""
+        self.w3 = Web3(EthereumTesterProvider())
+        self.buyer = self.w3.eth.account.create()
+        self.listings = [{
+            "sale_id": 1,
+            "nft_collection_address": "0xFCE9b92eC11680898c7FE57C4dDCea83AeabA3ff",
+            "tokenId": 1,
+            "erc20Address": "0xbd65c58D6F46d5c682Bf2f36306D461e3561C747",
+            "erc20_amount": 1000,
+            "isAuction": True,
+            "ownerAddress": self.w3.eth.account.create().address,
+            "createdAt": "2023-10-16 00:00:00",
+            "purchaseAt": "",
+        }]
+        self.limiter = TokenBucketLimiter(
+            ":memory:", {"bid_order": (0.01, 2), "list_nft": (0.01, 1)})
+        patchers = [
+            patch.multiple('marketplace.views', bid_intents={},
+                           get_rate_limiter=MagicMock(return_value=self.limiter)),
+            patch_listings(self.listings),
+            patch.object(book, 'used_signatures', set()),
+            patch.dict(book.bids_by_sale, clear=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        views.bid_pipeline.reset()
+
+    def bid(self, amount, send=True):
+        """Post a bid of the buyer, or only build its body if not `send`. Its
+        signature is not checked."""
+        body = json.dumps({
+            "nft_collection_address": self.listings[0]["nft_collection_address"],
+            "tokenId": 1,
+            "erc20Address": self.listings[0]["erc20Address"],
+            "erc20_amount": amount,
+            "bidderSig": f"0x{amount:0130x}",
+            "buyerAddress": self.buyer.address,
+            "sale_id": 1})
+        if not send:
+            return body
+        return self.client.post(
+            "/bidOrder/", body, content_type='application/json')
+
+    def test_bucket_refills(self):
+        """A bucket admits its burst, then one request per refilled token."""
+        limiter = TokenBucketLimiter(":memory:", parse_limits("bid_order:1:2"))
+
+        admitted = [limiter.acquire("bid_order", ["ip:1.2.3.4"], now=100)
+                    for _ in range(3)]
+
+        self.assertEqual(admitted, [0, 0, 1.0])
+        self.assertEqual(limiter.acquire("bid_order", ["ip:1.2.3.4"], now=101), 0)
+        self.assertEqual(limiter.acquire("bid_order", ["ip:5.6.7.8"], now=101), 0)
+        self.assertEqual(limiter.acquire("list_nft", ["ip:1.2.3.4"], now=101), 0)
+
+    def test_buckets_shared_across_workers(self):
+        """Two limiters on the same database draw from the same buckets."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ratelimit.sqlite3")
+            first = TokenBucketLimiter(path, {"bid_order": (1, 2)})
+            second = TokenBucketLimiter(path, {"bid_order": (1, 2)})
+
+            self.assertEqual(first.acquire("bid_order", ["ip:1"], now=100), 0)
+            self.assertEqual(second.acquire("bid_order", ["ip:1"], now=100), 0)
+            self.assertGreater(first.acquire("bid_order", ["ip:1"], now=100), 0)
+
+    def test_ip_bucket_holds_rotating_addresses(self):
+        """A client changing its address is still limited by its IP."""
+        limiter = TokenBucketLimiter(":memory:", {"bid_order": (1, 2)})
+
+        waits = [limiter.acquire("bid_order", ["ip:1", f"address:0x{i}"], now=100)
+                 for i in range(3)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+
+    def test_flood_rejected_before_signature_recovery(self):
+        """Bids over the burst get a 429 without recovering their signature."""
+        with patch('marketplace.views.Account.recover_message',
+                   return_value=self.buyer.address) as recover:
+            responses = [self.bid(amount) for amount in (1001, 1002, 1003)]
+
+        self.assertEqual([response.status_code for response in responses],
+                         [200, 200, 429])
+        self.assertEqual(responses[2].json(), {"error": "Too many requests"})
+        self.assertEqual(responses[2]["Retry-After"], "100")
+        self.assertEqual(recover.call_count, 2)
+        self.assertEqual(
+            views.bid_pipeline.snapshot()["rate"]["reasons"],
+            {"rate_limited": 1})
+
+    def test_forged_orders_do_not_charge_the_address(self):
+        """Orders with a forged signature only charge the bucket of their IP."""
+        forged = [self.client.post(
+            "/bidOrder/", self.bid(amount, send=False),
+            content_type='application/json', REMOTE_ADDR=f"10.0.0.{amount}")
+            for amount in (1001, 1002, 1003)]
+
+        with patch('marketplace.views.Account.recover_message',
+                   return_value=self.buyer.address):
+            genuine = self.client.post(
+                "/bidOrder/", self.bid(1004, send=False),
+                content_type='application/json', REMOTE_ADDR="10.0.1.1")
+
+        self.assertEqual([response.status_code for response in forged],
+                         [400, 400, 400])
+        self.assertEqual(genuine.status_code, 200)
+
+    @patch('marketplace.views.RATE_LIMIT_IP_HEADER', 'HTTP_X_FORWARDED_FOR')
+    def test_ip_read_from_configured_header(self):
+        """Behind a proxy, the client IP is the entry the proxy added."""
+        factory = RequestFactory()
+        forwarded = factory.post(
+            "/bidOrder/", REMOTE_ADDR="10.0.0.1",
+            HTTP_X_FORWARDED_FOR="203.0.113.9, 198.51.100.7")
+        direct = factory.post("/bidOrder/", REMOTE_ADDR="10.0.0.1")
+
+        self.assertEqual(views.client_ip(forwarded), "198.51.100.7")
+        self.assertEqual(views.client_ip(direct), "10.0.0.1")
+
+    def test_listing_rejected_before_owner_call(self):
+        """A rate limited listing never calls ownerOf."""
+        erc721 = MagicMock()
+        erc721.is_token_owner.return_value = True
+        body = json.dumps({
+            "nft_collection_address": self.listings[0]["nft_collection_address"],
+            "tokenId": 2,
+            "erc20Address": self.listings[0]["erc20Address"],
+            "erc20_amount": 1000,
+            "isAuction": False,
+            "ownerAddress": self.buyer.address,
+        })
+
+        with patch('marketplace.views.get_erc721_contract', return_value=erc721), \
+                patch('marketplace.views.sales', 1), \
+                patch('marketplace.views.publish_change'), \
+                patch.object(views.matching_engine, 'add_listing', return_value=None), \
+                patch.dict(book.listings_by_id, clear=True), \
+                patch.dict(book.open_sales_by_token, clear=True), \
+                patch.dict(book.open_sales_by_collection, clear=True), \
+                patch.object(book, 'collection_stats', StatsBook()):
+            first = self.client.post("/list/", body, content_type='application/json')
+            second = self.client.post("/list/", body, content_type='application/json')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 429)
+        erc721.is_token_owner.assert_called_once()
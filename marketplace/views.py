@@ -4,27 +4,80 @@ This module contains views for the NFT marketplace.
 It provides endpoints for listing NFTs, retrieving listed NFTs, and other related functionalities.
 """
 
-import json
+import functools
+import hmac
+import logging
+import math
 import os
+import time
 
 from datetime import datetime
-from decouple import config
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config, Csv
+from eth_account import Account
 from eth_account.messages import encode_defunct
-from django.http import JsonResponse, HttpResponse
+from eth_keys.exceptions import BadSignature
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from pydantic import ValidationError
+from requests.exceptions import RequestException
 from web3 import Web3
-
-from .contracts import ERC721Contract
+from web3.exceptions import Web3Exception
+
+from . import book
+from .bids import public_bid
+from .cache import ResponseCache, etag_matches
+from .compression import compress, negotiate
+from .candles import BIDS, INTERVALS, SALES
+from .dutch import DECAY_CURVES, LINEAR, current_price, is_dutch
+from .encoding import JsonResponse, dumps, project
+from .auctions import AuctionScheduler, BackgroundQueue
+from .contracts import get_erc721_contract
 from .contracts import MarketplaceContract
-from .models import NFTListing, NFTPurchaseIntent, NFTSettle
+from .events.ownership import get_ownership_index
+from .intake import IntakePipeline
+from .matching import MatchingEngine
+from .funds import funds_cache
+from .feed import collection_topic, order_book_feed, sale_topic, ALL_TOPIC
+from .models import NFTCollectionOffer, NFTListing, NFTPurchaseIntent
+from .models import NFTCollectionOfferCancel
+from .models import NFTListingCancel, NFTListingUpdate
+from .models import NFTSettle, NFTSettleBatch
+from .models import ERC20Events, NFTTransferEvents
+from .preflight import SettlementPreflight
+from .ratelimit import get_rate_limiter
+from .relayers import get_relayer_pool
+from .reservations import ReservationQueue
+
+logger = logging.getLogger(__name__)
 
 # In-memory data structure
 sales = 0
-listings = []
-purchase_intents = []
 bid_intents = {}
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTLE_BATCH_MAX_SIZE = config('SETTLE_BATCH_MAX_SIZE', default=500, cast=int)
+SETTLE_BATCH_WORKERS = config('SETTLE_BATCH_WORKERS', default=8, cast=int)
+SETTLEMENT_PREFLIGHT = config('SETTLEMENT_PREFLIGHT', default=False, cast=bool)
+SETTLEMENT_DRY_RUN = config('SETTLEMENT_DRY_RUN', default=False, cast=bool)
+LISTENER_TOKEN = config('LISTENER_TOKEN', default='')
+# Bid queries page size, and the most bids a query returns
+BID_PAGE_SIZE = 50
+BID_MAX_PAGE_SIZE = 500
+# Endpoints whose orders are checked against the buyer's funds
+INTAKE_ONCHAIN_CHECKS = config('INTAKE_ONCHAIN_CHECKS',
+                               default='purchase_order,bid_order', cast=Csv())
+# The request META key holding the client IP, e.g. HTTP_X_FORWARDED_FOR behind a
+# proxy
+RATE_LIMIT_IP_HEADER = config('RATE_LIMIT_IP_HEADER', default='REMOTE_ADDR')
+FEED_HEARTBEAT = config('FEED_HEARTBEAT', default=15, cast=int)
+AUCTION_EXTENSION_WINDOW = config('AUCTION_EXTENSION_WINDOW', default=300, cast=int)
+AUCTION_EXTENSION_SECONDS = config('AUCTION_EXTENSION_SECONDS', default=300, cast=int)
+# The most blocks the ownership index may be behind to answer a listing's
+# ownership check, ownerOf is called otherwise
+LISTING_OWNERSHIP_MAX_LAG = config('LISTING_OWNERSHIP_MAX_LAG', default=2, cast=int)
+# How long a cached response holding Dutch prices is served
+PRICE_CACHE_SECONDS = config('PRICE_CACHE_SECONDS', default=1, cast=float)
 
 
 def find_listing(sale_id):
@@ -37,31 +90,1185 @@ def find_listing(sale_id):
     Returns:
     - dict: The details of the NFT listing if found. Otherwise, returns None.
     """
-    for listing in listings:
-        if listing.get("sale_id") == sale_id:
-            return listing
-    return None
+    return book.listings_by_id.get(sale_id)
 
 
 def find_purchase_intents(sale_id):
     """
-    Find a specific NFT listing based on the sale ID.
+    Find the purchase intent holding a sale, skipping the released ones.
 
     Args:
     - sale_id (int): The listing identifier.
 
     Returns:
-    - dict: The details of the NFT listing if found. Otherwise, returns None.
+    - dict: The details of the purchase intent if found. Otherwise, returns None.
+    """
+    # Released intents are unregistered, see `release_purchase`
+    return book.purchase_intents_by_sale.get(sale_id)
+
+
+def intent_signable_message(intent):
+    """
+    Build the signable message a buyer or bidder signs for an intent.
+
+    Args:
+    - intent (dict): The purchase or bid intent.
+
+    Returns:
+    - SignableMessage: The EIP-191 message over the intent fields.
+    """
+    message = Web3.solidity_keccak(['address',
+                                    'address',
+                                    'uint256',
+                                    'uint256'],
+                                   [intent["nft_collection_address"],
+                                    intent["erc20Address"],
+                                    intent["tokenId"],
+                                    int(intent["erc20_amount"])])
+
+    return encode_defunct(hexstr=message.hex())
+
+
+def offer_signable_message(offer):
+    """
+    Build the signable message a buyer signs for a collection offer.
+
+    Args:
+    - offer (dict): The collection offer.
+
+    Returns:
+    - SignableMessage: The EIP-191 message over the offer fields.
+    """
+    message = Web3.solidity_keccak(['address', 'address', 'uint256'],
+                                   [offer["nft_collection_address"],
+                                    offer["erc20Address"],
+                                    int(offer["erc20_amount"])])
+
+    return encode_defunct(hexstr=message.hex())
+
+
+def offer_cancel_signable_message(offer_id):
+    """
+    Build the signable message a buyer signs to cancel a collection offer.
+
+    Args:
+    - offer_id (int): The offer identifier.
+
+    Returns:
+    - SignableMessage: The EIP-191 message over the cancellation.
+    """
+    message = Web3.solidity_keccak(['string', 'uint256'], ["cancel_offer", offer_id])
+
+    return encode_defunct(hexstr=message.hex())
+
+
+def listing_change_signable_message(action, listing, erc20_amount=0):
+    """
+    Build the signable message an owner signs to cancel or reprice a listing.
+
+    The listing version is signed too, so a change cannot be replayed once the
+    listing changed again.
+
+    Args:
+    - action (str): "cancel" or "update".
+    - listing (dict): The listing, as stored in the book.
+    - erc20_amount (float): The new price of an update.
+
+    Returns:
+    - SignableMessage: The EIP-191 message over the change.
+    """
+    message = Web3.solidity_keccak(['string', 'uint256', 'uint256', 'uint256'],
+                                   [action,
+                                    listing["sale_id"],
+                                    listing.get("version", 0),
+                                    int(erc20_amount)])
+
+    return encode_defunct(hexstr=message.hex())
+
+
+def find_settlement_intent(sale_id):
+    """
+    Find the intent to settle for a sale, the latest bid or the purchase intent.
+
+    Args:
+    - sale_id (int): The listing identifier.
+
+    Returns:
+    - tuple: The intent, its signature and its signer address, or None if the
+      sale has neither bids nor a purchase intent.
+    """
+    bids_for_sale = bid_intents.get(sale_id)
+    if bids_for_sale:
+        latest_bid = bids_for_sale[-1]
+        return latest_bid, latest_bid["bidderSig"], latest_bid["bidderAddress"]
+
+    purchase_intent = find_purchase_intents(sale_id)
+    if purchase_intent:
+        return (purchase_intent,
+                purchase_intent["buyerSig"],
+                purchase_intent["buyerAddress"])
+
+    return None
+
+
+def settlement_rejection(sale_id, require_end=True):
+    """
+    Check if a sale can be settled.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    - require_end (bool): False to accept a timed auction that has not ended yet.
+
+    Returns:
+    - str: Why the sale cannot be settled, or None if it can.
+    """
+    if book.is_sale_invalidated(sale_id):
+        return "Listing is no longer valid"
+    listing = find_listing(sale_id)
+    if listing and listing.get("purchaseAt"):
+        return "Listing already sold"
+    if require_end and listing and listing.get("endTime") and \
+            not listing.get("closedAt"):
+        return "Auction has not ended"
+    return None
+
+
+def verify_settlement(settle, require_end=True):
+    """
+    Verify the intent and owner approval signatures of a settlement request.
+
+    Signatures are recovered without a provider, so this is safe to run from
+    worker threads.
+
+    Args:
+    - settle (NFTSettle): The validated settlement request.
+    - require_end (bool): False to verify the approval of a timed auction that
+      has not ended yet.
+
+    Returns:
+    - dict: The per-item result. On success it holds the intent and signatures
+      to submit, otherwise an "error" message.
+    """
+    result = {"sale_id": settle.sale_id}
+
+    rejection = settlement_rejection(settle.sale_id, require_end)
+    if rejection:
+        result["error"] = rejection
+        return result
+
+    found = find_settlement_intent(settle.sale_id)
+    if not found:
+        result["error"] = "No intent for this sale id"
+        return result
+
+    intent, bidder_sig, bidder_address = found
+    owner_approval_sig = settle.owner_approval_sig
+
+    try:
+        recovered_bidder_address = Account.recover_message(
+            intent_signable_message(intent), signature=bidder_sig)
+
+        if recovered_bidder_address != bidder_address:
+            result["error"] = "Signature does not match the provided bidder address."
+            return result
+
+        hashed_bidder_sig = Web3.solidity_keccak(['bytes'], [bidder_sig])
+        recovered_owner_address = Account.recover_message(
+            encode_defunct(hexstr=hashed_bidder_sig.hex()),
+            signature=owner_approval_sig)
+    except (ValueError, BadSignature) as e:
+        result["error"] = f"Invalid signature: {e}"
+        return result
+
+    if recovered_owner_address != settle.owner_address:
+        result["error"] = "Signature does not match the provided owner address."
+        return result
+
+    result.update({
+        "intent": intent,
+        "bidderSig": bidder_sig,
+        "owner_approval_sig": owner_approval_sig,
+        "owner_address": settle.owner_address,
+    })
+    return result
+
+
+def preflight_settlements(settlements, marketplace_contract=None):
+    """
+    Reject settlements that would fail on chain before they are submitted.
+
+    Balance, allowance, ownership and approval are read for all settlements with
+    one aggregated call, then an optional eth_call dry run of finishAuction runs
+    for the ones that passed. Failing settlements get an "error" entry, and so do
+    the ones that could not be checked because a read failed. Nothing is checked
+    unless SETTLEMENT_PREFLIGHT is enabled.
+
+    Args:
+    - settlements (list): Verified settlements, as returned by `verify_settlement`.
+    - marketplace_contract (MarketplaceContract): A contract to reuse, optional.
+    """
+    if not SETTLEMENT_PREFLIGHT or not settlements:
+        return
+
+    try:
+        errors = SettlementPreflight().check(settlements)
+    except Exception as e:  # pylint: disable=broad-except
+        # Unchecked settlements are not submitted
+        errors = [f"Preflight failed: {e}"] * len(settlements)
+    for settlement, error in zip(settlements, errors):
+        if error:
+            settlement["error"] = error
+
+    if not SETTLEMENT_DRY_RUN:
+        return
+
+    for settlement in settlements:
+        if "error" not in settlement:
+            try:
+                if marketplace_contract is None:
+                    marketplace_contract = MarketplaceContract()
+                error = SettlementPreflight.dry_run(
+                    marketplace_contract, settlement)
+            except Exception as e:  # pylint: disable=broad-except
+                error = f"Preflight failed: {e}"
+            if error:
+                settlement["error"] = error
+
+
+def submit_settlement(
+        intent,
+        bidder_sig,
+        owner_approval_sig,
+        owner_address,
+        marketplace_contract=None,
+        nonces=None,
+        gas_price=None):
+    """
+    Create the finishAuction transaction for a verified intent.
+
+    When relayer keys are configured the transaction is signed and submitted by a
+    pooled relayer and its hash is returned. Otherwise the unsigned transaction is
+    returned for the owner to sign and send.
+
+    Args:
+    - intent (dict): The purchase or bid intent being settled.
+    - bidder_sig (str): The buyer or bidder signature of the intent.
+    - owner_approval_sig (str): The owner's approval signature.
+    - owner_address (str): The owner address.
+    - marketplace_contract (MarketplaceContract): A contract to reuse, optional.
+    - nonces (dict): Next nonce per owner address shared by a batch, optional.
+      Owners missing from it are read from chain once and then counted locally.
+    - gas_price (int): The gas price shared by a batch, optional.
+
+    Returns:
+    - str | dict: The transaction hash or the unsigned transaction.
+    """
+    if marketplace_contract is None:
+        marketplace_contract = MarketplaceContract()
+    relayer_pool = get_relayer_pool(marketplace_contract.w3)
+
+    if relayer_pool:
+        return marketplace_contract.relay_transaction(
+            relayer_pool,
+            intent["nft_collection_address"],
+            intent["tokenId"],
+            intent["erc20Address"],
+            intent["erc20_amount"],
+            bidder_sig,
+            owner_approval_sig,
+            gas_price)
+
+    if nonces is None:
+        return marketplace_contract.send_transaction(
+            intent["nft_collection_address"],
+            intent["tokenId"],
+            intent["erc20Address"],
+            intent["erc20_amount"],
+            bidder_sig,
+            owner_approval_sig,
+            owner_address)
+
+    if owner_address not in nonces:
+        nonces[owner_address] = marketplace_contract.w3.eth.get_transaction_count(
+            owner_address)
+    nonce = nonces[owner_address]
+
+    transaction = marketplace_contract.build_finish_auction(
+        intent["nft_collection_address"],
+        intent["tokenId"],
+        intent["erc20Address"],
+        intent["erc20_amount"],
+        bidder_sig,
+        owner_approval_sig,
+        nonce,
+        gas_price)
+    # Only a built transaction takes the nonce, a failed build leaves no gap
+    nonces[owner_address] = nonce + 1
+    return transaction
+
+
+def purchase_rejection(listing, erc20_amount):
+    """
+    Check if a purchase intent can be stored for a listing, or queued behind the
+    one holding it.
+
+    Args:
+    - listing (dict): The listing being bought.
+    - erc20_amount (float): The amount of the purchase.
+
+    Returns:
+    - str: Why the purchase is rejected, or None if it can be stored.
+    """
+    if listing["isAuction"]:
+        # Ensure the listing is not an auction
+        return "Listing is not a traditional purchase"
+    if listing.get("purchaseAt"):
+        # Ensure the listing was not settled
+        return "Listing already sold"
+    if listing.get("cancelledAt"):
+        return "Listing was cancelled"
+    if listing.get("invalidatedAt"):
+        # Ensure the token was not transferred since it was listed
+        return "Listing is no longer valid"
+    if listing.get("startTime") and time.time() < listing["startTime"]:
+        return "Listing has not started"
+    if is_dutch(listing):
+        # The signed amount is fixed while the price declines, any amount at or
+        # above the current price buys
+        if erc20_amount < current_price(listing):
+            return "Purchase intent amount must be at least the current price"
+    elif listing["erc20_amount"] != erc20_amount:
+        # The purchase intent amount must be equal to the listing price
+        return "Purchase intent amount must be equal to the listing price"
+    return None
+
+
+def client_ip(request):
+    """
+    Get the IP of the client of a request.
+
+    The IP is read from RATE_LIMIT_IP_HEADER. A list, as in X-Forwarded-For, is
+    read from its last entry, the one added by the proxy in front of the server.
+
+    Args:
+    - request (HttpRequest): The request.
+
+    Returns:
+    - str: The client IP, or None if unknown.
+    """
+    forwarded = request.META.get(RATE_LIMIT_IP_HEADER, "")
+    ip = forwarded.split(",")[-1].strip()
+    return ip or request.META.get("REMOTE_ADDR")
+
+
+def rate_limit_wait(endpoint, ip=None, address=None):
+    """
+    Take a token from the bucket of a request's IP or address.
+
+    Args:
+    - endpoint (str): The endpoint name, as in RATE_LIMITS.
+    - ip (str): The client IP, may be None.
+    - address (str): The address the request acts for, may be None. It must be
+      verified by a signature first, or anyone could drain its bucket.
+
+    Returns:
+    - float: 0 if the request is admitted, or the seconds to wait.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return 0
+    return limiter.acquire(endpoint, [
+        f"ip:{ip}" if ip else None,
+        f"address:{address.lower()}" if address else None,
+    ])
+
+
+def too_many_requests(wait):
+    """
+    Build the rejection of a rate limited request.
+
+    Args:
+    - wait (float): The seconds until the request would be admitted.
+
+    Returns:
+    - JsonResponse: A 429 response with its Retry-After header.
+    """
+    response = JsonResponse({"error": "Too many requests"}, status=429)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def throttle(request, endpoint):
+    """
+    Admit a request through the bucket of its IP, before any RPC call or
+    signature recovery.
+
+    Args:
+    - request (HttpRequest): The request.
+    - endpoint (str): The endpoint name, as in RATE_LIMITS.
+
+    Returns:
+    - JsonResponse: The 429 response, or None if the request is admitted.
+    """
+    wait = rate_limit_wait(endpoint, ip=client_ip(request))
+    return too_many_requests(wait) if wait else None
+
+
+def throttle_address(endpoint, address):
+    """
+    Admit a request through the bucket of the address it acts for, once the
+    address is verified and before any RPC call.
+
+    Args:
+    - endpoint (str): The endpoint name, as in RATE_LIMITS.
+    - address (str): The verified address.
+
+    Returns:
+    - JsonResponse: The 429 response, or None if the request is admitted.
+    """
+    wait = rate_limit_wait(endpoint, address=address)
+    return too_many_requests(wait) if wait else None
+
+
+def parse_order(context):
+    """
+    Intake stage validating the body of a purchase or bid.
+
+    Args:
+    - context (dict): The request context, the validated "order" is added.
+
+    Returns:
+    - tuple: The error, status and reason code, or None if the body is valid.
+    """
+    try:
+        # Parsed and validated from the raw bytes in one pass
+        order = NFTPurchaseIntent.model_validate_json(context["body"])
+    except ValidationError as e:
+        return str(e), 400, "invalid_body"
+
+    # Check if all required details are provided
+    if not all([order.nft_collection_address,
+                order.tokenId,
+                order.erc20Address,
+                order.erc20_amount,
+                order.bidderSig,
+                order.buyerAddress,
+                order.sale_id]):
+        return "Missing required fields", 400, "missing_fields"
+
+    context["order"] = order
+    return None
+
+
+def check_rate(context, endpoint, by_buyer=False):
+    """
+    Admit an order through the rate limiter.
+
+    Args:
+    - context (dict): The request context, the seconds to wait are added as
+      "retryAfter" when the order is rejected.
+    - endpoint (str): The endpoint name, as in RATE_LIMITS.
+    - by_buyer (bool): Charge the bucket of the buyer, once its signature is
+      recovered, instead of the bucket of the client IP.
+
+    Returns:
+    - tuple: The error, status and reason code, or None if the order is admitted.
+    """
+    if by_buyer:
+        wait = rate_limit_wait(endpoint, address=context["order"].buyerAddress)
+    else:
+        wait = rate_limit_wait(endpoint, ip=context.get("ip"))
+    if wait:
+        context["retryAfter"] = wait
+        return "Too many requests", 429, "rate_limited"
+    return None
+
+
+def check_purchase_rate(context):
+    """
+    Intake stage admitting a purchase through the bucket of its IP.
+    """
+    return check_rate(context, "purchase_order")
+
+
+def check_bid_rate(context):
+    """
+    Intake stage admitting a bid through the bucket of its IP.
     """
-    for purchase_intent in purchase_intents:
-        if purchase_intent.get("sale_id") == sale_id:
-            return purchase_intent
+    return check_rate(context, "bid_order")
+
+
+def check_purchase_buyer_rate(context):
+    """
+    Intake stage admitting a purchase through the bucket of its buyer.
+    """
+    return check_rate(context, "purchase_order", by_buyer=True)
+
+
+def check_bid_buyer_rate(context):
+    """
+    Intake stage admitting a bid through the bucket of its bidder.
+    """
+    return check_rate(context, "bid_order", by_buyer=True)
+
+
+def check_listing(context, rejection):
+    """
+    Find the listing of an order and check it against the book.
+
+    Args:
+    - context (dict): The request context, the "listing" is added.
+    - rejection (callable): `purchase_rejection` or `bid_rejection`.
+
+    Returns:
+    - tuple: The error, status and reason code, or None if the order fits the book.
+    """
+    order = context["order"]
+    listing = find_listing(order.sale_id)
+    if not listing:
+        return "Listing not found", 404, "listing_not_found"
+
+    # The signed order must be for the listed token, paid in the listed ERC20
+    if order.nft_collection_address.lower() != \
+            listing["nft_collection_address"].lower() or \
+            order.erc20Address.lower() != listing["erc20Address"].lower() or \
+            order.tokenId != listing["tokenId"]:
+        return "Order does not match the listing", 400, "order_mismatch"
+
+    error = rejection(listing, order.erc20_amount)
+    if error:
+        return error, 400, "listing_rejected"
+
+    context["listing"] = listing
     return None
 
+
+def check_purchase_book(context):
+    """
+    Intake stage checking a purchase against the book.
+    """
+    return check_listing(context, purchase_rejection)
+
+
+def check_bid_book(context):
+    """
+    Intake stage checking a bid against the book.
+    """
+    return check_listing(context, bid_rejection)
+
+
+def check_replay(context):
+    """
+    Intake stage rejecting signatures already used by another intent.
+
+    The signed message does not include the sale, so without this check an
+    intent could be replayed on a later listing of the same token.
+    """
+    if book.is_signature_used(context["order"].bidderSig):
+        return "Signature already used", 400, "signature_used"
+    return None
+
+
+def check_order_signature(context):
+    """
+    Intake stage recovering the buyer or bidder from the order signature.
+    """
+    order = context["order"]
+
+    try:
+        recovered_bidder_address = Account.recover_message(
+            intent_signable_message({
+                "nft_collection_address": order.nft_collection_address,
+                "erc20Address": order.erc20Address,
+                "tokenId": order.tokenId,
+                "erc20_amount": order.erc20_amount,
+            }),
+            signature=order.bidderSig)
+    except (ValueError, BadSignature) as e:
+        return f"Invalid signature: {e}", 400, "invalid_signature"
+
+    # Ensure recovered address matches provided buyer address
+    if recovered_bidder_address != order.buyerAddress:
+        return ("Signature does not match the provided buyer address.", 400,
+                "signer_mismatch")
+    return None
+
+
+def check_buyer_funds(context, endpoint):
+    """
+    Check the buyer's ERC20 balance and marketplace allowance.
+
+    Nothing is read unless the endpoint is in INTAKE_ONCHAIN_CHECKS. The funds
+    are read from `funds_cache`, kept current by the listener's ERC20 events, so
+    a known buyer costs no RPC call. The token is the listing's, matched by the
+    book stage, so clients cannot grow the cache with tokens of their choice.
+    A failed read rejects the order with a 503, it can be sent again.
+
+    Args:
+    - context (dict): The request context, with the "order" and its "listing".
+    - endpoint (str): The endpoint name.
+
+    Returns:
+    - tuple: The error, status and reason code, or None if the buyer can pay.
+    """
+    if endpoint not in INTAKE_ONCHAIN_CHECKS:
+        return None
+
+    order = context["order"]
+    try:
+        balance, allowance = funds_cache.get(
+            context["listing"]["erc20Address"], order.buyerAddress)
+    except (RequestException, Web3Exception, ValueError) as e:
+        logger.warning("Reading the funds of %s failed: %s", order.buyerAddress, e)
+        return "Buyer funds could not be checked", 503, "funds_unavailable"
+
+    if balance < order.erc20_amount:
+        return "Buyer ERC20 balance is too low", 400, "low_balance"
+    if allowance < order.erc20_amount:
+        return "Buyer ERC20 allowance is too low", 400, "low_allowance"
+    return None
+
+
+def check_purchase_funds(context):
+    """
+    Intake stage checking a buyer's funds for a purchase.
+    """
+    return check_buyer_funds(context, "purchase_order")
+
+
+def check_bid_funds(context):
+    """
+    Intake stage checking a bidder's funds for a bid.
+    """
+    return check_buyer_funds(context, "bid_order")
+
+
+def bid_rejection(listing, erc20_amount):
+    """
+    Check if a bid can be placed on a listing.
+
+    Args:
+    - listing (dict): The auction listing.
+    - erc20_amount (float): The amount of the bid.
+
+    Returns:
+    - str: Why the bid is rejected, or None if it can be placed.
+    """
+    now = time.time()
+    bids_for_sale = bid_intents.get(listing["sale_id"])
+    latest_bid = bids_for_sale[-1] if bids_for_sale else None
+
+    if listing["purchaseAt"]:
+        # Ensure the auction was not settled
+        return "Auction already settled"
+    if not listing["isAuction"]:
+        # Ensure the listing is an auction
+        return "Listing is not for auction."
+    if listing.get("cancelledAt"):
+        return "Listing was cancelled"
+    if listing.get("invalidatedAt"):
+        # Ensure the token was not transferred since it was listed
+        return "Listing is no longer valid"
+    if listing.get("startTime") and now < listing["startTime"]:
+        return "Auction has not started"
+    if listing.get("closedAt") or (
+            listing.get("endTime") and now >= listing["endTime"]):
+        return "Auction has ended"
+    if latest_bid and latest_bid["erc20_amount"] >= erc20_amount:
+        # Ensure the bid is higher than the current bid
+        return "Bid must be higher than the current bid"
+    return None
+
+
+def publish_change(event_type, record, **data):
+    """
+    Bump the book version and publish a change on the order book feed.
+
+    Called once the change is applied, so a response built at the new version
+    holds it.
+
+    Args:
+    - event_type (str): The kind of change, e.g. "listing_created".
+    - record (dict): The listing or intent that changed.
+    - **data: Extra fields of the event.
+
+    Returns:
+    - dict: The published event.
+    """
+    book.bump_version()
+    return order_book_feed.publish(event_type, record, **data)
+
+
+def close_auction(sale_id):
+    """
+    Close an ended auction and pick its winning bid.
+
+    Called by the auction scheduler at the end time. The settlement is queued
+    right away if the owner already approved the winning bid, otherwise when the
+    approval arrives.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    """
+    listing = find_listing(sale_id)
+    if not listing:
+        return
+
+    with book.sale_lock(sale_id):
+        if listing.get("closedAt") or (
+                listing.get("endTime") and time.time() < listing["endTime"]):
+            # Already closed, or extended by a bid since the timer fired
+            return
+
+        listing["closedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        book.collection_stats.take(listing)
+        bids = bid_intents.get(sale_id)
+        winning_bid = max(
+            bids, key=lambda bid: bid["erc20_amount"]) if bids else None
+
+    publish_change(
+        "auction_closed",
+        listing,
+        winner=winning_bid["bidderAddress"] if winning_bid else None,
+        winningAmount=winning_bid["erc20_amount"] if winning_bid else None)
+
+    approval = auction_approvals.get(sale_id)
+    if winning_bid and approval and \
+            approval["bidderSig"] == winning_bid["bidderSig"]:
+        auction_settlements.put(sale_id)
+
+
+def settle_closed_auction(sale_id):
+    """
+    Settle a closed auction with the owner's approval of its winning bid.
+
+    The outcome is recorded on the listing, as the settlement transaction or the
+    settlement error.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    """
+    listing = find_listing(sale_id)
+    approval = auction_approvals.pop(sale_id, None)
+    if not listing or not approval:
+        return
+
+    settlement = verify_settlement(approval["settle"])
+    if "error" not in settlement:
+        preflight_settlements([settlement])
+
+    if "error" in settlement:
+        listing["settlementError"] = settlement["error"]
+        publish_change("settlement_failed", listing, error=settlement["error"])
+        return
+
+    try:
+        tx_hash = submit_settlement(
+            settlement["intent"],
+            settlement["bidderSig"],
+            settlement["owner_approval_sig"],
+            settlement["owner_address"])
+    except Exception as e:
+        listing["settlementError"] = f"Settlement failed: {e}"
+        publish_change(
+            "settlement_failed", listing, error=listing["settlementError"])
+        return
+
+    listing["settlementTx"] = tx_hash
+    finish_purchase_settlement(settlement)
+    book.record_settlement(settlement["intent"])
+    publish_change("settled", settlement["intent"], txHash=tx_hash)
+
+
+def hold_purchase(purchase_intent):
+    """
+    Store the purchase intent holding a sale and start its lease.
+
+    The caller holds the lock of the sale.
+
+    Args:
+    - purchase_intent (dict): The purchase intent, its "leaseExpiresAt" is set.
+    """
+    sale_id = purchase_intent["sale_id"]
+    deadline = purchase_reservations.lease(sale_id, time.time())
+    purchase_intent["leaseExpiresAt"] = int(deadline)
+
+    book.index_purchase_intent(purchase_intent)
+    purchase_leases.schedule(sale_id, deadline)
+    publish_change("intent_created", purchase_intent)
+
+
+def release_purchase(sale_id, reason):
+    """
+    Release the purchase intent holding a sale and promote the next buyer.
+
+    The caller holds the lock of the sale. The waiting buyers are dropped if the
+    listing can no longer be bought, and a listing nobody waits for is offered
+    to the collection offers again.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    - reason (str): Why the holder is released, "expired",
+      "settlement_failed", "cancelled", "repriced" or "sold".
+
+    Returns:
+    - dict: The promoted purchase intent, or None.
+    """
+    holder = find_purchase_intents(sale_id)
+    if holder:
+        holder["releasedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        holder["releaseReason"] = reason
+        book.release_purchase_intent(holder)
+        publish_change("intent_released", holder, reason=reason)
+
+    matched = offer_holds.pop(sale_id, None)
+    if matched:
+        # The matched buyer did not complete the match in time
+        matched["releasedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        publish_change("offer_match_released", matched, reason=reason)
+
+    listing = find_listing(sale_id)
+    if not listing or purchase_rejection(listing, current_price(listing)):
+        end_purchase(sale_id)
+        return None
+
+    promoted = purchase_reservations.promote(sale_id)
+    if promoted:
+        hold_purchase(promoted)
+        return promoted
+
+    end_purchase(sale_id)
+    if not is_dutch(listing):
+        match = matching_engine.add_listing(listing)
+        if match:
+            record_offer_match(match)
+    return None
+
+
+def end_purchase(sale_id):
+    """
+    Stop the lease of a sale and drop its waiting buyers.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    """
+    purchase_reservations.end(sale_id)
+    purchase_leases.cancel(sale_id)
+    offer_holds.pop(sale_id, None)
+
+
+def expire_purchase_lease(sale_id):
+    """
+    Release the holder of a sale whose lease ended.
+
+    Called by the lease scheduler at the deadline.
+
+    Args:
+    - sale_id (int): The listing identifier.
+    """
+    with book.sale_lock(sale_id):
+        if not purchase_reservations.is_expired(sale_id, time.time()):
+            # Settled, or a new holder was promoted since the timer fired
+            return
+        release_purchase(sale_id, "expired")
+
+
+def mark_sold(listing):
+    """
+    Mark a settled listing as sold and remove it from the open sales.
+
+    The caller holds the lock of the sale.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+    """
+    listing["purchaseAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    book.close_sale(listing)
+
+
+def finish_purchase_settlement(settlement):
+    """
+    Record the outcome of a purchase intent or bid settlement.
+
+    A settled sale is marked as sold and its waiting buyers are dropped, a
+    failed purchase promotes the next buyer. A failed auction settlement leaves
+    the auction as it is, so it can be settled again.
+
+    Once its transaction is sent, the sale is sold even if the lease of the
+    intent expired during the settlement and another buyer holds it since.
+
+    Args:
+    - settlement (dict): The verified settlement, with an "error" if it failed.
+    """
+    intent = settlement["intent"]
+    sale_id = intent["sale_id"]
+    with book.sale_lock(sale_id):
+        listing = find_listing(sale_id)
+        if "buyerSig" not in intent:
+            if listing and "error" not in settlement:
+                mark_sold(listing)
+            return
+
+        holder = find_purchase_intents(sale_id)
+        if "error" in settlement:
+            if holder is intent:
+                release_purchase(sale_id, "settlement_failed")
+            # Otherwise released while the settlement was checked
+            return
+
+        if listing:
+            mark_sold(listing)
+        if holder is not None and holder is not intent:
+            # The buyer promoted after the lease expired can no longer buy
+            release_purchase(sale_id, "sold")
+        else:
+            end_purchase(sale_id)
+
+
+def listing_change_rejection(action, listing, erc20_amount, change):
+    """
+    Check if an owner can cancel or reprice a listing.
+
+    The caller holds the lock of the sale.
+
+    Args:
+    - action (str): "cancel" or "update".
+    - listing (dict): The listing, as stored in the book.
+    - erc20_amount (float): The new price of an update.
+    - change (NFTListingCancel | NFTListingUpdate): The validated request.
+
+    Returns:
+    - str: Why the change is rejected, or None if it can be applied.
+    """
+    if listing.get("purchaseAt"):
+        return "Listing already sold"
+    if listing.get("cancelledAt"):
+        return "Listing was cancelled"
+    if listing.get("invalidatedAt"):
+        return "Listing is no longer valid"
+    if listing.get("closedAt") and bid_intents.get(listing["sale_id"]):
+        # The winning bidder is owed a settlement
+        return "Auction has ended"
+    if listing["ownerAddress"].lower() != change.ownerAddress.lower():
+        return "Not the listing owner"
+
+    try:
+        recovered_owner_address = Account.recover_message(
+            listing_change_signable_message(action, listing, erc20_amount),
+            signature=change.ownerSig)
+    except (ValueError, BadSignature) as e:
+        return f"Invalid signature: {e}"
+
+    if recovered_owner_address.lower() != listing["ownerAddress"].lower():
+        return "Signature does not match the listing owner."
+    return None
+
+
+# Intake pipelines, cheapest stages first
+purchase_pipeline = IntakePipeline("purchase_order", [
+    ("schema", parse_order),
+    ("rate", check_purchase_rate),
+    ("book", check_purchase_book),
+    ("replay", check_replay),
+    ("signature", check_order_signature),
+    ("buyer_rate", check_purchase_buyer_rate),
+    ("onchain", check_purchase_funds),
+])
+bid_pipeline = IntakePipeline("bid_order", [
+    ("schema", parse_order),
+    ("rate", check_bid_rate),
+    ("book", check_bid_book),
+    ("replay", check_replay),
+    ("signature", check_order_signature),
+    ("buyer_rate", check_bid_buyer_rate),
+    ("onchain", check_bid_funds),
+])
+
+
+def listing_is_open(listing):
+    """
+    Check if a fixed-price listing can still be bought.
+
+    Args:
+    - listing (dict): The listing, as stored in the book.
+
+    Returns:
+    - bool: True if a purchase intent at its price would hold the sale.
+    """
+    return purchase_rejection(listing, listing["erc20_amount"]) is None and \
+        not find_purchase_intents(listing["sale_id"]) and \
+        listing["sale_id"] not in offer_holds
+
+
+def record_offer_match(match):
+    """
+    Store and publish a matched offer and listing, and hold the listing for the
+    offer's buyer.
+
+    The caller holds the lock of the sale. The match holds the sale for a
+    purchase lease: the matched buyer takes it over with a purchase intent,
+    other buyers are queued behind it, and it is released when the lease
+    expires.
+
+    Args:
+    - match (dict): The matched pair, see `MatchingEngine`, its
+      "leaseExpiresAt" is set.
+    """
+    sale_id = match["sale_id"]
+    match["createdAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not find_purchase_intents(sale_id):
+        deadline = purchase_reservations.lease(sale_id, time.time())
+        match["leaseExpiresAt"] = int(deadline)
+        offer_holds[sale_id] = match
+        purchase_leases.schedule(sale_id, deadline)
+
+    offer_matches.append(match)
+    publish_change("offer_matched", match)
+
+
+# Collection offers, matched with fixed-price listings, and the matches holding
+# their listing by sale ID
+matching_engine = MatchingEngine(listing_is_open)
+offer_matches = []
+offer_holds = {}
+
+# Auction state, the owner approval of each auction's best bid
+auction_approvals = {}
+auction_scheduler = AuctionScheduler(close_auction)
+auction_settlements = BackgroundQueue(settle_closed_auction)
+
+# Purchase reservations, the lease of each sale's holder and the buyers waiting
+# behind it. Leases expire through the same timer wheel as auctions.
+purchase_reservations = ReservationQueue()
+purchase_leases = AuctionScheduler(expire_purchase_lease)
+
+
+def requested_fields(request):
+    """
+    Read the fields a query asks for.
+
+    Args:
+    - request (HttpRequest): The query, with optional comma separated "fields".
+
+    Returns:
+    - tuple: The field names, in their order, or None if every field is wanted.
+    """
+    names = [name.strip() for value in request.GET.getlist("fields")
+             for name in value.split(",")]
+    names = tuple(dict.fromkeys(name for name in names if name))
+    return names or None
+
+
+def listings_for_sale(request, now):
+    """
+    Get the listings of a collection still for sale in a price range.
+
+    It expects a "collection", an "erc20Address" and a "minPrice" and/or
+    "maxPrice". Fixed-price and Dutch listings without a purchase intent are
+    read from the collection statistics, Dutch ones priced at the time of the
+    query.
+
+    Args:
+    - request (HttpRequest): The listings query.
+    - now (float): The time to price Dutch listings at.
+
+    Returns:
+    - JsonResponse: The listings with their "currentPrice", cheapest first, with
+      only the requested fields.
+    """
+    collection = request.GET.get("collection")
+    erc20_address = request.GET.get("erc20Address")
+    invalid = JsonResponse(
+        {"error": "Invalid price filter parameters"}, status=400)
+
+    if not collection or not erc20_address:
+        return invalid
+
+    try:
+        low, high = (float(request.GET[name]) if request.GET.get(name) else None
+                     for name in ("minPrice", "maxPrice"))
+    except ValueError:
+        return invalid
+
+    fields = requested_fields(request)
+    return JsonResponse(
+        [project(dict(book.listings_by_id[sale_id], currentPrice=price), fields)
+         for price, sale_id in book.collection_stats.for_sale(
+             collection, erc20_address, low, high, now)],
+        safe=False)
+
+
+def cached_get(view):
+    """
+    Serve the GET responses of a read view from `response_cache`.
+
+    A response is cached per path and query until the book version changes, or
+    for the cache_seconds the view set on it when it holds Dutch prices. A
+    request whose If-None-Match holds the current ETag gets a 304 without the
+    view running. Bodies of COMPRESSION_MIN_BYTES or more are compressed with
+    the coding the request accepts, once per cached response. Other methods go
+    to the view.
+
+    Args:
+    - view (callable): The read view.
+
+    Returns:
+    - callable: The caching view.
+    """
+    @functools.wraps(view)
+    def wrapper(request):
+        if request.method != "GET":
+            return view(request)
+
+        now = time.time()
+        version = book.version
+        key = (request.path, tuple(sorted(
+            (name, tuple(values)) for name, values in request.GET.lists())))
+
+        entry = response_cache.get(key, version, now)
+        if entry is None:
+            response = view(request)
+            if response.status_code != 200 or response.streaming:
+                return response
+            entry = response_cache.put(
+                key, version, response.content, response["Content-Type"], now,
+                getattr(response, "cache_seconds", None))
+
+        coding = negotiate(request.headers.get("Accept-Encoding"),
+                           len(entry.content))
+        # Each coding is its own representation, with its own ETag
+        etag = f'{entry.etag[:-1]}-{coding}"' if coding else entry.etag
+
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            response = HttpResponse(status=304)
+        else:
+            content = entry.content
+            if coding:
+                content = entry.encoded.get(coding)
+                if content is None:
+                    content = entry.encoded[coding] = compress(
+                        entry.content, coding)
+            response = HttpResponse(
+                content, content_type=entry.content_type, status=200)
+            if coding:
+                response["Content-Encoding"] = coding
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+    return wrapper
+
+
+# Serialized responses of the read views, see `cached_get`
+response_cache = ResponseCache()
+
+
 # Create your views here.
 
 
 @csrf_exempt
+@cached_get
 def list_nft(request):
     """
     Handle the listing of NFTs.
@@ -70,7 +1277,8 @@ def list_nft(request):
     to be listed, such as collectionAddress, tokenId, price, and isAuction.
     The NFT details are then added to an in-memory listing.
 
-    If the request method is GET, it returns a JSON response with all the current NFT listings.
+    If the request method is GET, it returns a JSON response with all the current NFT listings,
+    with only the comma separated "fields" if given.
 
     Args:
     - request (HttpRequest): The Django request object.
@@ -82,10 +1290,8 @@ def list_nft(request):
     global sales
 
     if request.method == "POST":
-        data = json.loads(request.body)
-
         try:
-            validated_data = NFTListing(**data)
+            validated_data = NFTListing.model_validate_json(request.body)
             # Extracting details from the received data
             nft_collection_address = validated_data.nft_collection_address
             token_id = validated_data.tokenId
@@ -102,30 +1308,85 @@ def list_nft(request):
                 return JsonResponse(
                     {"error": "Missing required fields"}, status=400)
 
-            # Assuming you have a function `is_token_owner` to check if the NFT owner matches
-            # the given Ethereum address
-            erc721 = ERC721Contract()
+            limited = throttle(request, "list_nft")
+            if limited:
+                return limited
 
-            if not erc721.is_token_owner(owner_address, token_id):
+            try:
+                collection = Web3.to_checksum_address(nft_collection_address)
+            except ValueError:
+                return JsonResponse(
+                    {"error": "Invalid collection address"}, status=400)
+
+            # Checked against the listed collection, from the ownership index
+            # while it is fresh enough for listings
+            erc721 = get_erc721_contract(collection)
+
+            if not erc721.is_token_owner(owner_address, token_id,
+                                         max_lag=LISTING_OWNERSHIP_MAX_LAG):
                 return JsonResponse(
                     {"error": "Not the token owner"}, status=400)
 
+            # Listings are not signed, the address is verified by its ownership
+            limited = throttle_address("list_nft", owner_address)
+            if limited:
+                return limited
+
+            end_time = validated_data.endTime
+            start_time = validated_data.startTime or int(time.time())
+            end_price = validated_data.endPrice
+            decay = validated_data.decay or LINEAR
+            if end_price is not None:
+                if is_auction or end_time is None:
+                    return JsonResponse(
+                        {"error": "Dutch listings need an end time and cannot be auctions"},
+                        status=400)
+                if not 0 < end_price < erc20_amount or decay not in DECAY_CURVES:
+                    return JsonResponse(
+                        {"error": "Dutch listings need an end price under the start price and a known decay"},
+                        status=400)
+            if end_time is not None:
+                if not is_auction and end_price is None:
+                    return JsonResponse(
+                        {"error": "Only auctions can have an end time"}, status=400)
+                if end_time <= max(start_time, time.time()):
+                    return JsonResponse(
+                        {"error": "Auction end time must be after its start and in the future"},
+                        status=400)
+
             sales += 1
 
             # Add to our in-memory listings
-            listings.append(
-                {
-                    "sale_id": sales,
-                    "nft_collection_address": nft_collection_address,
-                    "tokenId": token_id,
-                    "erc20Address": erc20_address,
-                    "erc20_amount": erc20_amount,
-                    "isAuction": is_auction,
-                    "ownerAddress": owner_address,
-                    "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "purchaseAt": ""
-                }
-            )
+            listing = {
+                "sale_id": sales,
+                "nft_collection_address": nft_collection_address,
+                "tokenId": token_id,
+                "erc20Address": erc20_address,
+                "erc20_amount": erc20_amount,
+                "isAuction": is_auction,
+                "ownerAddress": owner_address,
+                "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "purchaseAt": ""
+            }
+            if validated_data.startTime is not None or end_time is not None:
+                # Bids and purchases wait for a future start
+                listing["startTime"] = start_time
+            if end_price is not None:
+                # Priced when read, nothing is scheduled
+                listing.update(endTime=end_time, endPrice=end_price, decay=decay)
+            elif end_time is not None:
+                listing["endTime"] = end_time
+                auction_scheduler.schedule(sales, end_time)
+
+            book.index_listing(listing)
+            publish_change("listing_created", listing)
+
+            if not is_auction and end_price is None:
+                # A Dutch price changes while resting, it is not matched
+                match = matching_engine.add_listing(listing)
+                if match:
+                    with book.sale_lock(match["sale_id"]):
+                        record_offer_match(match)
 
             return JsonResponse(
                 {"message": "Listing added successfully", "sale_id": sales}, status=201)
@@ -134,207 +1395,298 @@ def list_nft(request):
             return JsonResponse({"error": str(e)}, status=400)
 
     elif request.method == "GET":
-        return JsonResponse(listings, safe=False)
+        now = time.time()
+
+        if "minPrice" in request.GET or "maxPrice" in request.GET:
+            response = listings_for_sale(request, now)
+            response.cache_seconds = PRICE_CACHE_SECONDS
+            return response
+
+        # Dutch prices are computed when read. Copied first, listings may be
+        # added while the response is built.
+        listings = list(book.listings_by_id.values())
+        fields = requested_fields(request)
+        response = JsonResponse(
+            [project(dict(listing, currentPrice=current_price(listing, now))
+                     if is_dutch(listing) else listing, fields)
+             for listing in listings],
+            safe=False)
+        if any(is_dutch(listing) for listing in listings):
+            response.cache_seconds = PRICE_CACHE_SECONDS
+        return response
 
     else:
         return HttpResponse(status=405)
 
 
 @csrf_exempt
-def purchase_order(request):
+def cancel_listing(request):
     """
-    Handle the purchase of NFT.
+    Handle the cancellation of a listing by its owner.
+
+    It expects a JSON body with the sale_id, the ownerAddress and the ownerSig
+    over `listing_change_signable_message`. The listing leaves every book
+    index, its purchase intents, queued buyers and bids are dropped,
+    and a tombstone is kept for `removed_listings`.
     """
     if request.method == "POST":
-        data = json.loads(request.body)
-
         try:
-            validated_data = NFTPurchaseIntent(**data)
+            validated_data = NFTListingCancel.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-            nft_collection_address = validated_data.nft_collection_address
-            token_id = validated_data.tokenId
-            erc20_address = validated_data.erc20Address
-            erc20_amount = validated_data.erc20_amount
-            bidder_sig = validated_data.bidderSig
-            buyer_address = validated_data.buyerAddress
-            sale_id = validated_data.sale_id
+        limited = throttle(request, "cancel_listing")
+        if limited:
+            return limited
 
-            # Check if all required details are provided
-            if not all([nft_collection_address,
-                        token_id,
-                        erc20_address,
-                        erc20_amount,
-                        bidder_sig,
-                        buyer_address,
-                        sale_id]):
-                return JsonResponse(
-                    {"error": "Missing required fields"}, status=400)
+        sale_id = validated_data.sale_id
+        listing = find_listing(sale_id)
+        if not listing:
+            return JsonResponse({"error": "Listing not found"}, status=404)
 
-            # Ensure the listing exists
-            listing = find_listing(sale_id)
+        with book.sale_lock(sale_id):
+            error = listing_change_rejection("cancel", listing, 0, validated_data)
+            if error:
+                return JsonResponse({"error": error}, status=400)
+            limited = throttle_address("cancel_listing", validated_data.ownerAddress)
+            if limited:
+                return limited
 
-            if not listing:
-                return JsonResponse({"error": "Listing not found"}, status=404)
+            listing["cancelledAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            listing["version"] = listing.get("version", 0) + 1
+            release_purchase(sale_id, "cancelled")
+            auction_scheduler.cancel(sale_id)
+            auction_approvals.pop(sale_id, None)
+            bid_intents.pop(sale_id, None)
 
-            if listing["isAuction"]:
-                # Ensure the listing is an auction
-                return JsonResponse(
-                    {"error": "Listing is not a traditional purchase"}, status=400)
+            tombstone = book.remove_listing(listing, "cancelled")
+            publish_change("listing_cancelled", listing)
 
-            # should not be able to add a new purchase if already exist an
-            # intent with the sale_id
-            for intent in purchase_intents:
-                if intent["sale_id"] == sale_id:
-                    return JsonResponse(
-                        {"error": "Purchase intent already exist"}, status=400)
+        return JsonResponse(
+            {"message": "Listing cancelled", "tombstone": tombstone}, status=200)
 
-            # The purchase intent amount must be equal to the listing price
-            if listing["erc20_amount"] != erc20_amount:
-                return JsonResponse(
-                    {"error":
-                     "Purchase intent amount must be equal to the listing price"
-                     },
-                    status=400
-                )
+    return HttpResponse(status=405)
 
-            # Create a web3 instance
-            w3_instance = Web3(Web3.HTTPProvider(config("PROVIDER_URL")))
 
-            # Recreate the message hash
-            message = w3_instance.solidity_keccak(
-                ['address', 'address', 'uint256', 'uint256'],
-                [nft_collection_address, erc20_address, token_id, int(
-                    erc20_amount)]
-            )
+@csrf_exempt
+def update_listing(request):
+    """
+    Handle a new price for a fixed-price listing, set by its owner.
 
-            # Encode the message and recover the buyer signature
-            signable_message = encode_defunct(hexstr=message.hex())
-            recovered_bidder_address = w3_instance.eth.account.recover_message(
-                signable_message,
-                signature=bidder_sig
-            )
+    It expects a JSON body with the sale_id, the new erc20_amount, the
+    ownerAddress and the ownerSig over `listing_change_signable_message`. The
+    purchase intents signed for the previous price are released, and the
+    listing is matched with the collection offers at its new price.
+    """
+    if request.method == "POST":
+        try:
+            validated_data = NFTListingUpdate.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-            # Ensure recovered address matches provided buyer address
-            if recovered_bidder_address != buyer_address:
-                return JsonResponse(
-                    {"error": "Signature does not match the provided buyer address."}, status=400)
-
-            # Construct purchase data
-            purchase_intent = {
-                "sale_id": sale_id,
-                "nft_collection_address": listing["nft_collection_address"],
-                "tokenId": listing["tokenId"],
-                "erc20Address": listing["erc20Address"],
-                "erc20_amount": erc20_amount,
-                "buyerSig": bidder_sig,
-                "buyerAddress": buyer_address,
-                "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+        limited = throttle(request, "update_listing")
+        if limited:
+            return limited
 
-            purchase_intents.append(purchase_intent)
+        sale_id = validated_data.sale_id
+        erc20_amount = validated_data.erc20_amount
+        listing = find_listing(sale_id)
+        if not listing:
+            return JsonResponse({"error": "Listing not found"}, status=404)
 
-            return JsonResponse({"message": "Purchase initiated"}, status=200)
-        except ValidationError as e:
-            return JsonResponse({"error": str(e)}, status=400)
+        if listing["isAuction"] or is_dutch(listing):
+            return JsonResponse(
+                {"error": "Only fixed-price listings can be repriced"}, status=400)
+        if erc20_amount <= 0:
+            return JsonResponse({"error": "Price must be positive"}, status=400)
+        if not math.isfinite(erc20_amount) or erc20_amount != int(erc20_amount):
+            # The owner signs the price as a uint256, a fraction would be dropped
+            return JsonResponse(
+                {"error": "Price must be a whole number of ERC20 base units"},
+                status=400)
 
-    else:
-        return HttpResponse(status=405)
+        with book.sale_lock(sale_id):
+            error = listing_change_rejection(
+                "update", listing, erc20_amount, validated_data)
+            if error:
+                return JsonResponse({"error": error}, status=400)
+            limited = throttle_address("update_listing", validated_data.ownerAddress)
+            if limited:
+                return limited
 
+            previous_price = listing["erc20_amount"]
+            listing["version"] = listing.get("version", 0) + 1
+            listing["updatedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            book.reprice_listing(listing, erc20_amount)
 
-def bid_order(request):
-    """
-    Handle the bidding of NFT.
+            # Queued buyers signed the previous price, none of them is promoted
+            purchase_reservations.end(sale_id)
+            release_purchase(sale_id, "repriced")
+            publish_change(
+                "listing_updated", listing, previousPrice=previous_price)
+
+        return JsonResponse({"message": "Listing updated"}, status=200)
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def removed_listings(request):
     """
-    if request.method == "POST":
-        data = json.loads(request.body)
+    Handle the query for the listings removed from the book.
 
+    It returns the tombstones of the listings removed after the optional "since"
+    Unix time, oldest first, so a client keeping a copy of the listings can drop
+    them. Tombstones are kept for TOMBSTONE_RETENTION seconds, a client whose
+    "since" is before "prunedBefore" reads the listings again instead.
+    """
+    if request.method == "GET":
         try:
-            validated_data = NFTPurchaseIntent(**data)
+            since = float(request.GET.get("since", 0))
+        except ValueError:
+            return JsonResponse({"error": "Invalid since parameter"}, status=400)
 
-            nft_collection_address = validated_data.nft_collection_address
-            token_id = validated_data.tokenId
-            erc20_address = validated_data.erc20Address
-            erc20_amount = validated_data.erc20_amount
-            bidder_sig = validated_data.bidderSig
-            buyer_address = validated_data.buyerAddress
-            sale_id = validated_data.sale_id
+        return JsonResponse({"removed": book.removed_since(since),
+                             "prunedBefore": book.tombstones_pruned_before},
+                            status=200)
 
-            # Check if all required details are provided
-            if not all([nft_collection_address,
-                        token_id,
-                        erc20_address,
-                        erc20_amount,
-                        bidder_sig,
-                        buyer_address,
-                        sale_id]):
-                return JsonResponse(
-                    {"error": "Missing required fields"}, status=400)
+    return HttpResponse(status=405)
 
-            # Ensure the listing exists
-            listing = find_listing(sale_id)
 
-            if not listing:
-                # Ensure the listing exists
-                return JsonResponse({"error": "Listing not found"}, status=404)
+@csrf_exempt
+def purchase_order(request):
+    """
+    Handle the purchase of NFT.
 
-            if listing["purchaseAt"]:
-                # Ensure the auction was not settled
+    The request goes through `purchase_pipeline`, cheapest checks first, and the
+    purchase intent is stored once every stage passed. The first buyer holds the
+    sale for PURCHASE_LEASE_SECONDS, later buyers are queued behind it and
+    promoted in order when the lease expires or the settlement fails.
+    """
+    if request.method == "POST":
+        context = {"body": request.body, "ip": client_ip(request)}
+        rejection = purchase_pipeline.run(context)
+        if rejection:
+            if "retryAfter" in context:
+                return too_many_requests(context["retryAfter"])
+            error, status = rejection
+            return JsonResponse({"error": error}, status=status)
+
+        order = context["order"]
+        listing = context["listing"]
+
+        # Construct purchase data
+        purchase_intent = {
+            "sale_id": order.sale_id,
+            "nft_collection_address": listing["nft_collection_address"],
+            "tokenId": listing["tokenId"],
+            "erc20Address": listing["erc20Address"],
+            "erc20_amount": order.erc20_amount,
+            "buyerSig": order.bidderSig,
+            "buyerAddress": order.buyerAddress,
+            "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        with book.sale_lock(order.sale_id):
+            # The listing may have been sold or invalidated during the signature
+            # recovery
+            error = purchase_rejection(listing, order.erc20_amount)
+            if error:
+                return JsonResponse({"error": error}, status=400)
+
+            holder = find_purchase_intents(order.sale_id)
+            matched = offer_holds.get(order.sale_id)
+            if matched and matched["buyerAddress"].lower() == \
+                    order.buyerAddress.lower():
+                # The matched buyer completes the match, its intent takes the hold
+                del offer_holds[order.sale_id]
+            elif matched:
+                holder = matched
+            if not holder:
+                hold_purchase(purchase_intent)
+                return JsonResponse({
+                    "message": "Purchase initiated",
+                    "leaseExpiresAt": purchase_intent["leaseExpiresAt"],
+                }, status=200)
+
+            if holder["buyerAddress"].lower() == order.buyerAddress.lower() or \
+                    purchase_reservations.is_waiting(
+                        order.sale_id, order.buyerAddress):
                 return JsonResponse(
-                    {"error": "Auction already settled"}, status=400)
+                    {"error": "Buyer already has a purchase intent for this sale"},
+                    status=400)
 
-            if not listing["isAuction"]:
-                # Ensure the listing is an auction
+            position = purchase_reservations.enqueue(purchase_intent)
+            if position is None:
                 return JsonResponse(
-                    {"error": "Listing is not for auction."}, status=400)
+                    {"error": "Purchase queue is full"}, status=400)
 
-            # Check if the auction has already started
-            latest_bid = bid_intents[sale_id][- 1] if sale_id in bid_intents else None
+            # Queued signatures count as used, so they cannot be replayed
+            book.used_signatures.add(book.signature_key(order.bidderSig))
+            publish_change(
+                "intent_queued", purchase_intent, position=position)
 
-            if latest_bid and latest_bid["erc20_amount"] >= erc20_amount:
-                # Ensure the bid is higher than the current bid
-                return JsonResponse(
-                    {"error": "Bid must be higher than the current bid"}, status=400
-                )
+        return JsonResponse(
+            {"message": "Purchase queued", "position": position}, status=202)
 
-            # Create a web3 instance
-            w3_instance = Web3(Web3.HTTPProvider(config("PROVIDER_URL")))
+    else:
+        return HttpResponse(status=405)
 
-            # Recreate the message hash
-            message = w3_instance.solidity_keccak(
-                ['address', 'address', 'uint256', 'uint256'],
-                [nft_collection_address, erc20_address, token_id, int(
-                    erc20_amount)]
-            )
 
-            # Encode the message and recover the buyer signature
-            signable_message = encode_defunct(hexstr=message.hex())
-            recovered_bidder_address = w3_instance.eth.account.recover_message(
-                signable_message,
-                signature=bidder_sig
-            )
+def bid_order(request):
+    """
+    Handle the bidding of NFT.
 
-            # Ensure recovered address matches provided buyer address
-            if recovered_bidder_address != buyer_address:
-                return JsonResponse(
-                    {"error": "Signature does not match the provided buyer address."}, status=400)
-
-            # Construct auction data
-            bid_intent = {
-                "sale_id": listing["sale_id"],
-                "nft_collection_address": listing["nft_collection_address"],
-                "erc20Address": listing["erc20Address"],
-                "tokenId": listing["tokenId"],
-                "erc20_amount": erc20_amount,
-                "bidderSig": bidder_sig,
-                "bidderAddress": buyer_address,
-                "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+    The request goes through `bid_pipeline`, cheapest checks first, and the bid
+    is stored once every stage passed.
+    """
+    if request.method == "POST":
+        context = {"body": request.body, "ip": client_ip(request)}
+        rejection = bid_pipeline.run(context)
+        if rejection:
+            if "retryAfter" in context:
+                return too_many_requests(context["retryAfter"])
+            error, status = rejection
+            return JsonResponse({"error": error}, status=status)
+
+        order = context["order"]
+        listing = context["listing"]
+        sale_id = order.sale_id
+
+        # Construct auction data
+        bid_intent = {
+            "sale_id": listing["sale_id"],
+            "nft_collection_address": listing["nft_collection_address"],
+            "erc20Address": listing["erc20Address"],
+            "tokenId": listing["tokenId"],
+            "erc20_amount": order.erc20_amount,
+            "bidderSig": order.bidderSig,
+            "bidderAddress": order.buyerAddress,
+            "createdAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        with book.sale_lock(sale_id):
+            # Another bid or the close may have landed during the signature
+            # recovery
+            error = bid_rejection(listing, order.erc20_amount)
+            if error:
+                return JsonResponse({"error": error}, status=400)
 
             bid_intents.setdefault(sale_id, []).append(bid_intent)
+            book.index_bid(bid_intent)
 
-            return JsonResponse({"message": "Bid placed"}, status=200)
-        except ValidationError as e:
-            return JsonResponse({"error": str(e)}, status=400)
+            now = time.time()
+            if listing.get("endTime") and \
+                    listing["endTime"] - now < AUCTION_EXTENSION_WINDOW:
+                # Anti-sniping, a late bid pushes the end so others can answer
+                listing["endTime"] = max(
+                    listing["endTime"], int(now) + AUCTION_EXTENSION_SECONDS)
+                auction_scheduler.schedule(sale_id, listing["endTime"])
+
+            publish_change(
+                "bid_placed", bid_intent, endTime=listing.get("endTime"))
+
+        return JsonResponse({"message": "Bid placed"}, status=200)
 
     else:
         return HttpResponse(status=405)
@@ -346,10 +1698,8 @@ def settle_purchase_order(request):
     Handle the settlement of NFT.
     """
     if request.method == "POST":
-        data = json.loads(request.body)
-
         try:
-            validated_data = NFTSettle(**data)
+            validated_data = NFTSettle.model_validate_json(request.body)
 
             sale_id = validated_data.sale_id
             owner_approval_sig = validated_data.owner_approval_sig
@@ -362,6 +1712,10 @@ def settle_purchase_order(request):
                 return JsonResponse(
                     {"error": "Missing required fields"}, status=400)
 
+            limited = throttle(request, "settle_purchase_order")
+            if limited:
+                return limited
+
             purchase_intent = find_purchase_intents(sale_id)
 
             if not purchase_intent:
@@ -369,6 +1723,10 @@ def settle_purchase_order(request):
                 return JsonResponse(
                     {"error": "No purchase intent for this token id"}, status=404)
 
+            rejection = settlement_rejection(sale_id)
+            if rejection:
+                return JsonResponse({"error": rejection}, status=400)
+
             # Create a web3 instance
             w3_instance = Web3(Web3.HTTPProvider(config("PROVIDER_URL")))
 
@@ -415,15 +1773,35 @@ def settle_purchase_order(request):
                 return JsonResponse(
                     {"error": "Signature does not match the provided owner address."}, status=404)
 
-            marketplace_contract = MarketplaceContract()
-            tx_hash = marketplace_contract.send_transaction(
-                purchase_intent["nft_collection_address"],
-                purchase_intent["tokenId"],
-                purchase_intent["erc20Address"],
-                purchase_intent["erc20_amount"],
-                purchase_intent["buyerSig"],
-                owner_approval_sig,
-                owner_address)
+            limited = throttle_address("settle_purchase_order", owner_address)
+            if limited:
+                return limited
+
+            settlement = {
+                "intent": purchase_intent,
+                "bidderSig": purchase_intent["buyerSig"],
+                "owner_approval_sig": owner_approval_sig,
+                "owner_address": owner_address,
+            }
+            preflight_settlements([settlement])
+            if "error" in settlement:
+                finish_purchase_settlement(settlement)
+                return JsonResponse({"error": settlement["error"]}, status=400)
+
+            try:
+                tx_hash = submit_settlement(
+                    purchase_intent,
+                    purchase_intent["buyerSig"],
+                    owner_approval_sig,
+                    owner_address)
+            except Exception as e:  # pylint: disable=broad-except
+                settlement["error"] = str(e)
+                finish_purchase_settlement(settlement)
+                return JsonResponse({"error": str(e)}, status=400)
+
+            finish_purchase_settlement(settlement)
+            book.record_settlement(purchase_intent)
+            publish_change("settled", purchase_intent, txHash=tx_hash)
 
             return JsonResponse({
                 "message": "Transaction successful created.",
@@ -440,10 +1818,8 @@ def settle_auction_order(request):
     Handle the settlement of NFT auction.
     """
     if request.method == "POST":
-        data = json.loads(request.body)
-
         try:
-            validated_data = NFTSettle(**data)
+            validated_data = NFTSettle.model_validate_json(request.body)
 
             sale_id = validated_data.sale_id
             owner_approval_sig = validated_data.owner_approval_sig
@@ -453,14 +1829,21 @@ def settle_auction_order(request):
                 return JsonResponse(
                     {"error": "Missing required fields"}, status=400)
 
+            limited = throttle(request, "settle_auction_order")
+            if limited:
+                return limited
+
             # Extract the latest bid for the given sale_id
-            print("bid_intents: ", bid_intents)
             bids_for_sale = bid_intents.get(sale_id)
-            print("BID_FOR_SALE: ", bids_for_sale)
+            logger.debug("Bids for sale %s: %s", sale_id, bids_for_sale)
             if not bids_for_sale:
                 return JsonResponse(
                     {"error": "No bids for this sale id"}, status=404)
 
+            rejection = settlement_rejection(sale_id)
+            if rejection:
+                return JsonResponse({"error": rejection}, status=400)
+
             latest_bid = bids_for_sale[-1]
 
             w3_instance = Web3(Web3.HTTPProvider(config("PROVIDER_URL")))
@@ -502,15 +1885,28 @@ def settle_auction_order(request):
                 return JsonResponse(
                     {"error": "Signature does not match the provided owner address."}, status=404)
 
-            marketplace_contract = MarketplaceContract()
-            tx_hash = marketplace_contract.send_transaction(
-                latest_bid["nft_collection_address"],
-                latest_bid["tokenId"],
-                latest_bid["erc20Address"],
-                latest_bid["erc20_amount"],
+            limited = throttle_address("settle_auction_order", owner_address)
+            if limited:
+                return limited
+
+            settlement = {
+                "intent": latest_bid,
+                "bidderSig": latest_bid["bidderSig"],
+                "owner_approval_sig": owner_approval_sig,
+                "owner_address": owner_address,
+            }
+            preflight_settlements([settlement])
+            if "error" in settlement:
+                return JsonResponse({"error": settlement["error"]}, status=400)
+
+            tx_hash = submit_settlement(
+                latest_bid,
                 latest_bid["bidderSig"],
                 owner_approval_sig,
                 owner_address)
+            finish_purchase_settlement(settlement)
+            book.record_settlement(latest_bid)
+            publish_change("settled", latest_bid, txHash=tx_hash)
 
             return JsonResponse({
                 "message": "Transaction successfully created.",
@@ -520,3 +1916,668 @@ def settle_auction_order(request):
             )
         except ValidationError as e:
             return JsonResponse({"error": str(e)}, status=400)
+
+
+@csrf_exempt
+def settle_batch(request):
+    """
+    Handle the settlement of many sales at once.
+
+    It expects a JSON body with a "settlements" list of sale_id, owner_approval_sig
+    and owner_address entries. Signatures are verified in parallel, then all
+    transactions are built with one contract instance, one gas price and locally
+    counted nonces. Every entry gets its own result, so one bad entry does not fail
+    the batch.
+    """
+    if request.method == "POST":
+        try:
+            validated_data = NFTSettleBatch.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        settlements = validated_data.settlements
+        if not settlements:
+            return JsonResponse(
+                {"error": "Missing required fields"}, status=400)
+
+        # Owners of a batch may differ, only its sender is limited
+        limited = throttle(request, "settle_batch")
+        if limited:
+            return limited
+
+        if len(settlements) > SETTLE_BATCH_MAX_SIZE:
+            return JsonResponse(
+                {"error": f"At most {SETTLE_BATCH_MAX_SIZE} settlements per batch"},
+                status=400)
+
+        with ThreadPoolExecutor(max_workers=SETTLE_BATCH_WORKERS) as executor:
+            verified = list(executor.map(verify_settlement, settlements))
+
+        checked = [item for item in verified if "error" not in item]
+        preflight_settlements(checked)
+        for item in checked:
+            if "error" in item:
+                finish_purchase_settlement(item)
+
+        results = []
+        marketplace_contract = None
+        nonces = {}
+        gas_price = None
+
+        for item in verified:
+            if "error" in item:
+                results.append({"sale_id": item["sale_id"], "error": item["error"]})
+                continue
+
+            if marketplace_contract is None:
+                marketplace_contract = MarketplaceContract()
+                gas_price = marketplace_contract.w3.to_wei('20', 'gwei')
+
+            try:
+                tx_hash = submit_settlement(
+                    item["intent"],
+                    item["bidderSig"],
+                    item["owner_approval_sig"],
+                    item["owner_address"],
+                    marketplace_contract,
+                    nonces,
+                    gas_price)
+            except Exception as e:  # pylint: disable=broad-except
+                item["error"] = str(e)
+                finish_purchase_settlement(item)
+                results.append({"sale_id": item["sale_id"], "error": str(e)})
+                continue
+
+            finish_purchase_settlement(item)
+            results.append({"sale_id": item["sale_id"], "txHash": tx_hash})
+            book.record_settlement(item["intent"])
+            publish_change("settled", item["intent"], txHash=tx_hash)
+
+        return JsonResponse({"results": results}, status=200)
+
+    return HttpResponse(status=405)
+
+
+def is_listener_request(request):
+    """
+    Check that a request comes from the ERC721 listener.
+
+    Args:
+    - request (HttpRequest): The Django request object.
+
+    Returns:
+    - bool: True if its X-Listener-Token header matches LISTENER_TOKEN.
+    """
+    token = request.headers.get("X-Listener-Token", "")
+    return bool(LISTENER_TOKEN) and hmac.compare_digest(token, LISTENER_TOKEN)
+
+
+@csrf_exempt
+def transfer_events(request):
+    """
+    Handle the Transfer events pushed by the ERC721 listener.
+
+    It expects a JSON body with the decoded "transfers" seen on chain and the
+    "reverted" transfers orphaned by a reorg, and an X-Listener-Token header
+    matching LISTENER_TOKEN. Open listings of a transferred token are invalidated
+    through the token index, without scanning the book, and reverted transfers
+    reopen the listings they invalidated.
+    """
+    if request.method == "POST":
+        if not is_listener_request(request):
+            return JsonResponse({"error": "Invalid listener token"}, status=403)
+
+        try:
+            validated_data = NFTTransferEvents.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        reopened = []
+        for transfer in validated_data.reverted:
+            reopened += book.revert_transfer(transfer.model_dump(by_alias=True))
+
+        invalidated = []
+        for transfer in validated_data.transfers:
+            invalidated += book.invalidate_transfer(
+                transfer.model_dump(by_alias=True))
+
+        for sale_id in reopened:
+            publish_change("reopened", book.listings_by_id[sale_id])
+        for sale_id in invalidated:
+            publish_change("invalidated", book.listings_by_id[sale_id])
+
+        return JsonResponse(
+            {"invalidated": invalidated, "reopened": reopened}, status=200)
+
+    return HttpResponse(status=405)
+
+
+@csrf_exempt
+def erc20_events(request):
+    """
+    Handle the ERC20 Transfer and Approval events pushed by the listener.
+
+    It expects a JSON body with the decoded "events" seen on chain and the
+    "reverted" events orphaned by a reorg, and the same X-Listener-Token header
+    as `transfer_events`. The cached buyer funds they touch are updated.
+    """
+    if request.method == "POST":
+        if not is_listener_request(request):
+            return JsonResponse({"error": "Invalid listener token"}, status=403)
+
+        try:
+            validated_data = ERC20Events.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        funds_cache.revert([event.model_dump(by_alias=True)
+                            for event in validated_data.reverted])
+        funds_cache.apply([event.model_dump(by_alias=True)
+                           for event in validated_data.events])
+
+        return JsonResponse({"message": "Events applied"}, status=200)
+
+    return HttpResponse(status=405)
+
+
+def watched_collections(request):
+    """
+    Handle the listener's query for the collections it must watch.
+
+    It returns the collections that have open listings, read from the collection
+    index, and the ERC20 tokens of the buyer funds cached by `funds_cache`, and
+    expects the same X-Listener-Token header as `transfer_events`.
+    """
+    if request.method == "GET":
+        if not is_listener_request(request):
+            return JsonResponse({"error": "Invalid listener token"}, status=403)
+
+        return JsonResponse({
+            "collections": book.open_collections(),
+            "erc20Tokens": funds_cache.tokens(),
+        }, status=200)
+
+    return HttpResponse(status=405)
+
+
+def ownership_status(request):
+    """
+    Handle the query for the ownership indexer's progress.
+
+    It returns the last indexed block, the last head seen by the indexer and the
+    lag between them, so clients can tell if listing validation is answered
+    locally or by the chain.
+    """
+    if request.method == "GET":
+        index = get_ownership_index()
+        if index is None:
+            return JsonResponse(
+                {"error": "Ownership index is not configured"}, status=404)
+
+        return JsonResponse(index.status(), status=200)
+
+    return HttpResponse(status=405)
+
+
+def sse_message(event):
+    """
+    Format a feed event as a Server-Sent Events message.
+
+    Args:
+    - event (dict): The feed event.
+
+    Returns:
+    - str: The message, with the sequence number as its id.
+    """
+    return (f"id: {event['seq']}\nevent: {event['type']}\n"
+            f"data: {dumps(event).decode()}\n\n")
+
+
+def order_book_events(request):
+    """
+    Stream the order-book changes as Server-Sent Events.
+
+    Clients pick their topics with "collection" and "sale_id" query parameters,
+    which can be repeated, and get every change without them. To resume, they
+    send the last sequence number they saw as "since" or as the Last-Event-ID
+    header that browsers send on reconnect. A "reset" event tells the client the
+    changes since then are gone and the book must be reloaded, an "overflow"
+    event that it fell too far behind and must reconnect.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+
+    try:
+        topics = [collection_topic(collection)
+                  for collection in request.GET.getlist("collection")]
+        topics += [sale_topic(sale_id)
+                   for sale_id in request.GET.getlist("sale_id")]
+        since = request.GET.get("since") or request.headers.get("Last-Event-ID")
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid feed parameters"}, status=400)
+
+    subscription = order_book_feed.subscribe(topics or [ALL_TOPIC], since)
+
+    def stream():
+        try:
+            if subscription.reset:
+                yield "event: reset\ndata: {}\n\n"
+            while not subscription.overflowed:
+                events = subscription.get(FEED_HEARTBEAT)
+                if not events:
+                    yield ": keep-alive\n\n"
+                for event in events:
+                    yield sse_message(event)
+            yield "event: overflow\ndata: {}\n\n"
+        finally:
+            order_book_feed.unsubscribe(subscription)
+
+    async def astream():
+        # Served by the ASGI app, the clients wait on the event loop instead of
+        # holding a thread each
+        try:
+            if subscription.reset:
+                yield "event: reset\ndata: {}\n\n"
+            while not subscription.overflowed:
+                events = await subscription.aget(FEED_HEARTBEAT)
+                if not events:
+                    yield ": keep-alive\n\n"
+                for event in events:
+                    yield sse_message(event)
+            yield "event: overflow\ndata: {}\n\n"
+        finally:
+            order_book_feed.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(
+        astream() if isinstance(request, ASGIRequest) else stream(),
+        content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+def auction_approval(request):
+    """
+    Handle the owner's approval of the best bid of a timed auction.
+
+    It expects the same JSON body as `settle_auction_order`. The approval is
+    verified against the current best bid and kept until the auction closes, then
+    the settlement is queued. Approving an auction that already closed queues the
+    settlement right away. A higher bid needs a new approval.
+    """
+    if request.method == "POST":
+        try:
+            validated_data = NFTSettle.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        listing = find_listing(validated_data.sale_id)
+        if not listing or not listing.get("endTime"):
+            return JsonResponse({"error": "Timed auction not found"}, status=404)
+
+        if listing["purchaseAt"]:
+            return JsonResponse({"error": "Auction already settled"}, status=400)
+
+        # Approvals are stored until the auction ends
+        settlement = verify_settlement(validated_data, require_end=False)
+        if "error" in settlement:
+            return JsonResponse({"error": settlement["error"]}, status=400)
+
+        auction_approvals[validated_data.sale_id] = {
+            "bidderSig": settlement["bidderSig"],
+            "settle": validated_data,
+        }
+
+        if listing.get("closedAt"):
+            auction_settlements.put(validated_data.sale_id)
+            return JsonResponse({"message": "Settlement queued"}, status=200)
+
+        return JsonResponse(
+            {"message": "Approval stored until the auction ends"}, status=200)
+
+    return HttpResponse(status=405)
+
+
+def intake_metrics(request):
+    """
+    Handle the query for the intake pipeline metrics.
+
+    It returns, per pipeline and stage in run order, the accepted and rejected
+    requests, the rejections by reason and the time spent in the stage.
+    """
+    if request.method == "GET":
+        return JsonResponse({
+            pipeline.name: pipeline.snapshot()
+            for pipeline in (purchase_pipeline, bid_pipeline)}, status=200)
+
+    return HttpResponse(status=405)
+
+
+def bid_query_params(request, *names):
+    """
+    Read the sale ID and integer parameters of a bid query.
+
+    Args:
+    - request (HttpRequest): The bid query.
+    - names (str): The integer parameters to read besides sale_id.
+
+    Returns:
+    - tuple: The error response, or None, the listing and the values of the
+      parameters, capped at BID_MAX_PAGE_SIZE. On errors, the listing and values
+      are None.
+    """
+    missing = [None] * len(names)
+
+    try:
+        sale_id = int(request.GET["sale_id"])
+        values = [min(max(int(request.GET.get(name, default)), 0),
+                      BID_MAX_PAGE_SIZE)
+                  for name, default in names]
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {"error": "Invalid bid query parameters"}, status=400), None, missing
+
+    listing = find_listing(sale_id)
+    if not listing or not listing["isAuction"]:
+        return JsonResponse(
+            {"error": "Auction not found"}, status=404), None, missing
+
+    return None, listing, values
+
+
+@cached_get
+def top_bids(request):
+    """
+    Handle the query for the best bids of an auction.
+
+    It expects a "sale_id" and returns up to "n" bids, BID_PAGE_SIZE by default,
+    highest first. The body is cached until the auction accepts another bid,
+    unless only some "fields" are asked for.
+    """
+    if request.method == "GET":
+        error, listing, (n,) = bid_query_params(request, ("n", BID_PAGE_SIZE))
+        if error:
+            return error
+
+        fields = requested_fields(request)
+        if fields:
+            return JsonResponse({
+                "bids": [project(public_bid(bid), fields) for bid in
+                         book.bid_ladder(listing["sale_id"]).top(n)],
+            }, status=200)
+
+        return HttpResponse(book.bid_ladder(listing["sale_id"]).top_json(n),
+                            content_type="application/json", status=200)
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def bid_history(request):
+    """
+    Handle the query for the bid history of an auction.
+
+    It expects a "sale_id" and returns "limit" bids, BID_PAGE_SIZE by default,
+    newest first, after skipping the "offset" newest ones. The response holds the
+    offset of the next page, or null on the last one. Each bid has only the
+    "fields" asked for, if any.
+    """
+    if request.method == "GET":
+        error, listing, (offset, limit) = bid_query_params(
+            request, ("offset", 0), ("limit", BID_PAGE_SIZE))
+        if error:
+            return error
+
+        ladder = book.bid_ladder(listing["sale_id"])
+        bids = ladder.page(offset, limit)
+        next_offset = offset + len(bids)
+
+        fields = requested_fields(request)
+        return JsonResponse({
+            "bids": [project(public_bid(bid), fields) for bid in bids],
+            "total": len(ladder),
+            "nextOffset": next_offset if next_offset < len(ladder) else None,
+        }, status=200)
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def bidder_bids(request):
+    """
+    Handle the query for the bids of one bidder on an auction.
+
+    It expects a "sale_id" and the bidder "address", and returns the bidder's
+    bids oldest first, with only the "fields" asked for, if any.
+    """
+    if request.method == "GET":
+        error, listing, _ = bid_query_params(request)
+        if error:
+            return error
+
+        address = request.GET.get("address")
+        if not address:
+            return JsonResponse(
+                {"error": "Invalid bid query parameters"}, status=400)
+
+        fields = requested_fields(request)
+        return JsonResponse({
+            "bids": [project(public_bid(bid), fields) for bid in
+                     book.bid_ladder(listing["sale_id"]).bids_of(address)],
+        }, status=200)
+
+    return HttpResponse(status=405)
+
+
+@csrf_exempt
+@cached_get
+def collection_offers(request):
+    """
+    Handle collection-wide offers.
+
+    If the request method is POST, it expects a JSON body with the collection, the
+    ERC20, the highest amount and the buyer address, signed by the buyer. The offer
+    is matched with the cheapest open fixed-price listing of the collection at or
+    under its amount, or rests until a listing matches it. A match is bought at
+    the listing's price through the purchase path, with a purchase intent for its
+    sale_id.
+
+    If the request method is GET, it returns the resting offers of a "collection",
+    optionally in one "erc20Address", highest first, with only the "fields"
+    asked for, if any.
+    """
+    if request.method == "POST":
+        try:
+            validated_data = NFTCollectionOffer.model_validate_json(request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        offer = validated_data.model_dump()
+        if offer["erc20_amount"] <= 0:
+            return JsonResponse(
+                {"error": "Offer amount must be positive"}, status=400)
+
+        limited = throttle(request, "collection_offers")
+        if limited:
+            return limited
+
+        try:
+            recovered_buyer_address = Account.recover_message(
+                offer_signable_message(offer), signature=offer["buyerSig"])
+        except (ValueError, BadSignature) as e:
+            return JsonResponse({"error": f"Invalid signature: {e}"}, status=400)
+
+        if recovered_buyer_address != offer["buyerAddress"]:
+            return JsonResponse(
+                {"error": "Signature does not match the provided buyer address."},
+                status=400)
+
+        limited = throttle_address("collection_offers", offer["buyerAddress"])
+        if limited:
+            return limited
+
+        # The signed message has no nonce, a signature places one offer
+        if not book.use_signature(offer["buyerSig"]):
+            return JsonResponse({"error": "Signature already used"}, status=400)
+
+        offer["createdAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        match = matching_engine.add_offer(offer)
+        publish_change("offer_created", offer)
+        if match:
+            with book.sale_lock(match["sale_id"]):
+                record_offer_match(match)
+
+        return JsonResponse(
+            {"message": "Offer matched" if match else "Offer placed",
+             "offerId": offer["offerId"], "match": match}, status=201)
+
+    elif request.method == "GET":
+        collection = request.GET.get("collection")
+        if not collection:
+            return JsonResponse({"error": "Missing collection"}, status=400)
+
+        offers = matching_engine.resting_offers(
+            collection, request.GET.get("erc20Address"))
+        fields = requested_fields(request)
+        return JsonResponse(
+            {"offers": [project({key: value for key, value in offer.items()
+                                 if key != "buyerSig"}, fields)
+                        for offer in offers]}, status=200)
+
+    return HttpResponse(status=405)
+
+
+@csrf_exempt
+def cancel_collection_offer(request):
+    """
+    Handle the cancellation of a resting collection offer by its buyer.
+
+    It expects a JSON body with the offerId, the buyerAddress and the buyerSig
+    over `offer_cancel_signable_message`. Matched offers no longer rest and
+    cannot be cancelled.
+    """
+    if request.method == "POST":
+        try:
+            validated_data = NFTCollectionOfferCancel.model_validate_json(
+                request.body)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        limited = throttle(request, "cancel_offer")
+        if limited:
+            return limited
+
+        offer = matching_engine.offers.get(validated_data.offerId)
+        if not offer:
+            return JsonResponse({"error": "Offer not found"}, status=404)
+
+        try:
+            recovered_buyer_address = Account.recover_message(
+                offer_cancel_signable_message(validated_data.offerId),
+                signature=validated_data.buyerSig)
+        except (ValueError, BadSignature) as e:
+            return JsonResponse({"error": f"Invalid signature: {e}"}, status=400)
+
+        if recovered_buyer_address.lower() != offer["buyerAddress"].lower():
+            return JsonResponse(
+                {"error": "Signature does not match the offer buyer."}, status=400)
+
+        limited = throttle_address("cancel_offer", validated_data.buyerAddress)
+        if limited:
+            return limited
+
+        if not matching_engine.cancel_offer(validated_data.offerId):
+            # Matched since it was read
+            return JsonResponse({"error": "Offer not found"}, status=404)
+
+        offer["cancelledAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        publish_change("offer_cancelled", offer)
+        return JsonResponse({"message": "Offer cancelled"}, status=200)
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def collection_offer_matches(request):
+    """
+    Handle the query for the matched collection offers.
+
+    It returns the matches, oldest first, optionally only the ones of a "buyer"
+    address. Each match names the sale_id the buyer completes with a purchase
+    intent.
+    """
+    if request.method == "GET":
+        buyer = request.GET.get("buyer")
+        matches = [match for match in offer_matches
+                   if not buyer or match["buyerAddress"].lower() == buyer.lower()]
+        return JsonResponse({"matches": matches}, status=200)
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def collection_stats(request):
+    """
+    Handle the query for the statistics of a collection.
+
+    It expects a "collection" and returns, per ERC20 the collection is listed in,
+    the open listings, the floor price of the fixed-price listings still for sale,
+    the best bid of the auctions still taking bids, and the settled volume and
+    count. They are kept up to date by the book, so nothing is scanned.
+    """
+    if request.method == "GET":
+        collection = request.GET.get("collection")
+        if not collection:
+            return JsonResponse({"error": "Missing collection"}, status=400)
+
+        response = JsonResponse({
+            "collection": collection.lower(),
+            "erc20": book.collection_stats.collection(collection),
+        }, status=200)
+        # The floor may be a Dutch price
+        response.cache_seconds = PRICE_CACHE_SECONDS
+        return response
+
+    return HttpResponse(status=405)
+
+
+@cached_get
+def price_candles(request):
+    """
+    Handle the query for the price history of a collection.
+
+    It expects a "collection", an "erc20Address", an "interval" (1m, 1h or 1d,
+    1h by default), the "kind" of trades (sales or bids, sales by default) and
+    optional "from" and "to" Unix timestamps. The candles are returned as
+    columns, oldest first, without the intervals that had no trades.
+    """
+    if request.method == "GET":
+        collection = request.GET.get("collection")
+        erc20_address = request.GET.get("erc20Address")
+        interval = request.GET.get("interval", "1h")
+        kind = request.GET.get("kind", SALES)
+        invalid = JsonResponse(
+            {"error": "Invalid candle query parameters"}, status=400)
+
+        if not collection or not erc20_address or interval not in INTERVALS \
+                or kind not in (SALES, BIDS):
+            return invalid
+
+        try:
+            start, end = (float(request.GET[name]) if request.GET.get(name)
+                          else None for name in ("from", "to"))
+        except ValueError:
+            return invalid
+        # float() parses nan, inf and overflows such as 1e400 to inf
+        if any(bound is not None and not math.isfinite(bound)
+               for bound in (start, end)):
+            return invalid
+
+        candles = book.price_history.candles(
+            kind, collection, erc20_address, interval, start, end)
+        return JsonResponse(
+            {"interval": interval, "kind": kind, "candles": candles}, status=200)
+
+    return HttpResponse(status=405)
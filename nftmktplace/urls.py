@@ -21,10 +21,32 @@ from marketplace import views
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("list/", views.list_nft, name="list_nft"),
+    path("list/cancel/", views.cancel_listing, name="cancel_listing"),
+    path("list/update/", views.update_listing, name="update_listing"),
+    path("list/removed/", views.removed_listings, name="removed_listings"),
     path("purchaseOrder/", views.purchase_order, name="purchase_order"),
     path("bidOrder/", views.bid_order, name="bid_order"),
     path("settle_purchase_order/", views.settle_purchase_order,
          name="settle_purchase_order"),
     path("settle_auction_order/", views.settle_auction_order,
          name="settle_auction_order"),
+    path("settle_batch/", views.settle_batch, name="settle_batch"),
+    path("bids/", views.bid_history, name="bid_history"),
+    path("bids/top/", views.top_bids, name="top_bids"),
+    path("bids/bidder/", views.bidder_bids, name="bidder_bids"),
+    path("offers/", views.collection_offers, name="collection_offers"),
+    path("offers/cancel/", views.cancel_collection_offer,
+         name="cancel_collection_offer"),
+    path("offers/matches/", views.collection_offer_matches,
+         name="collection_offer_matches"),
+    path("auction_approval/", views.auction_approval, name="auction_approval"),
+    path("events/transfers/", views.transfer_events, name="transfer_events"),
+    path("events/erc20/", views.erc20_events, name="erc20_events"),
+    path("events/collections/", views.watched_collections,
+         name="watched_collections"),
+    path("stats/", views.collection_stats, name="collection_stats"),
+    path("candles/", views.price_candles, name="price_candles"),
+    path("ownership/status/", views.ownership_status, name="ownership_status"),
+    path("feed/", views.order_book_events, name="order_book_events"),
+    path("metrics/intake/", views.intake_metrics, name="intake_metrics"),
 ]